@@ -0,0 +1,649 @@
+"""
+مجموعة قياس أداء دون اتصال بالشبكة لمسار التنزيل والتحويل
+
+الاستخدام:
+    python benchmark.py --output results.json
+    python benchmark.py --quick --compare results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+from yt_dlp.utils import OnDemandPagedList
+from instrumentation import Histogram
+from config import BASE_DIR, TEMP_DIR, SUPPORTED_VIDEO_FORMATS, SUPPORTED_AUDIO_FORMATS
+
+FIXTURES_DIR = TEMP_DIR / "bench_fixtures"
+
+# ملفات الاختبار المولدة: الاسم، الامتداد، الأبعاد، الترميزات، ومعاملات ffmpeg
+FIXTURES = {
+    "video.mp4": {
+        'format_id': "mp4-720", 'ext': "mp4", 'width': 1280, 'height': 720,
+        'vcodec': "avc1", 'acodec': "mp4a",
+        'args': ["-f", "lavfi", "-i", "testsrc2=size=1280x720:rate=30",
+                 "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+                 "-c:v", "libx264", "-preset", "veryfast", "-b:v", "4M",
+                 "-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart"]
+    },
+    "video.webm": {
+        'format_id': "webm-360", 'ext': "webm", 'width': 640, 'height': 360,
+        'vcodec': "vp9", 'acodec': "opus",
+        'args': ["-f", "lavfi", "-i", "testsrc2=size=640x360:rate=30",
+                 "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000",
+                 "-c:v", "libvpx-vp9", "-deadline", "realtime", "-b:v", "1M",
+                 "-c:a", "libopus", "-b:a", "96k"]
+    },
+    "audio.mp3": {
+        'format_id': "mp3", 'ext': "mp3", 'width': None, 'height': None,
+        'vcodec': "none", 'acodec': "mp3",
+        'args': ["-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+                 "-c:a", "libmp3lame", "-b:a", "192k"]
+    },
+}
+
+# فيديو وصوت منفصلان بحاوية MP4 مجزأة (تُقرأ تسلسلياً) لقياس الدمج
+MERGE_FIXTURES = {
+    "video-only.mp4": {
+        'format_id': "dash-video-720", 'ext': "mp4", 'width': 1280, 'height': 720,
+        'vcodec': "avc1", 'acodec': "none",
+        'args': ["-f", "lavfi", "-i", "testsrc2=size=1280x720:rate=30",
+                 "-c:v", "libx264", "-preset", "veryfast", "-b:v", "4M",
+                 "-movflags", "+frag_keyframe+empty_moov+default_base_moof"]
+    },
+    "audio-only.m4a": {
+        'format_id': "dash-audio", 'ext': "m4a", 'width': None, 'height': None,
+        'vcodec': "none", 'acodec': "mp4a",
+        'args': ["-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+                 "-c:a", "aac", "-b:a", "128k",
+                 "-movflags", "+frag_keyframe+empty_moov+default_base_moof"]
+    },
+}
+
+def generate_fixtures(duration):
+    """توليد ملفات الوسائط الاصطناعية مرة واحدة لكل مدة (قابلة لإعادة الإنتاج)"""
+    directory = FIXTURES_DIR / f"{duration}s"
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, spec in {**FIXTURES, **MERGE_FIXTURES}.items():
+        path = directory / name
+        if path.exists():
+            continue
+        subprocess.run(
+            ["ffmpeg", "-nostdin", "-v", "error", "-y", *spec['args'],
+             "-t", str(duration), str(path) + ".part." + spec['ext']],
+            check=True
+        )
+        os.replace(str(path) + ".part." + spec['ext'], path)
+    return directory
+
+# بث HLS اصطناعي: أجزاء ببيانات عشوائية ثابتة (لا يحتاج ffmpeg)، يكفي لقياس التنزيل والترتيب
+HLS_SEGMENTS = 40
+FEED_PAGE_SIZE = 50
+HLS_SEGMENT_SIZE = 256 * 1024
+
+def generate_hls_fixture(segments=HLS_SEGMENTS, segment_size=HLS_SEGMENT_SIZE):
+    """توليد قائمة m3u8 وأجزائها؛ يعيد (المجلد، المحتوى المتوقع بعد إعادة التجميع)"""
+    directory = FIXTURES_DIR / "hls"
+    directory.mkdir(parents=True, exist_ok=True)
+    generator = random.Random(segments)
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:2", "#EXT-X-MEDIA-SEQUENCE:0"]
+    expected = []
+    for i in range(segments):
+        data = generator.randbytes(segment_size)
+        (directory / f"segment-{i:04d}.ts").write_bytes(data)
+        expected.append(data)
+        lines += ["#EXTINF:2.0,", f"segment-{i:04d}.ts"]
+    lines.append("#EXT-X-ENDLIST")
+    (directory / "index.m3u8").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return directory, b"".join(expected)
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """خادم ملفات محلي دون طباعة الطلبات، مع تأخير اختياري لكل طلب يحاكي زمن الشبكة"""
+    
+    def __init__(self, *args, latency=0, **kwargs):
+        self.latency = latency
+        super().__init__(*args, **kwargs)
+    
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        super().do_GET()
+    
+    def log_message(self, format, *args):
+        pass
+
+class MediaServer:
+    """خادم HTTP محلي لملفات الاختبار"""
+    
+    def __init__(self, directory, latency=0):
+        handler = partial(QuietHandler, directory=str(directory), latency=latency)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+    
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+    
+    def __enter__(self):
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class BenchStubIE(InfoExtractor):
+    """مستخرج بديل يعيد بيانات ثابتة تشير إلى ملفات الخادم المحلي"""
+    
+    IE_NAME = "benchstub"
+    _VALID_URL = r"https?://127\.0\.0\.1:\d+/watch/(?P<id>[\w-]+)"
+    fixtures_dir = None
+    duration = 0
+    feed_head = 0  # عدد عناصر قناة الاختبار؛ زيادته تضيف عناصر جديدة في أولها
+    feed_pages = 0  # صفحات القناة المجلوبة
+    
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        base_url = url.split("/watch/")[0]
+        if video_id.startswith("feed-"):
+            return self._feed_result(video_id, base_url)
+        if video_id.startswith("hls-"):
+            return self._hls_result(video_id, base_url)
+        fixtures = MERGE_FIXTURES if video_id.startswith("merge-") else FIXTURES
+        formats = []
+        for name, spec in fixtures.items():
+            formats.append({
+                'format_id': spec['format_id'],
+                'url': f"{base_url}/{name}",
+                'ext': spec['ext'],
+                'width': spec['width'],
+                'height': spec['height'],
+                'vcodec': spec['vcodec'],
+                'acodec': spec['acodec'],
+                'filesize': (self.fixtures_dir / name).stat().st_size,
+            })
+        return {
+            'id': video_id,
+            'title': f"benchmark {video_id}",
+            'uploader': "benchmark",
+            'duration': self.duration,
+            'view_count': 0,
+            'thumbnail': "",
+            'formats': formats,
+        }
+    
+    def _hls_result(self, video_id, base_url):
+        """صيغة HLS واحدة تشير إلى قائمة m3u8 على الخادم المحلي"""
+        return {
+            'id': video_id,
+            'title': f"benchmark {video_id}",
+            'uploader': "benchmark",
+            'duration': HLS_SEGMENTS * 2,
+            'thumbnail': "",
+            'formats': [{
+                'format_id': "hls-720",
+                'url': f"{base_url}/hls/index.m3u8",
+                'ext': "mp4",
+                'protocol': "m3u8_native",
+                'width': 1280,
+                'height': 720,
+                'vcodec': "avc1",
+                'acodec': "mp4a",
+            }],
+        }
+
+    def _feed_result(self, feed_id, base_url):
+        """قناة بترتيب الأحدث أولاً تُجلب صفحة بصفحة عند الحاجة"""
+        head = self.feed_head
+        
+        def page(number):
+            BenchStubIE.feed_pages += 1
+            top = head - number * FEED_PAGE_SIZE
+            for n in range(top, max(0, top - FEED_PAGE_SIZE), -1):
+                yield self.url_result(f"{base_url}/watch/item-{n}", BenchStubIE, f"item-{n}")
+        
+        return self.playlist_result(OnDemandPagedList(page, FEED_PAGE_SIZE), feed_id, f"benchmark {feed_id}")
+
+class BenchYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL يوجه روابط الخادم المحلي إلى المستخرج البديل"""
+    
+    def __init__(self, params=None, auto_init=True):
+        super().__init__(params, auto_init)
+        self.add_info_extractor(BenchStubIE())
+    
+    def extract_info(self, url, *args, **kwargs):
+        if BenchStubIE.suitable(url):
+            kwargs['ie_key'] = BenchStubIE.ie_key()
+        return super().extract_info(url, *args, **kwargs)
+
+def summarize(histogram):
+    """ملخص مدرج تكراري بالميلي ثانية"""
+    stats = histogram.snapshot()
+    return {
+        'count': stats['count'],
+        'p50_ms': stats['p50'] * 1000,
+        'p95_ms': stats['p95'] * 1000,
+        'p99_ms': stats['p99'] * 1000,
+        'mean_ms': stats['sum'] / stats['count'] * 1000 if stats['count'] else 0,
+    }
+
+def bench_metadata(server, iterations):
+    """زمن استخراج البيانات الوصفية عبر get_video_info"""
+    from downloader import video_downloader
+    
+    histogram = Histogram()
+    for i in range(iterations):
+        start = time.perf_counter()
+        info = video_downloader.get_video_info(f"{server.base_url}/watch/meta-{i}")
+        histogram.observe(time.perf_counter() - start)
+        if info is None:
+            raise RuntimeError("فشل استخراج البيانات الوصفية")
+    return summarize(histogram)
+
+def bench_feeds(work_dir, sizes, repeats, new_items=5):
+    """استطلاع اشتراك بعد إضافة عناصر جديدة: الزمن وعدد الصفحات المجلوبة مقابل حجم القناة"""
+    from history_store import HistoryStore
+    from host_scheduler import host_scheduler
+    from subscriptions import SubscriptionManager
+    
+    results = {}
+    for size in sizes:
+        store = HistoryStore(work_dir / f"feeds-{size}.db")
+        manager = SubscriptionManager(store=store)
+        # لا خادم للطلب المشروط: يُستطلع بالاستخراج فقط
+        feed = manager.subscribe(f"http://127.0.0.1:9/watch/feed-{size}")
+        feed['conditional'] = 0
+        BenchStubIE.feed_head = size
+        manager.poll(feed)
+        
+        histogram = Histogram()
+        pages = []
+        for _ in range(repeats):
+            BenchStubIE.feed_head += new_items
+            BenchStubIE.feed_pages = 0
+            # التباعد بين طلبات نفس الموقع وكتابة عناصر الاستطلاع السابق ليسا جزءاً من القياس
+            host_scheduler.hosts.clear()
+            store.flush()
+            start = time.perf_counter()
+            new = manager.poll(feed)
+            histogram.observe(time.perf_counter() - start)
+            if len(new) != new_items:
+                raise RuntimeError(f"الاستطلاع وجد {len(new)} عنصر جديد بدلاً من {new_items}")
+            pages.append(BenchStubIE.feed_pages)
+        store.close()
+        
+        result = summarize(histogram)
+        result['pages'] = max(pages)
+        result['feed_pages'] = -(-size // FEED_PAGE_SIZE)
+        results[str(size)] = result
+    return results
+
+def run_downloads(server, output_dir, jobs, timeout=600, prefix="job"):
+    """تشغيل عدة تنزيلات متزامنة وانتظار انتهائها؛ يعيد (الزمن، البايتات)"""
+    from downloader import video_downloader
+    
+    done = threading.Semaphore(0)
+    results = []
+    
+    def completion_callback(download_id, success, record):
+        results.append((success, record))
+        done.release()
+    
+    start = time.perf_counter()
+    for i in range(jobs):
+        video_downloader.download_video(
+            f"{server.base_url}/watch/{prefix}-{jobs}-{i}-{time.monotonic_ns()}",
+            quality="720p",
+            output_path=str(output_dir),
+            completion_callback=completion_callback
+        )
+    for _ in range(jobs):
+        if not done.acquire(timeout=timeout):
+            raise TimeoutError("انتهت مهلة التنزيل")
+    elapsed = time.perf_counter() - start
+    
+    failures = [record for success, record in results if not success]
+    if failures:
+        raise RuntimeError(failures[0])
+    total_bytes = sum(os.path.getsize(record['filename']) for _, record in results)
+    return elapsed, total_bytes
+
+def bench_throughput(server, work_dir, jobs, repeats):
+    """معدل التنزيل لمهمة واحدة ولعدة مهام متزامنة"""
+    histogram = Histogram()
+    rates = []
+    for repeat in range(repeats):
+        output_dir = work_dir / f"downloads-{jobs}-{repeat}"
+        elapsed, total_bytes = run_downloads(server, output_dir, jobs)
+        histogram.observe(elapsed)
+        rates.append(total_bytes / elapsed)
+        shutil.rmtree(output_dir, ignore_errors=True)
+    
+    result = summarize(histogram)
+    result['jobs'] = jobs
+    result['mb_per_second'] = sorted(rates)[len(rates) // 2] / (1024 * 1024)
+    return result
+
+def bench_fragments(work_dir, repeats, latency=0.05):
+    """تنزيل بث HLS جزءاً بجزء مقابل عدة أجزاء بالتوازي، مع التحقق من ترتيب المحتوى"""
+    from utils import settings_manager
+    from config import FRAGMENT_WORKERS
+    
+    _, expected = generate_hls_fixture()
+    original = settings_manager.get("fragment_workers", FRAGMENT_WORKERS)
+    results = {}
+    try:
+        with MediaServer(FIXTURES_DIR, latency=latency) as server:
+            for name, workers in (("sequential", 1), ("parallel", FRAGMENT_WORKERS)):
+                settings_manager.settings["fragment_workers"] = workers
+                histogram = Histogram()
+                rates = []
+                for repeat in range(repeats):
+                    output_dir = work_dir / f"fragments-{name}-{repeat}"
+                    elapsed, total_bytes = run_downloads(server, output_dir, 1, prefix="hls")
+                    files = [path for path in output_dir.rglob("*") if path.is_file()]
+                    if len(files) != 1 or files[0].read_bytes() != expected:
+                        raise RuntimeError("المحتوى بعد إعادة تجميع الأجزاء لا يطابق البث الأصلي")
+                    histogram.observe(elapsed)
+                    rates.append(total_bytes / elapsed)
+                    shutil.rmtree(output_dir, ignore_errors=True)
+                
+                result = summarize(histogram)
+                result['workers'] = workers
+                result['mb_per_second'] = sorted(rates)[len(rates) // 2] / (1024 * 1024)
+                results[name] = result
+    finally:
+        settings_manager.settings["fragment_workers"] = original
+    
+    results['speedup'] = results['sequential']['p50_ms'] / results['parallel']['p50_ms']
+    return results
+
+def bench_merge(server, work_dir, repeats):
+    """تنزيل فيديو وصوت منفصلين مع الدمج أثناء التنزيل: الزمن الكلي وزمن الدمج بعد اكتمال التنزيل"""
+    from instrumentation import metrics
+    
+    histogram = Histogram()
+    for repeat in range(repeats):
+        output_dir = work_dir / f"merge-{repeat}"
+        elapsed, _ = run_downloads(server, output_dir, 1, prefix="merge")
+        histogram.observe(elapsed)
+        shutil.rmtree(output_dir, ignore_errors=True)
+    
+    spans = metrics.snapshot()
+    if "merge.streaming" not in spans:
+        return {'skipped': "لم يُستخدم الدمج أثناء التنزيل"}
+    result = summarize(histogram)
+    result['merge'] = summarize(metrics.histogram("merge.streaming"))
+    result['merge_after_download'] = summarize(metrics.histogram("merge.after_download"))
+    return result
+
+def bench_conversion(source, work_dir, duration, repeats, normalize=False):
+    """سرعة التحويل في VideoConverter كمضاعف للزمن الحقيقي"""
+    from downloader import video_converter
+    
+    histogram = Histogram()
+    for repeat in range(repeats):
+        output_path = work_dir / f"convert-{source.stem}-{repeat}.mp3"
+        done = threading.Event()
+        outcome = {}
+        
+        def completion_callback(conversion_id, success, result):
+            outcome['success'], outcome['result'] = success, result
+            done.set()
+        
+        start = time.perf_counter()
+        video_converter.video_to_audio(
+            str(source), output_path=str(output_path), quality="192",
+            completion_callback=completion_callback, normalize=normalize
+        )
+        if not done.wait(timeout=600):
+            raise TimeoutError("انتهت مهلة التحويل")
+        histogram.observe(time.perf_counter() - start)
+        if not outcome['success']:
+            raise RuntimeError(outcome['result'])
+        output_path.unlink(missing_ok=True)
+    
+    result = summarize(histogram)
+    result['realtime_factor'] = duration / (result['p50_ms'] / 1000) if result['p50_ms'] else 0
+    return result
+
+# أشكال الروابط المستخدمة في قياس التوحيد (مشاركة، قصير، جوال، تضمين، مع معاملات تتبع)
+URL_FORMS = [
+    "https://www.youtube.com/watch?v={video}&t=42s&si=share",
+    "https://youtu.be/{video}?si=share",
+    "https://m.youtube.com/shorts/{video}",
+    "https://www.youtube-nocookie.com/embed/{video}?rel=0",
+    "https://x.com/user/status/{number}?s=20",
+    "https://www.tiktok.com/@user.name/video/{number}?is_from_webapp=1",
+    "https://vimeo.com/{number}",
+    "https://www.instagram.com/reel/{video}/?igsh=share",
+    "https://www.reddit.com/r/videos/comments/{video}/title/",
+    "https://example.com/media/{number}?id={number}&utm_source=feed&fbclid=click",
+]
+
+def bench_urls(count, repeats):
+    """عدد الروابط المختلفة التي يوحدها canonicalize في الثانية (دون ذاكرة مؤقتة)"""
+    from url_canonical import canonicalize
+    
+    urls = [
+        URL_FORMS[i % len(URL_FORMS)].format(video=f"{i:011d}", number=i)
+        for i in range(count)
+    ]
+    histogram = Histogram()
+    for _ in range(repeats):
+        canonicalize.cache_clear()
+        start = time.perf_counter()
+        for url in urls:
+            canonicalize(url)
+        histogram.observe(time.perf_counter() - start)
+    
+    result = summarize(histogram)
+    result['urls'] = count
+    result['urls_per_second'] = count / (histogram.snapshot()['p50'] or 1e-9)
+    return result
+
+def bench_library(work_dir, file_count, repeats):
+    """زمن refresh_file_list لمكتبة بعدد كبير من الملفات"""
+    import tkinter as tk
+    import main
+    from media_probe import MediaProbe
+    
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        return {'skipped': f"لا توجد شاشة متاحة: {e}"}
+    root.withdraw()
+    
+    library_dir = work_dir / f"library-{file_count}"
+    extensions = SUPPORTED_VIDEO_FORMATS + SUPPORTED_AUDIO_FORMATS
+    for i in range(file_count):
+        folder = library_dir / f"{i // 1000:03d}"
+        if i % 1000 == 0:
+            folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"file-{i:06d}{extensions[i % len(extensions)]}").touch()
+    
+    original_dir, original_probe = main.DOWNLOADS_DIR, main.media_probe
+    main.DOWNLOADS_DIR = library_dir
+    histogram = Histogram()
+    try:
+        app = SimpleNamespace(
+            files_listbox=tk.Listbox(root),
+            show_library_duration=lambda path, info: None
+        )
+        for _ in range(repeats):
+            # خدمة فحص مؤقتة لكل تكرار حتى لا يتأثر مجلد المستخدم أو ذاكرته
+            probe = MediaProbe(cache_file=work_dir / "probe-cache.json", max_workers=1)
+            main.media_probe = probe
+            start = time.perf_counter()
+            main.SnapTubeApp.refresh_file_list(app)
+            root.update_idletasks()
+            histogram.observe(time.perf_counter() - start)
+            probe.executor.shutdown(wait=False, cancel_futures=True)
+    finally:
+        main.DOWNLOADS_DIR, main.media_probe = original_dir, original_probe
+        root.destroy()
+        shutil.rmtree(library_dir, ignore_errors=True)
+    
+    result = summarize(histogram)
+    result['files'] = file_count
+    return result
+
+def bench_startup(repeats):
+    """زمن بدء التشغيل: استيراد الوحدات، وإنشاء النافذة الرئيسية إن توفرت شاشة"""
+    import_histogram = Histogram()
+    window_histogram = Histogram()
+    script = "\n".join([
+        "import os, sys, time",
+        "start = time.perf_counter()",
+        "import main",
+        "imported = time.perf_counter() - start",
+        "try:",
+        "    app = main.SnapTubeApp()",
+        "    app.root.update()",
+        "    window = time.perf_counter() - start",
+        "except Exception:",
+        "    window = -1",
+        "print(imported, window)",
+        "sys.stdout.flush()",
+        "os._exit(0)",
+    ])
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", script], cwd=BASE_DIR,
+            capture_output=True, text=True, timeout=120, check=True
+        ).stdout.split()
+        import_histogram.observe(float(output[-2]))
+        if float(output[-1]) >= 0:
+            window_histogram.observe(float(output[-1]))
+    
+    result = {'import': summarize(import_histogram)}
+    result['window'] = summarize(window_histogram) if window_histogram.count else {'skipped': "لا توجد شاشة متاحة"}
+    return result
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def run_suite(args):
+    """تشغيل القياسات المطلوبة وإرجاع النتائج"""
+    selected = set(args.only.split(",")) if args.only else None
+    
+    def wanted(name):
+        return selected is None or name in selected
+    
+    duration = 5 if args.quick else 30
+    repeats = 3 if args.quick else 5
+    library_sizes = [1000, 10000] if args.quick else [10000, 100000]
+    
+    results = {}
+    work_dir = Path(tempfile.mkdtemp(prefix="snaptube-bench-"))
+    try:
+        if wanted("urls"):
+            results['urls'] = bench_urls(100000, repeats)
+        
+        # ملفات الاختبار تحتاج ffmpeg؛ لا تُولَّد إلا للقياسات التي تستخدمها
+        if any(wanted(name) for name in ("metadata", "throughput", "merge", "conversion")):
+            fixtures_dir = generate_fixtures(duration)
+            BenchStubIE.fixtures_dir = fixtures_dir
+            BenchStubIE.duration = duration
+            yt_dlp.YoutubeDL = BenchYoutubeDL
+        
+        if wanted("feeds"):
+            yt_dlp.YoutubeDL = BenchYoutubeDL
+            results['feeds'] = bench_feeds(work_dir, library_sizes, repeats)
+        
+        if wanted("fragments"):
+            yt_dlp.YoutubeDL = BenchYoutubeDL
+            results['fragments'] = bench_fragments(work_dir, repeats)
+        
+        if wanted("metadata") or wanted("throughput") or wanted("merge"):
+            with MediaServer(fixtures_dir) as server:
+                if wanted("metadata"):
+                    results['metadata'] = bench_metadata(server, 20 if args.quick else 100)
+                if wanted("throughput"):
+                    results['throughput.single'] = bench_throughput(server, work_dir, 1, repeats)
+                    results['throughput.multi'] = bench_throughput(server, work_dir, 4, repeats)
+                if wanted("merge"):
+                    results['merge'] = bench_merge(server, work_dir, repeats)
+        
+        if wanted("conversion"):
+            results['conversion.reencode'] = bench_conversion(fixtures_dir / "video.mp4", work_dir, duration, repeats)
+            results['conversion.stream_copy'] = bench_conversion(fixtures_dir / "audio.mp3", work_dir, duration, repeats)
+            results['conversion.normalize'] = bench_conversion(fixtures_dir / "video.mp4", work_dir, duration, repeats, normalize=True)
+        
+        if wanted("library"):
+            for size in library_sizes:
+                results[f'library.{size}'] = bench_library(work_dir, size, repeats)
+        
+        if wanted("startup"):
+            results['startup'] = bench_startup(repeats)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'quick': args.quick,
+            'fixture_duration': duration,
+        },
+        'results': results,
+    }
+
+def flatten(results, prefix=""):
+    """تحويل النتائج المتداخلة إلى أزواج (الاسم، القيمة) الرقمية"""
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, f"{name}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+def compare(baseline, current):
+    """طباعة الفرق بين نتائج سابقة والنتائج الحالية"""
+    old = dict(flatten(baseline['results']))
+    print(f"\nمقارنة مع {baseline['meta'].get('revision')}:")
+    for name, value in flatten(current['results']):
+        if name in old and old[name] and not name.endswith(".count"):
+            change = (value - old[name]) / old[name] * 100
+            print(f"  {name:<45} {old[name]:>12.3f} -> {value:>12.3f}  ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس أداء SnapTube دون اتصال بالشبكة")
+    parser.add_argument("--output", default="benchmark_results.json", help="ملف النتائج (JSON)")
+    parser.add_argument("--compare", help="ملف نتائج سابق للمقارنة")
+    parser.add_argument("--only", help="قائمة مفصولة بفواصل: urls,feeds,metadata,throughput,merge,fragments,conversion,library,startup")
+    parser.add_argument("--quick", action="store_true", help="أحجام أصغر وتكرارات أقل")
+    args = parser.parse_args()
+    
+    report = run_suite(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report['results'], indent=2, ensure_ascii=False))
+    
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
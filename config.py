@@ -35,6 +35,16 @@ SUPPORTED_QUALITIES = {
     "أقل جودة": "worst"
 }
 
+# فيديو وصوت منفصلان بأفضل جودة (يُدمجان بـ ffmpeg)؛ تُجرب قبل صيغ SUPPORTED_QUALITIES إن توفر ffmpeg
+MERGE_QUALITIES = {
+    "480p": "bv[height<=480]+ba",
+    "720p": "bv[height<=720]+ba",
+    "1080p": "bv[height<=1080]+ba",
+    "1440p": "bv[height<=1440]+ba",
+    "4K": "bv[height<=2160]+ba",
+    "أفضل جودة": "bv+ba",
+}
+
 # إعدادات الصوت
 AUDIO_QUALITIES = {
     "64 kbps": "64",
@@ -44,6 +54,16 @@ AUDIO_QUALITIES = {
     "320 kbps": "320"
 }
 
+# إعدادات الصور المصغرة
+THUMBNAILS_DIR = TEMP_DIR / "thumbnails"
+THUMBNAIL_SIZES = {
+    "info": (320, 180),
+    "library": (160, 90)
+}
+THUMBNAIL_DISK_CACHE_MAX_BYTES = 100 * 1024 * 1024
+THUMBNAIL_MEMORY_MAX_PIXELS = 320 * 180 * 50
+THUMBNAIL_WORKERS = 4
+
 # ألوان التطبيق
 COLORS = {
     "primary": "#2196F3",
@@ -68,6 +88,123 @@ MIN_WINDOW_SIZE = "900x600"
 SUPPORTED_VIDEO_FORMATS = [".mp4", ".avi", ".mov", ".mkv", ".wmv", ".flv", ".webm"]
 SUPPORTED_AUDIO_FORMATS = [".mp3", ".wav", ".ogg", ".flac", ".aac", ".wma"]
 
+# إعدادات محرك التشغيل
+PLAYBACK_SAMPLE_RATE = 44100
+PLAYBACK_CHANNELS = 2
+PLAYBACK_CHUNK_SECONDS = 0.2
+PLAYBACK_BUFFER_SECONDS = 5
+PLAYBACK_VIDEO_SIZE = (640, 360)
+PLAYBACK_MAX_FPS = 30
+PLAYBACK_VIDEO_BUFFER_FRAMES = 24
+
+# الموجة الصوتية
+WAVEFORMS_DIR = TEMP_DIR / "waveforms"
+WAVEFORM_SAMPLE_RATE = 11025
+WAVEFORM_BASE_BLOCK = 128
+WAVEFORM_MIN_BLOCKS = 512
+
+# توحيد مستوى الصوت (EBU R128)
+LOUDNESS_TARGET_LUFS = -23.0
+LOUDNESS_MAX_GAIN_DB = 12.0
+LOUDNESS_TOLERANCE_DB = 0.5
+
+# فحص الوسائط
+MEDIA_PROBE_WORKERS = min(4, os.cpu_count() or 1)
+
+# البيانات الوصفية للروابط (ذاكرة مؤقتة وجلب مسبق من الحافظة)
+METADATA_CACHE_SIZE = 64  # عدد الروابط المحفوظة
+METADATA_CACHE_TTL = 15 * 60  # ثوانٍ قبل اعتبار البيانات قديمة
+METADATA_PREFETCH_QUEUE = 4  # أقصى عدد روابط في طابور الجلب المسبق (يُسقط الأقدم)
+METADATA_PREFETCH_WORKERS = 2
+METADATA_REQUEST_TIMEOUT = 60  # ثوانٍ قبل إظهار انتهاء المهلة لطلب التحليل
+CLIPBOARD_POLL_INTERVAL = 750  # ملي ثانية بين قراءات الحافظة
+
+# إعادة المحاولة (عدد المحاولات لكل صنف خطأ)
+RETRY_BUDGETS = {
+    "throttled": 4,
+    "server": 5,
+    "network": 8,
+    "incomplete": 3,
+    "format": 3,
+}
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+RETRY_THROTTLE_FACTOR = 5
+FRAGMENT_RETRIES = 10
+YDL_INNER_RETRIES = 1  # محاولات yt-dlp الداخلية للطلب؛ الميزانيات أعلاه هي الحد الفعلي
+
+# تنزيل أجزاء HLS/DASH بالتوازي
+FRAGMENT_WORKERS = 4  # أقصى عدد أجزاء تُنزَّل في نفس الوقت لكل صيغة
+FRAGMENT_REORDER_WINDOW = 16  # أقصى عدد أجزاء قيد التنزيل أو تنتظر الكتابة بالترتيب
+FRAGMENT_FULL_HEIGHT = 720  # الصيغ الأقل دقة (والصوت) تستخدم نصف العدد
+
+# دمج الفيديو والصوت أثناء التنزيل
+MERGE_CHUNK_SIZE = 1024 * 1024  # حجم القراءة من الملف الجزئي إلى أنبوب ffmpeg
+MERGE_POLL_INTERVAL = 0.2  # ثوانٍ بين محاولات القراءة عندما لا توجد بيانات جديدة
+MERGE_THREAD_QUEUE = 64  # حزم مقروءة تنتظر لكل مدخل في ffmpeg
+MERGE_MUXING_QUEUE = 1024  # حد حزم الانتظار في المُجمِّع قبل الكتابة
+MERGE_INTERLEAVE_DELTA = 2  # ثوانٍ من الحزم ينتظرها المُجمِّع للتدفق المتأخر قبل الكتابة دونه
+
+# نوافذ التنزيل المجدولة ("01:00-07:00/4" في الإعدادات)
+SCHEDULER_INTERVAL = 5  # ثوانٍ بين مراجعات جدول التنزيلات
+WINDOW_RAMP_STEP = 5 * 60  # ثوانٍ لكل تنزيل إضافي بعد فتح النافذة (وقبل إغلاقها بالعكس)
+
+# الاشتراكات في القنوات وقوائم التشغيل
+SUBSCRIPTION_POLL_INTERVAL = 30 * 60  # ثوانٍ بين استطلاعين لنفس الاشتراك
+SUBSCRIPTION_CHECK_INTERVAL = 60  # ثوانٍ بين مراجعات الاشتراكات المستحقة
+SUBSCRIPTION_MAX_BACKOFF = 24 * 60 * 60  # أقصى تأجيل بعد أخطاء متتالية أو رد 429
+SUBSCRIPTION_KNOWN_STREAK = 5  # عناصر معروفة متتالية يتوقف بعدها الاستطلاع (إن حُذف آخر عنصر معروف)
+SUBSCRIPTION_BASELINE_SIZE = 200  # عناصر تُسجل كمعروفة في أول استطلاع دون تنزيلها
+SUBSCRIPTION_MAX_NEW = 50  # أقصى عدد عناصر جديدة تُنزَّل من استطلاع واحد
+
+# جدولة التنزيلات حسب الموقع
+HOST_MAX_CONNECTIONS = 2
+HOST_METADATA_INTERVAL = 1.0  # ثوانٍ بين طلبات البيانات الوصفية لنفس الموقع
+HOST_THROTTLE_COOLDOWN = 120  # ثوانٍ قبل رفع الحد بعد رد 429/403
+
+# مساحة القرص
+DISK_FREE_MARGIN = 200 * 1024 * 1024  # مساحة تبقى حرة دائماً
+DISK_ESTIMATE_MARGIN = 1.1  # هامش فوق الحجم المتوقع للتنزيل
+PARTIAL_FILE_MAX_AGE = 60 * 60  # عمر الملفات الجزئية المهملة قبل حذفها (ثوانٍ)
+
+# تخطيط مجلد المكتبة
+# الحقول: {platform} {uploader} {title} {id} {date} {year} {month} {shard}
+OUTPUT_TEMPLATE = "{platform}/{uploader}/{title}"
+OUTPUT_TEMPLATE_PRESETS = [
+    "{platform}/{uploader}/{title}",
+    "{platform}/{year}/{month}/{title}",
+    "{platform}/{shard}/{title} [{id}]",
+    "{title}",
+]
+OUTPUT_COMPONENT_MAX_LENGTH = 120  # حد طول كل جزء من المسار
+
+# سجل التنزيلات (SQLite)
+HISTORY_DB = CONFIG_DIR / "history.db"
+HISTORY_BATCH_SIZE = 200  # أقصى عدد سجلات في معاملة واحدة
+HISTORY_FLUSH_INTERVAL = 0.5  # ثوانٍ لتجميع السجلات قبل الكتابة
+HISTORY_PAGE_SIZE = 50
+HISTORY_RETENTION_DAYS = 365  # حذف السجلات الأقدم (0 = بلا حد)
+HISTORY_MAX_ENTRIES = 200000  # أقصى عدد سجلات يُحتفظ به
+
+# التحقق من سلامة الملفات المكتملة
+INTEGRITY_CHUNK_SIZE = 4 * 1024 * 1024  # حجم الجزء في بصمات الملف (SHA-256 لكل جزء)
+INTEGRITY_BUSY_RATE = 8 * 1024 * 1024  # أقصى معدل قراءة (بايت/ثانية) أثناء وجود تنزيلات نشطة
+INTEGRITY_DURATION_TOLERANCE = 0.02  # فرق نسبي مسموح بين مدة الملف والمدة المعلنة (ثانيتان على الأقل)
+
+# حزم جلسات التنزيل (تصدير الطابور واستيراده)
+BUNDLE_EXTENSION = ".snapbundle"
+BUNDLE_METADATA_TTL = 2 * 60 * 60  # صلاحية البيانات المضمنة عندما لا تحدد روابط الصيغ انتهاءها (ثوانٍ)
+BUNDLE_EXPIRY_MARGIN = 10 * 60  # يُعاد الاستخراج قبل انتهاء صلاحية روابط الصيغ بهذا الهامش
+
+# عمال المعالجة اللاحقة (عمليات منفصلة)
+POSTPROCESS_WORKERS = os.cpu_count() or 1
+POSTPROCESS_MEMORY_LIMIT = 3 * 1024 * 1024 * 1024  # حد مساحة العناوين لكل عامل (0 = بلا حد)
+POSTPROCESS_PROGRESS_INTERVAL = 0.25
+
+# قياس الأداء
+METRICS_RESERVOIR_SIZE = 2048
+PROFILE_SAMPLE_INTERVAL = 0.005
+
 # رسائل التطبيق
 MESSAGES = {
     "download_started": "بدأ التنزيل...",
@@ -83,4 +220,27 @@ MESSAGES = {
 SUPPORTED_PLATFORMS = [
     "YouTube", "Facebook", "Instagram", "TikTok", "Twitter", "Dailymotion",
     "Vimeo", "SoundCloud", "Twitch", "Reddit", "Tumblr", "Pinterest"
-]
\ No newline at end of file
+]
+
+# النطاقات المسجلة لكل منصة (تطابق النطاق نفسه وكل نطاقاته الفرعية فقط)
+PLATFORM_DOMAINS = {
+    "YouTube": ["youtube.com", "youtu.be", "youtube-nocookie.com"],
+    "Facebook": ["facebook.com", "fb.watch", "fb.com"],
+    "Instagram": ["instagram.com", "instagr.am"],
+    "TikTok": ["tiktok.com"],
+    "Twitter": ["twitter.com", "x.com"],
+    "Dailymotion": ["dailymotion.com", "dai.ly"],
+    "Vimeo": ["vimeo.com"],
+    "SoundCloud": ["soundcloud.com", "snd.sc"],
+    "Twitch": ["twitch.tv"],
+    "Reddit": ["reddit.com", "redd.it"],
+    "Tumblr": ["tumblr.com"],
+    "Pinterest": ["pinterest.com", "pin.it"],
+}
+
+# معاملات التتبع التي تُحذف من الروابط قبل المقارنة
+TRACKING_PARAMS = [
+    "fbclid", "gclid", "dclid", "msclkid", "igshid", "igsh", "si", "feature",
+    "ref", "ref_src", "ref_url", "share_id", "mibextid", "_r", "_t",
+]
+TRACKING_PARAM_PREFIXES = ["utm_"]
\ No newline at end of file
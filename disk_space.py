@@ -0,0 +1,176 @@
+"""
+إدارة مساحة القرص: حجز المساحة لكل تنزيل، الحجز المسبق للملفات، وتنظيف الملفات الجزئية
+"""
+import os
+import re
+import sys
+import time
+import errno
+import shutil
+import threading
+from utils import logger, format_file_size
+from config import DOWNLOADS_DIR, TEMP_DIR, DISK_FREE_MARGIN, DISK_ESTIMATE_MARGIN, PARTIAL_FILE_MAX_AGE
+
+# ملفات yt-dlp الجزئية (.part و .part-FragN و .ytdl) وملفات الدمج والتحويل والنقل المؤقتة (في TEMP_DIR فقط)
+PARTIAL_FILE_PATTERN = re.compile(r"\.(part(-Frag\d+)?|ytdl|temp|staging)(\.\w+)?$")
+# بقايا yt-dlp بأسمائها الدقيقة في مجلدات المكتبة؛ "Lecture.part.mp4" ملف عادي
+LIBRARY_PARTIAL_PATTERN = re.compile(r"\.(part|part-Frag\d+|ytdl)$")
+# ملف المعالجة المؤقت "name.temp.mp4" يُحذف فقط إن وُجد بجواره ملف "name.….part"
+LIBRARY_TEMP_PATTERN = re.compile(r"^(?P<stem>.+)\.temp\.\w+$")
+
+FALLOC_FL_KEEP_SIZE = 0x01
+
+def estimate_size(info):
+    """الحجم المتوقع للصيغ المختارة من filesize أو filesize_approx أو معدل البت"""
+    total = 0
+    for fmt in info.get('requested_formats') or [info]:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and info.get('duration'):
+            size = fmt['tbr'] * 1000 / 8 * info['duration']
+        total += size or 0
+    return int(total * DISK_ESTIMATE_MARGIN)
+
+class Reservation:
+    """مساحة محجوزة لتنزيل واحد؛ تتناقص بقدر ما كُتب فعلاً"""
+    
+    def __init__(self, manager, volume, size):
+        self.manager = manager
+        self.volume = volume
+        self.size = size
+        self.written = {}
+        self.preallocated = {}  # الملف -> الحجم المحجوز بـ fallocate (مستبعد أصلاً من المساحة الحرة)
+    
+    @property
+    def remaining(self):
+        # كتل الملف المحجوز مسبقاً محسوبة في disk_usage، فلا تُطرح مرة ثانية
+        files = self.written.keys() | self.preallocated.keys()
+        used = sum(max(self.written.get(name, 0), self.preallocated.get(name, 0)) for name in files)
+        return max(0, self.size - used)
+    
+    def update(self, filename, downloaded):
+        self.written[filename] = downloaded
+    
+    def mark_preallocated(self, filename, size):
+        self.preallocated[filename] = size
+    
+    def release(self):
+        self.manager._release(self)
+
+class DiskSpaceManager:
+    """قبول التنزيلات حسب المساحة الحرة في كل وحدة تخزين"""
+    
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.reservations = {}  # رقم وحدة التخزين -> الحجوزات النشطة
+    
+    def _reserved(self, volume):
+        return sum(reservation.remaining for reservation in self.reservations.get(volume, []))
+    
+    def reserve(self, directory, size, on_wait=None, cancelled=None):
+        """حجز مساحة للتنزيل؛ ينتظر إن كانت تنزيلات أخرى ستحرر أو تستهلك المساحة"""
+        os.makedirs(directory, exist_ok=True)
+        volume = os.stat(directory).st_dev
+        waiting = False
+        
+        with self.condition:
+            while True:
+                free = shutil.disk_usage(directory).free - self._reserved(volume) - DISK_FREE_MARGIN
+                if size <= free:
+                    break
+                if not self.reservations.get(volume):
+                    # لا توجد تنزيلات أخرى على نفس الوحدة: الانتظار لن يفيد
+                    raise OSError(
+                        errno.ENOSPC,
+                        f"مساحة غير كافية: يلزم {format_file_size(size)} والمتاح {format_file_size(max(free, 0))}"
+                    )
+                if cancelled and cancelled():
+                    raise RuntimeError("تم إلغاء التنزيل قبل بدئه")
+                if on_wait and not waiting:
+                    on_wait()
+                    waiting = True
+                self.condition.wait(timeout=1.0)
+            
+            reservation = Reservation(self, volume, size)
+            self.reservations.setdefault(volume, []).append(reservation)
+        return reservation
+    
+    def _release(self, reservation):
+        with self.condition:
+            reservations = self.reservations.get(reservation.volume, [])
+            if reservation in reservations:
+                reservations.remove(reservation)
+            self.condition.notify_all()
+    
+    @staticmethod
+    def preallocate(path, size):
+        """حجز كتل الملف مسبقاً لتقليل التجزئة دون تغيير حجمه الظاهر
+        
+        posix_fallocate يغير حجم الملف فيفسد الإلحاق والاستئناف في yt-dlp،
+        لذلك يُستخدم fallocate مع FALLOC_FL_KEEP_SIZE على Linux فقط.
+        """
+        if not sys.platform.startswith("linux") or size <= 0:
+            return False
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = os.open(path, os.O_WRONLY)
+            try:
+                return libc.fallocate(fd, FALLOC_FL_KEEP_SIZE, ctypes.c_longlong(0), ctypes.c_longlong(size)) == 0
+            finally:
+                os.close(fd)
+        except (OSError, AttributeError):
+            return False
+    
+    def collect_partial_files(self, max_age=PARTIAL_FILE_MAX_AGE, keep=(), temp_dir=TEMP_DIR,
+                              library_dirs=(DOWNLOADS_DIR, DOWNLOADS_DIR / "audio")):
+        """حذف الملفات الجزئية المهملة الأقدم من max_age ثانية، عدا ما في مجلدات keep
+        
+        التنزيلات تمر عبر مجلد العمل في TEMP_DIR فيُفحص كاملاً؛ مجلدات المكتبة تُفحص
+        في مستواها الأول فقط وببقايا yt-dlp الدقيقة، فلا تُحذف ملفات المستخدم.
+        """
+        cutoff = time.time() - max_age
+        candidates = list(self._temp_leftovers(temp_dir, keep))
+        for directory in library_dirs:
+            candidates.extend(self._library_leftovers(directory))
+        
+        freed = 0
+        for path in candidates:
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime < cutoff:
+                    os.remove(path)
+                    freed += stat.st_size
+            except OSError:
+                continue
+        if freed:
+            logger.info(f"تم حذف ملفات جزئية مهملة: {format_file_size(freed)}")
+        return freed
+    
+    @staticmethod
+    def _temp_leftovers(directory, keep):
+        keep = {os.path.abspath(path) for path in keep}
+        for root, dirs, files in os.walk(directory):
+            # ملفات التنزيلات الموقوفة تبقى لتُستأنف
+            dirs[:] = [name for name in dirs if os.path.abspath(os.path.join(root, name)) not in keep]
+            for name in files:
+                if PARTIAL_FILE_PATTERN.search(name):
+                    yield os.path.join(root, name)
+    
+    @staticmethod
+    def _library_leftovers(directory):
+        try:
+            names = [entry.name for entry in os.scandir(directory) if entry.is_file()]
+        except OSError:
+            return
+        partial = [name for name in names if LIBRARY_PARTIAL_PATTERN.search(name)]
+        for name in names:
+            if name in partial:
+                yield os.path.join(directory, name)
+                continue
+            match = LIBRARY_TEMP_PATTERN.match(name)
+            if match and any(other.startswith(match.group('stem') + ".") and other.endswith(".part") for other in partial):
+                yield os.path.join(directory, name)
+
+# إنشاء كائنات عامة
+disk_space = DiskSpaceManager()
\ No newline at end of file
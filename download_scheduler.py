@@ -0,0 +1,273 @@
+"""
+تنزيلات مجدولة: بعد وقت محدد أو داخل نوافذ التنزيل فقط (ساعات الليل مثلاً)، مع إيقاف قابل للاستئناف
+"""
+import re
+import time
+import threading
+from datetime import datetime, timedelta
+from utils import logger, settings_manager
+from downloader import video_downloader
+from history_store import history_store
+from staging import staging_area
+from config import SCHEDULER_INTERVAL, WINDOW_RAMP_STEP
+
+# حالات المهمة المجدولة
+WAITING = "waiting"    # لم تبدأ بعد
+RUNNING = "running"    # قيد التنزيل
+PAUSING = "pausing"    # طُلب إيقافها وتنتظر توقف التنزيل
+PAUSED = "paused"      # موقوفة؛ الملف الجزئي في مجلد العمل
+
+def parse_clock(value):
+    """"HH:MM" إلى دقائق منذ منتصف الليل؛ يرفع ValueError"""
+    match = re.fullmatch(r"\s*(\d{1,2}):(\d{2})\s*", value or "")
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise ValueError(f"وقت غير صالح: {value}")
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+def format_clock(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def parse_windows(text):
+    """نوافذ التنزيل من نص الإعدادات: "01:00-07:00/4, 23:00-23:30"
+    
+    الرقم بعد / هو أقصى عدد تنزيلات متزامنة في النافذة (افتراضياً إعداد التنزيلات المتزامنة).
+    النافذة التي تنتهي قبل بدايتها تعبر منتصف الليل.
+    """
+    windows = []
+    for part in re.split(r"[,;،]", text or ""):
+        part = part.strip()
+        if not part:
+            continue
+        span, _, limit = part.partition("/")
+        start, separator, end = span.partition("-")
+        if not separator:
+            raise ValueError(f"نافذة غير صالحة: {part}")
+        start, end = parse_clock(start), parse_clock(end)
+        if start == end:
+            raise ValueError(f"نافذة فارغة: {part}")
+        window = {'start': format_clock(start), 'end': format_clock(end)}
+        if limit.strip():
+            if not limit.strip().isdigit() or int(limit) < 1:
+                raise ValueError(f"عدد تنزيلات غير صالح في النافذة: {part}")
+            window['max_downloads'] = int(limit)
+        windows.append(window)
+    return windows
+
+def format_windows(windows):
+    """نص الإعدادات لقائمة النوافذ"""
+    return ", ".join(
+        f"{window['start']}-{window['end']}" + (f"/{window['max_downloads']}" if window.get('max_downloads') else "")
+        for window in windows
+    )
+
+def parse_after(text, now=None):
+    """وقت البدء: "HH:MM" (أول مرة قادمة) أو "YYYY-MM-DD HH:MM"؛ None لنص فارغ"""
+    text = (text or "").strip()
+    if not text:
+        return None
+    now = now or datetime.now()
+    try:
+        return datetime.strptime(text, "%Y-%m-%d %H:%M").timestamp()
+    except ValueError:
+        pass
+    minutes = parse_clock(text)
+    start = now.replace(hour=minutes // 60, minute=minutes % 60, second=0, microsecond=0)
+    if start <= now:
+        start += timedelta(days=1)
+    return start.timestamp()
+
+def window_bounds(window, now):
+    """بداية النافذة ونهايتها إن كان now داخلها، وإلا None"""
+    start, end = parse_clock(window['start']), parse_clock(window['end'])
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    # نافذة بدأت أمس وتعبر منتصف الليل، أو نافذة اليوم
+    for day in (-1, 0):
+        opened = midnight + timedelta(days=day, minutes=start)
+        closes = opened + timedelta(minutes=(end - start) % 1440)
+        if opened <= now < closes:
+            return opened, closes
+    return None
+
+def window_limit(windows, now, default_limit):
+    """عدد التنزيلات المسموح به الآن داخل النوافذ (0 خارجها)
+    
+    العدد يرتفع تنزيلاً واحداً كل WINDOW_RAMP_STEP بعد فتح النافذة، وينخفض
+    بنفس المعدل قبل إغلاقها، فلا تبدأ كل التنزيلات أو تتوقف دفعة واحدة.
+    """
+    limit = 0
+    for window in windows:
+        try:
+            bounds = window_bounds(window, now)
+        except (KeyError, ValueError):
+            continue
+        if bounds is None:
+            continue
+        opened, closes = bounds
+        edge = min(now - opened, closes - now).total_seconds()
+        maximum = window.get('max_downloads') or default_limit
+        limit = max(limit, min(maximum, 1 + int(edge // WINDOW_RAMP_STEP)))
+    return limit
+
+class DownloadScheduler:
+    """مهام تنزيل مؤجلة تُحفظ في قاعدة سجل التنزيلات
+    
+    كل مراجعة تحسب عدد التنزيلات المسموح به في النافذة الحالية، فتبدأ المهام الجاهزة
+    حتى هذا العدد، وتوقف أحدث المهام إن تجاوزته (عند إغلاق النافذة). المهمة الموقوفة
+    تحتفظ بمجلد عملها وتستأنف ملفها الجزئي عند النافذة التالية، حتى بعد إعادة تشغيل التطبيق.
+    """
+    
+    def __init__(self):
+        self.jobs = {}       # المعرف -> المهمة، بترتيب الإضافة
+        self.callbacks = {}  # المعرف -> (progress_callback, completion_callback) في هذه الجلسة
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.stopped = False
+    
+    def start(self):
+        """تحميل المهام المحفوظة وتشغيل thread الجدولة"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            for job in history_store.scheduled_jobs():
+                job['windowed'] = bool(job['windowed'])
+                if job['state'] in (RUNNING, PAUSING):
+                    # أُغلق التطبيق أثناء التنزيل: الملف الجزئي باقٍ في مجلد العمل
+                    job['state'] = PAUSED
+                self.jobs[job['id']] = job
+            self.thread = threading.Thread(target=self._loop, name="download-scheduler", daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+    
+    def submit(self, kind, url, quality, output_path=None, not_before=None, windowed=False,
+               progress_callback=None, completion_callback=None):
+        """إضافة مهمة تبدأ بعد not_before (طابع زمني) و/أو داخل نوافذ التنزيل فقط"""
+        job_id = video_downloader.job_id(url, quality, kind)
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'url': url,
+            'quality': str(quality),
+            'output_path': str(output_path) if output_path else None,
+            'not_before': not_before or 0,
+            'windowed': bool(windowed),
+            'state': WAITING,
+            'created_at': time.time(),
+        }
+        with self.lock:
+            if job_id in self.jobs:
+                return job_id
+            self.jobs[job_id] = job
+            self.callbacks[job_id] = (progress_callback, completion_callback)
+        history_store.save_job(job)
+        self.wakeup.set()
+        return job_id
+    
+    def remove(self, job_id):
+        """حذف مهمة مجدولة وملفاتها الجزئية"""
+        with self.lock:
+            job = self.jobs.pop(job_id, None)
+            self.callbacks.pop(job_id, None)
+        if job is None:
+            return False
+        if job['state'] in (RUNNING, PAUSING):
+            video_downloader.cancel_download(job_id)
+        else:
+            staging_area.discard(job_id)
+        history_store.delete_job(job_id)
+        return True
+    
+    def pending(self):
+        """المهام التي لم تبدأ أو الموقوفة (للعرض)"""
+        with self.lock:
+            return [dict(job) for job in self.jobs.values() if job['state'] in (WAITING, PAUSED)]
+    
+    def job_directories(self):
+        """مجلدات عمل المهام المجدولة؛ لا تُحذف مع بقايا الجلسات السابقة"""
+        with self.lock:
+            return [staging_area.directory(job_id) for job_id in self.jobs]
+    
+    def _loop(self):
+        while not self.stopped:
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"خطأ في جدول التنزيلات: {e}")
+            self.wakeup.wait(SCHEDULER_INTERVAL)
+            self.wakeup.clear()
+    
+    def tick(self, now=None):
+        """مراجعة واحدة: إيقاف ما يتجاوز عدد النافذة وبدء المهام الجاهزة"""
+        now = now or datetime.now()
+        concurrent = max(1, int(settings_manager.get("concurrent_downloads", 3)))
+        limit = window_limit(settings_manager.get("download_windows", []), now, concurrent)
+        
+        with self.lock:
+            windowed = [job for job in self.jobs.values() if job['windowed'] and job['state'] in (RUNNING, PAUSING)]
+            # خارج النافذة أو أثناء خفض العدد قبل إغلاقها: إيقاف أحدث المهام أولاً
+            running = sorted((job for job in windowed if job['state'] == RUNNING), key=lambda job: job['started_at'])
+            to_pause = running[limit:]
+            for job in to_pause:
+                job['state'] = PAUSING
+            
+            window_slots = limit - len(windowed)
+            active = len(video_downloader.active_downloads)
+            to_start = []
+            for job in self.jobs.values():
+                if job['state'] not in (WAITING, PAUSED) or job['not_before'] > now.timestamp():
+                    continue
+                if job['id'] in video_downloader.active_downloads:
+                    continue
+                if job['windowed']:
+                    if window_slots <= 0:
+                        continue
+                    window_slots -= 1
+                elif active >= concurrent:
+                    continue
+                active += 1
+                job['state'] = RUNNING
+                job['started_at'] = time.time()
+                to_start.append(job)
+        
+        for job in to_pause:
+            logger.info(f"إيقاف تنزيل مجدول مع انتهاء النافذة: {job['url']}")
+            video_downloader.pause_download(job['id'])
+            history_store.save_job(job)
+        for job in to_start:
+            self._start(job)
+    
+    def _start(self, job):
+        history_store.save_job(job)
+        progress_callback, completion_callback = self.callbacks.get(job['id'], (None, None))
+        
+        def completed(download_id, success, result):
+            self._finished(job['id'], success, result, completion_callback)
+        
+        download = video_downloader.download_audio if job['kind'] == 'audio' else video_downloader.download_video
+        download(job['url'], job['quality'], job['output_path'], progress_callback, completed)
+    
+    def _finished(self, job_id, success, result, completion_callback):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            paused = not success and job['state'] == PAUSING
+            if paused:
+                job['state'] = PAUSED
+            else:
+                del self.jobs[job_id]
+                self.callbacks.pop(job_id, None)
+        
+        if paused:
+            history_store.save_job(job)
+        else:
+            history_store.delete_job(job_id)
+            if completion_callback:
+                completion_callback(job_id, success, result)
+        self.wakeup.set()
+
+# إنشاء كائنات عامة
+download_scheduler = DownloadScheduler()
\ No newline at end of file
@@ -2,30 +2,81 @@
 منطق تنزيل الفيديوهات والتحويل
 """
 import os
+import re
+import time
+import hashlib
 import threading
-import subprocess
 from pathlib import Path
 import yt_dlp
-from moviepy.video.io.VideoFileClip import VideoFileClip
-from utils import logger, sanitize_filename, format_file_size, notification_manager
-from config import DOWNLOADS_DIR, TEMP_DIR, SUPPORTED_QUALITIES, AUDIO_QUALITIES
+from yt_dlp.postprocessor import PostProcessor
+from utils import logger, sanitize_filename, format_file_size, notification_manager, settings_manager
+from media_probe import media_probe
+from loudness import loudness_analyzer
+from workers import postprocess_pool
+from retry_policy import retry_policy, classify_error, http_status, FATAL, FORMAT
+from host_scheduler import host_scheduler
+from fragment_downloader import with_parallel_fragments, fragment_options
+from stream_merge import with_streaming_merge, merge_available
+from disk_space import disk_space, estimate_size
+from staging import staging_area
+from output_layout import output_layout
+from history_store import history_store
+from integrity import integrity_checker
+from url_canonical import canonicalize
+from instrumentation import metrics
+from config import DOWNLOADS_DIR, TEMP_DIR, SUPPORTED_QUALITIES, MERGE_QUALITIES, AUDIO_QUALITIES
+
+class DownloadPaused(Exception):
+    """أُوقف التنزيل مؤقتاً؛ الملف الجزئي يبقى في مجلد العمل ليُستأنف منه"""
+
+class ExtractAudioPP(PostProcessor):
+    """استخراج الصوت إلى mp3 في عامل منفصل، مع توحيد المستوى في نفس مرحلة الترميز"""
+    
+    def __init__(self, bitrate, normalize=False, downloader=None):
+        super().__init__(downloader)
+        self.bitrate = bitrate
+        self.normalize = normalize
+    
+    def run(self, info):
+        source = info['filepath']
+        target = f"{os.path.splitext(source)[0]}.mp3"
+        
+        audio_filter = loudness_analyzer.filter_for(source) if self.normalize else None
+        if not audio_filter and source == target and media_probe.matches_audio_target(source, 'mp3', self.bitrate):
+            return [], info
+        
+        # لا يمكن لـ ffmpeg الكتابة فوق ملف الإدخال
+        output = f"{target}.part.mp3" if source == target else target
+        args = ["-i", source, "-vn", "-map", "0:a:0"]
+        if audio_filter:
+            args += ["-af", audio_filter]
+        args += ["-b:a", f"{self.bitrate}k", output]
+        postprocess_pool.run("ffmpeg", args, media_probe.probe(source)['duration'])
+        
+        if output != target:
+            os.replace(output, target)
+        info['filepath'] = target
+        info['ext'] = 'mp3'
+        return ([source] if source != target else []), info
 
 class VideoDownloader:
     """فئة تنزيل الفيديوهات"""
     
     def __init__(self):
         self.active_downloads = {}
-        self.download_history = []
         self.lock = threading.Lock()
     
+    @metrics.timed("metadata.extract")
     def get_video_info(self, url, callback=None):
         """الحصول على معلومات الفيديو"""
         try:
             ydl_opts = {
                 'quiet': True,
                 'no_warnings': True,
+                **retry_policy.ydl_options(),
             }
             
+            host_scheduler.pace(url)
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                 info = ydl.extract_info(url, download=False)
                 
@@ -38,6 +89,8 @@ class VideoDownloader:
                     'thumbnail': info.get('thumbnail', ''),
                     'formats': self._extract_formats(info.get('formats', [])),
                     'url': url,
+                    'id': info.get('id', ''),
+                    'extractor_key': info.get('extractor_key', ''),
                     'platform': info.get('extractor', 'غير معروف')
                 }
                 
@@ -90,9 +143,18 @@ class VideoDownloader:
             'audio': sorted(audio_formats, key=lambda x: int(x['quality'].replace(' kbps', '')) if x['quality'].replace(' kbps', '').isdigit() else 0, reverse=True)
         }
     
-    def download_video(self, url, quality="720p", output_path=None, progress_callback=None, completion_callback=None):
-        """تنزيل فيديو"""
-        download_id = str(hash(url + quality))
+    @staticmethod
+    def job_id(url, quality, kind="video"):
+        """معرف المهمة من الرابط والجودة؛ ثابت بين الجلسات فيُستأنف الملف الجزئي في نفس مجلد العمل"""
+        key = canonicalize(url).key + ("audio" if kind == "audio" else "") + str(quality)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    
+    def download_video(self, url, quality="720p", output_path=None, progress_callback=None, completion_callback=None, bundle=None):
+        """تنزيل فيديو
+        
+        bundle: مهمة من حزمة جلسة (البيانات المستخرجة والصيغة وانتهاء صلاحية روابطها وقالب الإخراج) تبدأ دون استخراج جديد
+        """
+        download_id = self.job_id(url, quality)
         
         if download_id in self.active_downloads:
             notification_manager.notify("التنزيل قيد التشغيل بالفعل", "warning")
@@ -101,7 +163,7 @@ class VideoDownloader:
         # إنشاء thread للتنزيل
         thread = threading.Thread(
             target=self._download_thread,
-            args=(download_id, url, quality, output_path, progress_callback, completion_callback)
+            args=(download_id, url, quality, output_path, progress_callback, completion_callback, bundle)
         )
         
         self.active_downloads[download_id] = {
@@ -110,27 +172,38 @@ class VideoDownloader:
             'progress': 0,
             'url': url,
             'quality': quality,
-            'paused': False
+            'paused': False,
+            'type': 'video',
+            'preset': quality,
+            'output_path': output_path,
+            'output_template': (bundle or {}).get('output_template')
         }
         
         thread.start()
         return download_id
     
-    def _download_thread(self, download_id, url, quality, output_path, progress_callback, completion_callback):
+    @metrics.job("download.video")
+    def _download_thread(self, download_id, url, quality, output_path, progress_callback, completion_callback, bundle=None):
         """Thread تنزيل الفيديو"""
+        paused = False
         try:
             if not output_path:
                 output_path = DOWNLOADS_DIR
             
             Path(output_path).mkdir(parents=True, exist_ok=True)
+            staging_dir = staging_area.create(download_id)
             
+            @metrics.timed("download.progress_hook")
             def progress_hook(d):
                 if download_id not in self.active_downloads:
                     return
+                if self.active_downloads[download_id].get('paused'):
+                    raise DownloadPaused()
                 
                 if d['status'] == 'downloading':
                     downloaded = d.get('downloaded_bytes', 0)
                     total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
+                    self._track_disk_usage(download_id, d)
                     
                     if total > 0:
                         progress = int((downloaded / total) * 100)
@@ -146,9 +219,10 @@ class VideoDownloader:
             
             # إعداد خيارات التنزيل
             ydl_opts = {
-                'format': SUPPORTED_QUALITIES.get(quality, 'best'),
-                'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
+                'format': self._format_spec(quality),
+                'outtmpl': os.path.join(staging_dir, '%(id)s.%(ext)s'),
                 'progress_hooks': [progress_hook],
+                'postprocessor_hooks': [metrics.postprocessor_hook()],
                 'noplaylist': True,
                 'extractaudio': False,
             }
@@ -156,26 +230,39 @@ class VideoDownloader:
             # بدء التنزيل
             self.active_downloads[download_id]['status'] = 'downloading'
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                
-                # إضافة إلى السجل
-                download_record = {
-                    'title': info.get('title', 'فيديو بدون عنوان'),
-                    'url': url,
-                    'quality': quality,
-                    'filename': self.active_downloads[download_id].get('filename', ''),
-                    'download_date': str(Path().cwd()),
-                    'status': 'completed'
-                }
-                
-                self.download_history.append(download_record)
-                
-                if completion_callback:
-                    completion_callback(download_id, True, download_record)
-                
-                notification_manager.notify(f"تم تنزيل: {download_record['title']}", "success")
-                
+            info = self._run_download(download_id, url, ydl_opts, max_height=self._max_height(quality), bundle=bundle)
+            self._record_merge(download_id, info)
+            filename = self._commit_files(download_id, info, output_path)
+            
+            # إضافة إلى السجل
+            download_record = {
+                'title': info.get('title', 'فيديو بدون عنوان'),
+                'url': canonicalize(url).url,
+                'video_id': info.get('id'),
+                'platform': info.get('extractor_key'),
+                'kind': 'video',
+                'quality': quality,
+                'filename': filename,
+                'thumbnail': info.get('thumbnail', ''),
+                'downloaded_at': time.time(),
+                'retries': self.active_downloads[download_id].get('retry_count', 0),
+                'status': 'completed'
+            }
+            
+            history_store.add(download_record)
+            integrity_checker.submit(filename, info)
+            
+            if completion_callback:
+                completion_callback(download_id, True, download_record)
+            
+            notification_manager.notify(f"تم تنزيل: {download_record['title']}", "success")
+        
+        except DownloadPaused:
+            paused = True
+            logger.info(f"تم إيقاف التنزيل مؤقتاً: {url}")
+            if completion_callback:
+                completion_callback(download_id, False, "تم إيقاف التنزيل مؤقتاً")
+        
         except Exception as e:
             error_msg = f"خطأ في التنزيل: {str(e)}"
             logger.error(error_msg)
@@ -190,20 +277,22 @@ class VideoDownloader:
             notification_manager.notify(error_msg, "error")
         
         finally:
-            # تنظيف
+            # تنظيف؛ مجلد عمل التنزيل الموقوف يبقى ليُستأنف منه
+            if not paused:
+                staging_area.discard(download_id)
             if download_id in self.active_downloads:
                 del self.active_downloads[download_id]
     
-    def download_audio(self, url, quality="192", output_path=None, progress_callback=None, completion_callback=None):
+    def download_audio(self, url, quality="192", output_path=None, progress_callback=None, completion_callback=None, bundle=None):
         """تنزيل الصوت فقط"""
-        download_id = str(hash(url + "audio" + quality))
+        download_id = self.job_id(url, quality, "audio")
         
         if download_id in self.active_downloads:
             return download_id
         
         thread = threading.Thread(
             target=self._download_audio_thread,
-            args=(download_id, url, quality, output_path, progress_callback, completion_callback)
+            args=(download_id, url, quality, output_path, progress_callback, completion_callback, bundle)
         )
         
         self.active_downloads[download_id] = {
@@ -212,27 +301,37 @@ class VideoDownloader:
             'progress': 0,
             'url': url,
             'quality': f"{quality} kbps",
-            'type': 'audio'
+            'type': 'audio',
+            'preset': quality,
+            'output_path': output_path,
+            'output_template': (bundle or {}).get('output_template')
         }
         
         thread.start()
         return download_id
     
-    def _download_audio_thread(self, download_id, url, quality, output_path, progress_callback, completion_callback):
+    @metrics.job("download.audio")
+    def _download_audio_thread(self, download_id, url, quality, output_path, progress_callback, completion_callback, bundle=None):
         """Thread تنزيل الصوت"""
+        paused = False
         try:
             if not output_path:
                 output_path = DOWNLOADS_DIR / "audio"
             
             Path(output_path).mkdir(parents=True, exist_ok=True)
+            staging_dir = staging_area.create(download_id)
             
+            @metrics.timed("download.progress_hook")
             def progress_hook(d):
                 if download_id not in self.active_downloads:
                     return
+                if self.active_downloads[download_id].get('paused'):
+                    raise DownloadPaused()
                 
                 if d['status'] == 'downloading':
                     downloaded = d.get('downloaded_bytes', 0)
                     total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
+                    self._track_disk_usage(download_id, d)
                     
                     if total > 0:
                         progress = int((downloaded / total) * 100)
@@ -243,36 +342,50 @@ class VideoDownloader:
             
             ydl_opts = {
                 'format': 'bestaudio/best',
-                'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
+                'outtmpl': os.path.join(staging_dir, '%(id)s.%(ext)s'),
                 'progress_hooks': [progress_hook],
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': quality,
-                }],
+                'postprocessor_hooks': [metrics.postprocessor_hook()],
                 'noplaylist': True,
             }
             
             self.active_downloads[download_id]['status'] = 'downloading'
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                
-                download_record = {
-                    'title': info.get('title', 'صوت بدون عنوان'),
-                    'url': url,
-                    'quality': f"{quality} kbps",
-                    'type': 'audio',
-                    'status': 'completed'
-                }
-                
-                self.download_history.append(download_record)
-                
-                if completion_callback:
-                    completion_callback(download_id, True, download_record)
-                
-                notification_manager.notify(f"تم تنزيل الصوت: {download_record['title']}", "success")
-                
+            normalize = settings_manager.get("normalize_audio", False)
+            info = self._run_download(
+                download_id, url, ydl_opts, audio_only=True, bundle=bundle,
+                setup=lambda ydl: ydl.add_post_processor(ExtractAudioPP(quality, normalize), when='post_process')
+            )
+            filename = self._commit_files(download_id, info, output_path)
+            
+            download_record = {
+                'title': info.get('title', 'صوت بدون عنوان'),
+                'url': canonicalize(url).url,
+                'video_id': info.get('id'),
+                'platform': info.get('extractor_key'),
+                'kind': 'audio',
+                'quality': f"{quality} kbps",
+                'filename': filename,
+                'thumbnail': info.get('thumbnail', ''),
+                'downloaded_at': time.time(),
+                'retries': self.active_downloads[download_id].get('retry_count', 0),
+                'status': 'completed'
+            }
+            
+            history_store.add(download_record)
+            # الملف حُوِّل بعد التنزيل فلا يقابل بايتات المصدر
+            integrity_checker.submit(filename, info, copied=False)
+            
+            if completion_callback:
+                completion_callback(download_id, True, download_record)
+            
+            notification_manager.notify(f"تم تنزيل الصوت: {download_record['title']}", "success")
+        
+        except DownloadPaused:
+            paused = True
+            logger.info(f"تم إيقاف التنزيل مؤقتاً: {url}")
+            if completion_callback:
+                completion_callback(download_id, False, "تم إيقاف التنزيل مؤقتاً")
+        
         except Exception as e:
             error_msg = f"خطأ في تنزيل الصوت: {str(e)}"
             logger.error(error_msg)
@@ -283,9 +396,206 @@ class VideoDownloader:
             notification_manager.notify(error_msg, "error")
         
         finally:
+            if not paused:
+                staging_area.discard(download_id)
             if download_id in self.active_downloads:
                 del self.active_downloads[download_id]
     
+    def _commit_files(self, download_id, info, output_path):
+        """نقل الملفات المكتملة من مجلد العمل إلى مجلد الإخراج"""
+        staged = [download.get('filepath') for download in info.get('requested_downloads') or []]
+        if not any(staged):
+            staged = [info.get('filepath') or self.active_downloads[download_id].get('filename')]
+        
+        committed = None
+        for path in staged:
+            if path and os.path.exists(path):
+                # الاسم النهائي من قالب الإخراج؛ مجلد العمل يستخدم معرف الفيديو فقط
+                destination = output_layout.destination(
+                    output_path, info, Path(path).suffix,
+                    self.active_downloads[download_id].get('output_template')
+                )
+                try:
+                    committed = staging_area.commit(path, destination)
+                except Exception:
+                    output_layout.release(destination)
+                    raise
+                output_layout.committed(committed)
+        if committed is None:
+            raise RuntimeError("لم يُعثر على الملف المكتمل")
+        
+        self.active_downloads[download_id]['filename'] = str(committed)
+        return str(committed)
+    
+    def _run_download(self, download_id, url, ydl_opts, **kwargs):
+        """تنزيل ضمن حد الاتصالات المتزامنة للموقع"""
+        job = self.active_downloads[download_id]
+        with host_scheduler.connection(
+            url,
+            on_wait=lambda: job.update(status='queued'),
+            cancelled=lambda: download_id not in self.active_downloads
+        ):
+            info = self._download_with_retries(download_id, url, ydl_opts, **kwargs)
+        host_scheduler.report_success(url)
+        return info
+    
+    def _download_with_retries(self, download_id, url, ydl_opts, setup=None, audio_only=False, max_height=None, bundle=None):
+        """تنزيل مع إعادة المحاولة حسب صنف الخطأ والانتقال إلى صيغ بديلة من قائمة formats
+        
+        مهمة الحزمة تبدأ بالبيانات المضمنة وصيغتها؛ يُعاد الاستخراج مرة واحدة بالجودة المطلوبة فقط
+        إن رُفضت الصيغة أو انتهت صلاحية روابطها.
+        """
+        job = self.active_downloads[download_id]
+        state = retry_policy.start()
+        job['retries'] = state.history
+        primary_format = ydl_opts['format']
+        bundle = bundle or {}
+        info = bundle.get('info')
+        format_spec = bundle.get('format_id') or primary_format
+        failed_formats = set()
+        # صيغ HLS/DASH تُنزَّل أجزاؤها بالتوازي، والفيديو والصوت المنفصلان يُدمجان أثناء التنزيل
+        ydl_class = with_streaming_merge(with_parallel_fragments(yt_dlp.YoutubeDL))
+        
+        try:
+            while True:
+                if job.get('paused'):
+                    raise DownloadPaused()
+                try:
+                    with ydl_class({**retry_policy.ydl_options(), **fragment_options(), **ydl_opts, 'format': format_spec}) as ydl:
+                        if setup:
+                            setup(ydl)
+                        if info is None:
+                            # الاستخراج مرة واحدة؛ المحاولات التالية تعيد استخدام قائمة الصيغ
+                            host_scheduler.pace(url)
+                            info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+                        # للتصدير في حزمة جلسة
+                        job['info'] = info
+                        if 'reservation' not in job:
+                            job['reservation'] = self._reserve_space(download_id, info, ydl_opts['outtmpl'])
+                        job['status'] = 'downloading'
+                        return ydl.process_ie_result(ydl.sanitize_info(info), download=True)
+            
+                except DownloadPaused:
+                    raise
+                except Exception as e:
+                    error_class = classify_error(e)
+                    if http_status(e) in (403, 429):
+                        host_scheduler.report_throttled(url)
+                    if bundle and download_id in self.active_downloads and (
+                            error_class == FORMAT or bundle.get('expires_at', 0) <= time.time()):
+                        # الصيغة في الحزمة لم تعد متاحة أو انتهت صلاحية روابطها؛ الأخطاء الأخرى تُعاد كالمعتاد
+                        state.record(error_class, f"إعادة الاستخراج بدل بيانات الحزمة: {e}", 0, primary_format)
+                        job['retry_count'] = len(state.history)
+                        logger.warning(f"تعذر التنزيل ببيانات الحزمة، إعادة الاستخراج: {e}")
+                        bundle, info, format_spec = {}, None, primary_format
+                        continue
+                    if error_class == FATAL or download_id not in self.active_downloads:
+                        raise
+                
+                    delay = None if error_class == FORMAT else state.next_delay(error_class)
+                    if delay is None:
+                        # رابط الصيغة مرفوض أو نفدت ميزانية الصنف: الانتقال إلى صيغة بديلة
+                        current = (info or {}).get('format_id') if format_spec == primary_format else format_spec
+                        failed_formats.update(str(current).split('+'))
+                        alternate = self._alternate_format(info, failed_formats, audio_only, max_height)
+                        if alternate is None or state.next_delay(FORMAT) is None:
+                            raise
+                        format_spec, delay = alternate, 0
+                        job['format'] = alternate
+                    
+                    state.record(error_class, str(e), delay, format_spec)
+                    job['retry_count'] = len(state.history)
+                    job['status'] = 'retrying'
+                    logger.warning(f"إعادة محاولة التنزيل ({error_class}) بعد {delay:.1f} ثانية: {e}")
+                    
+                    if not self._backoff(download_id, delay):
+                        raise
+        finally:
+            reservation = job.pop('reservation', None)
+            if reservation:
+                reservation.release()
+    
+    def _reserve_space(self, download_id, info, outtmpl):
+        """حجز المساحة المتوقعة؛ يبقى التنزيل في الطابور إن كانت الوحدة ممتلئة بالحجوزات"""
+        job = self.active_downloads[download_id]
+        return disk_space.reserve(
+            os.path.dirname(outtmpl) or ".",
+            estimate_size(info),
+            on_wait=lambda: job.update(status='waiting_space'),
+            cancelled=lambda: download_id not in self.active_downloads
+        )
+    
+    def _track_disk_usage(self, download_id, d):
+        """تحديث الحجز بما كُتب، والحجز المسبق لكل ملف جزئي عند ظهوره"""
+        job = self.active_downloads.get(download_id)
+        reservation = job.get('reservation') if job else None
+        filename = d.get('tmpfilename') or d.get('filename')
+        if reservation is None or not filename:
+            return
+        
+        if filename not in reservation.written:
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            if total and os.path.exists(filename) and disk_space.preallocate(filename, int(total)):
+                reservation.mark_preallocated(filename, int(total))
+        reservation.update(filename, d.get('downloaded_bytes', 0))
+    
+    def _backoff(self, download_id, delay):
+        """الانتظار قبل إعادة المحاولة؛ يعيد False إن أُلغي التنزيل أثناء الانتظار"""
+        deadline = time.monotonic() + delay
+        while download_id in self.active_downloads:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            time.sleep(min(0.25, remaining))
+        return False
+    
+    def _record_merge(self, download_id, info):
+        """إحصاءات دمج الفيديو والصوت في بيانات المهمة"""
+        for download in info.get('requested_downloads') or []:
+            stats = download.get('merge_stats')
+            if stats and download_id in self.active_downloads:
+                self.active_downloads[download_id]['merge'] = stats
+                if stats['mode'] == 'streaming':
+                    logger.info(
+                        f"دمج أثناء التنزيل: {format_file_size(stats['bytes'])} بمعدل {stats['mb_per_second']} MB/s، "
+                        f"{stats['after_download_seconds']} ثانية بعد اكتمال التنزيل"
+                    )
+    
+    @staticmethod
+    def _format_spec(quality):
+        """صيغة yt-dlp للجودة: أفضل فيديو وأفضل صوت منفصلين إن توفر ffmpeg، وإلا صيغة واحدة"""
+        single = SUPPORTED_QUALITIES.get(quality, 'best')
+        merged = MERGE_QUALITIES.get(quality)
+        if merged and merge_available():
+            return f"{merged}/{single}"
+        return single
+    
+    @staticmethod
+    def _max_height(quality):
+        """أقصى ارتفاع في مواصفة الجودة (إن وجد)"""
+        match = re.search(r"height<=(\d+)", SUPPORTED_QUALITIES.get(quality, ''))
+        return int(match.group(1)) if match else None
+    
+    @staticmethod
+    def _alternate_format(info, failed_formats, audio_only=False, max_height=None):
+        """أفضل صيغة بديلة لم تفشل بعد من قائمة الصيغ المستخرجة"""
+        formats = (info or {}).get('formats') or []
+        if audio_only:
+            candidates = [fmt for fmt in formats if fmt.get('acodec') != 'none']
+            key = lambda fmt: (fmt.get('vcodec') == 'none', fmt.get('abr') or fmt.get('tbr') or 0)
+        else:
+            candidates = [
+                fmt for fmt in formats
+                if fmt.get('vcodec') != 'none' and fmt.get('acodec') != 'none'
+                and (not max_height or (fmt.get('height') or 0) <= max_height)
+            ]
+            key = lambda fmt: (fmt.get('height') or 0, fmt.get('tbr') or 0)
+        
+        for fmt in sorted(candidates, key=key, reverse=True):
+            if fmt.get('format_id') not in failed_formats:
+                return fmt['format_id']
+        return None
+    
     def pause_download(self, download_id):
         """إيقاف مؤقت للتنزيل"""
         if download_id in self.active_downloads:
@@ -321,7 +631,7 @@ class VideoConverter:
     def __init__(self):
         self.active_conversions = {}
     
-    def video_to_audio(self, video_path, output_path=None, quality="192", progress_callback=None, completion_callback=None):
+    def video_to_audio(self, video_path, output_path=None, quality="192", progress_callback=None, completion_callback=None, normalize=None):
         """تحويل فيديو إلى صوت"""
         conversion_id = str(hash(video_path + str(quality)))
         
@@ -330,7 +640,7 @@ class VideoConverter:
         
         thread = threading.Thread(
             target=self._convert_thread,
-            args=(conversion_id, video_path, output_path, quality, progress_callback, completion_callback)
+            args=(conversion_id, video_path, output_path, quality, progress_callback, completion_callback, normalize)
         )
         
         self.active_conversions[conversion_id] = {
@@ -343,43 +653,65 @@ class VideoConverter:
         thread.start()
         return conversion_id
     
-    def _convert_thread(self, conversion_id, video_path, output_path, quality, progress_callback, completion_callback):
+    @metrics.job("convert")
+    def _convert_thread(self, conversion_id, video_path, output_path, quality, progress_callback, completion_callback, normalize=None):
         """Thread تحويل الفيديو"""
         try:
             if not output_path:
                 output_path = Path(video_path).parent / "audio" / f"{Path(video_path).stem}.mp3"
             
             Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+            staged_output = staging_area.create(conversion_id) / Path(output_path).name
             
             self.active_conversions[conversion_id]['status'] = 'converting'
             
-            # تحويل باستخدام moviepy
-            video = VideoFileClip(video_path)
-            audio = video.audio
+            def report(fraction):
+                if conversion_id in self.active_conversions:
+                    progress = int(fraction * 100)
+                    self.active_conversions[conversion_id]['progress'] = progress
+                    
+                    if progress_callback:
+                        progress_callback(conversion_id, progress)
             
-            def progress_callback_wrapper(get_progress):
-                try:
-                    if conversion_id in self.active_conversions:
-                        progress = int(get_progress * 100)
-                        self.active_conversions[conversion_id]['progress'] = progress
-                        
-                        if progress_callback:
-                            progress_callback(conversion_id, progress)
-                except:
-                    pass
-            
-            # حفظ الصوت
-            audio.write_audiofile(
-                str(output_path),
-                bitrate=f"{quality}k",
-                verbose=False,
-                logger=None
-            )
+            # الترميز في عامل منفصل حتى لا ينافس واجهة المستخدم
+            duration = media_probe.probe(video_path)['duration']
+            
+            # توحيد مستوى الصوت: القياس من الذاكرة أو في عامل، ثم تطبيق الكسب أثناء الترميز
+            if normalize is None:
+                normalize = settings_manager.get("normalize_audio", False)
+            audio_filter = loudness_analyzer.filter_for(video_path) if normalize else None
             
-            # تنظيف
-            audio.close()
-            video.close()
+            if audio_filter:
+                postprocess_pool.run(
+                    "ffmpeg",
+                    ["-i", str(video_path), "-vn", "-map", "0:a:0", "-af", audio_filter,
+                     "-b:a", f"{quality}k", str(staged_output)],
+                    duration, progress_callback=report
+                )
+                self.active_conversions[conversion_id]['normalized'] = True
+            # الصوت المصدر بنفس الترميز ومعدل البت: نسخ المسار دون إعادة ترميز
+            elif media_probe.matches_audio_target(video_path, 'mp3', quality):
+                postprocess_pool.run(
+                    "ffmpeg",
+                    ["-i", str(video_path), "-vn", "-map", "0:a:0", "-c:a", "copy", str(staged_output)],
+                    duration, progress_callback=report
+                )
+                self.active_conversions[conversion_id]['stream_copy'] = True
+            else:
+                # تحويل باستخدام moviepy
+                postprocess_pool.run(
+                    "moviepy_audio", str(video_path), str(staged_output), f"{quality}k",
+                    progress_callback=report
+                )
             
+            # لا يُستبدل ملف موجود بنفس الاسم
+            output_path = output_layout.claim(output_path)
+            try:
+                staging_area.commit(staged_output, output_path)
+            except Exception:
+                output_layout.release(output_path)
+                raise
+            output_layout.committed(output_path)
             self.active_conversions[conversion_id]['status'] = 'completed'
             self.active_conversions[conversion_id]['output_file'] = str(output_path)
             
@@ -398,6 +730,7 @@ class VideoConverter:
             notification_manager.notify(error_msg, "error")
         
         finally:
+            staging_area.discard(conversion_id)
             if conversion_id in self.active_conversions:
                 del self.active_conversions[conversion_id]
 
@@ -0,0 +1,106 @@
+"""
+تنزيل صيغ HLS/DASH المقسمة: عدة أجزاء في نفس الوقت مع كتابتها بالترتيب عبر نافذة محدودة
+"""
+from collections import deque
+from functools import lru_cache
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from yt_dlp.downloader import get_suitable_downloader
+from yt_dlp.downloader.hls import HlsFD
+from yt_dlp.downloader.dash import DashSegmentsFD
+from utils import settings_manager
+from config import FRAGMENT_WORKERS, FRAGMENT_REORDER_WINDOW, FRAGMENT_FULL_HEIGHT
+
+class BoundedExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor بنافذة محدودة في map
+    
+    map العادي يرسل كل الأجزاء دفعة واحدة، فيتقدم التنزيل بلا حد خلف جزء بطيء
+    وتتراكم الأجزاء المكتملة على القرص بانتظار كتابتها. هنا لا يتجاوز عدد الأجزاء
+    قيد التنزيل أو بانتظار الكتابة window، والنتائج تعود بالترتيب.
+    """
+    
+    def __init__(self, max_workers, window=FRAGMENT_REORDER_WINDOW):
+        super().__init__(max_workers, thread_name_prefix="fragment")
+        self.window = max(window, max_workers)
+    
+    def map(self, fn, *iterables, timeout=None, chunksize=1):
+        tasks = zip(*iterables)
+        pending = deque(self.submit(fn, *args) for args in islice(tasks, self.window))
+        
+        def results():
+            try:
+                while pending:
+                    result = pending.popleft().result(timeout)
+                    # جزء جديد مكان الجزء المكتمل قبل كتابته، حتى لا تتوقف العمال أثناء الكتابة
+                    for args in islice(tasks, 1):
+                        pending.append(self.submit(fn, *args))
+                    yield result
+            finally:
+                for future in pending:
+                    future.cancel()
+        
+        return results()
+
+def fragment_workers(info, limit):
+    """عدد الأجزاء المتزامنة حسب جودة الصيغة: الدقة العالية أجزاؤها أكبر وتستفيد أكثر"""
+    if (info.get('height') or 0) >= FRAGMENT_FULL_HEIGHT:
+        return max(1, limit)
+    return max(1, limit // 2)
+
+class ParallelFragmentsMixin:
+    """تمرير BoundedExecutor إلى download_and_append_fragments في yt-dlp
+    
+    yt-dlp يكتب كل جزء في ملف مؤقت ثم يلحقه بالملف الجزئي بالترتيب، فلا يبقى في الذاكرة
+    إلا جزء واحد؛ المنفذ المحدود يحدد عدد الأجزاء المنتظرة على القرص.
+    """
+    
+    def download_and_append_fragments(self, ctx, fragments, info_dict, *, tpe=None, **kwargs):
+        limit = self.params.get('concurrent_fragment_downloads', 1)
+        # البث المباشر وتنزيل عدة صيغ معاً (tpe ممرر) يبقيان على سلوك yt-dlp
+        if tpe is None and limit > 1 and not info_dict.get('is_live'):
+            tpe = BoundedExecutor(fragment_workers(info_dict, limit))
+        return super().download_and_append_fragments(ctx, fragments, info_dict, tpe=tpe, **kwargs)
+
+class ParallelHlsFD(ParallelFragmentsMixin, HlsFD):
+    pass
+
+class ParallelDashFD(ParallelFragmentsMixin, DashSegmentsFD):
+    pass
+
+PARALLEL_DOWNLOADERS = {
+    HlsFD: ParallelHlsFD,
+    DashSegmentsFD: ParallelDashFD,
+}
+
+def fragment_options():
+    """خيارات yt-dlp لتنزيل الأجزاء بالتوازي حسب الإعدادات"""
+    workers = int(settings_manager.get("fragment_workers", FRAGMENT_WORKERS))
+    return {'concurrent_fragment_downloads': max(1, workers)}
+
+@lru_cache(maxsize=None)
+def with_parallel_fragments(base):
+    """صنف مشتق من base يستخدم المنزلات المتوازية لصيغ HLS/DASH
+    
+    الاشتقاق من الصنف الممرر (وليس من yt_dlp.YoutubeDL مباشرة) يحافظ على
+    أي صنف بديل، مثل صنف مجموعة القياس.
+    """
+    class ParallelFragmentsYoutubeDL(base):
+        def dl(self, name, info, subtitle=False, test=False):
+            if test or not info.get('url'):
+                return super().dl(name, info, subtitle, test)
+            downloader = PARALLEL_DOWNLOADERS.get(
+                get_suitable_downloader(info, self.params, to_stdout=(name == '-'))
+            )
+            if downloader is None:
+                return super().dl(name, info, subtitle, test)
+            
+            fd = downloader(self, self.params)
+            for hook in self._progress_hooks:
+                fd.add_progress_hook(hook)
+            self.write_debug(f'Invoking {fd.FD_NAME} downloader on "{info["url"]}"')
+            new_info = self._copy_infodict(info)
+            if new_info.get('http_headers') is None:
+                new_info['http_headers'] = self._calc_headers(new_info)
+            return fd.download(name, new_info, subtitle)
+    
+    return ParallelFragmentsYoutubeDL
\ No newline at end of file
@@ -0,0 +1,408 @@
+"""
+سجل التنزيلات الدائم في SQLite: كتابة مجمّعة من threads العمل، صفحات للعرض، وسياسة احتفاظ
+"""
+import time
+import queue
+import sqlite3
+import threading
+from collections import deque
+from utils import logger
+from config import (
+    HISTORY_DB, HISTORY_BATCH_SIZE, HISTORY_FLUSH_INTERVAL,
+    HISTORY_PAGE_SIZE, HISTORY_RETENTION_DAYS, HISTORY_MAX_ENTRIES
+)
+
+COLUMNS = (
+    "url", "video_id", "platform", "kind", "title", "quality",
+    "filename", "thumbnail", "retries", "status", "downloaded_at"
+)
+
+JOB_COLUMNS = (
+    "id", "kind", "url", "quality", "output_path",
+    "not_before", "windowed", "state", "created_at"
+)
+
+FEED_COLUMNS = (
+    "id", "url", "title", "kind", "quality", "windowed", "high_water",
+    "etag", "last_modified", "conditional", "last_polled", "next_poll", "failures", "created_at"
+)
+
+INTEGRITY_COLUMNS = ("path", "size", "chunk_size", "digests", "source", "status", "verified_at")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    video_id TEXT,
+    platform TEXT,
+    kind TEXT NOT NULL DEFAULT 'video',
+    title TEXT,
+    quality TEXT,
+    filename TEXT,
+    thumbnail TEXT,
+    retries INTEGER NOT NULL DEFAULT 0,
+    status TEXT,
+    downloaded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_downloads_url ON downloads (url);
+CREATE INDEX IF NOT EXISTS idx_downloads_video ON downloads (platform, video_id);
+CREATE INDEX IF NOT EXISTS idx_downloads_date ON downloads (downloaded_at, id);
+CREATE INDEX IF NOT EXISTS idx_downloads_platform ON downloads (platform, downloaded_at);
+CREATE INDEX IF NOT EXISTS idx_downloads_filename ON downloads (filename);
+CREATE TABLE IF NOT EXISTS scheduled_jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL DEFAULT 'video',
+    url TEXT NOT NULL,
+    quality TEXT,
+    output_path TEXT,
+    not_before REAL NOT NULL DEFAULT 0,
+    windowed INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'waiting',
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS feeds (
+    id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    title TEXT,
+    kind TEXT NOT NULL DEFAULT 'video',
+    quality TEXT,
+    windowed INTEGER NOT NULL DEFAULT 0,
+    high_water TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    conditional INTEGER NOT NULL DEFAULT 1,
+    last_polled REAL,
+    next_poll REAL NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS feed_items (
+    feed_id TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (feed_id, video_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS file_integrity (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    digests BLOB NOT NULL,
+    source TEXT,
+    status TEXT NOT NULL,
+    verified_at REAL NOT NULL
+);
+"""
+
+class HistoryStore:
+    """سجل التنزيلات؛ الكتابة في thread واحد والقراءة من اتصال منفصل (وضع WAL)"""
+    
+    def __init__(self, path=HISTORY_DB):
+        self.path = str(path)
+        self.queue = queue.Queue()
+        self.pending = deque()  # سجلات في الطابور لم تُكتب بعد (بنفس ترتيب الطابور)
+        self.lock = threading.Lock()
+        self.reader = None
+        self.writer = None
+    
+    def _connect(self, **kwargs):
+        connection = sqlite3.connect(self.path, timeout=30, **kwargs)
+        connection.row_factory = sqlite3.Row
+        # يجب ضبط auto_vacuum قبل إنشاء الجداول حتى يمكن ضغط الملف لاحقاً
+        connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        return connection
+    
+    def _start(self):
+        """تشغيل thread الكتابة عند أول استخدام"""
+        with self.lock:
+            if self.writer is not None:
+                return
+            connection = self._connect(check_same_thread=False)
+            connection.executescript(SCHEMA)
+            connection.commit()
+            self.writer = threading.Thread(target=self._write_loop, args=(connection,), name="history-writer", daemon=True)
+            self.writer.start()
+    
+    def _read(self, sql, parameters=()):
+        self._start()
+        with self.lock:
+            if self.reader is None:
+                self.reader = self._connect(check_same_thread=False)
+            return [dict(row) for row in self.reader.execute(sql, parameters).fetchall()]
+    
+    # ---- الكتابة ----
+    
+    def add(self, record):
+        """إضافة سجل دون انتظار؛ يُكتب مع غيره في معاملة واحدة"""
+        self._start()
+        record = {column: record.get(column) for column in COLUMNS}
+        record['kind'] = record['kind'] or 'video'
+        record['retries'] = record['retries'] or 0
+        record['downloaded_at'] = record['downloaded_at'] or time.time()
+        with self.lock:
+            self.pending.append(record)
+            self.queue.put(record)
+    
+    def _write_loop(self, connection):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + HISTORY_FLUSH_INTERVAL
+            while len(batch) < HISTORY_BATCH_SIZE and batch[-1] is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            
+            try:
+                self._write_batch(connection, batch)
+            except sqlite3.Error as e:
+                logger.error(f"خطأ في كتابة سجل التنزيلات: {e}")
+            finally:
+                with self.lock:
+                    for _ in range(sum(isinstance(item, dict) for item in batch)):
+                        self.pending.popleft()
+                for _ in batch:
+                    self.queue.task_done()
+            
+            if batch[-1] is None:
+                connection.close()
+                break
+    
+    def _write_batch(self, connection, batch):
+        """السجلات المتتالية بـ executemany، والمهام (الاحتفاظ والضغط) بترتيبها"""
+        records = []
+        placeholders = ", ".join("?" * len(COLUMNS))
+        insert = f"INSERT INTO downloads ({', '.join(COLUMNS)}) VALUES ({placeholders})"
+        
+        with connection:
+            for item in batch:
+                if isinstance(item, dict):
+                    records.append(tuple(item[column] for column in COLUMNS))
+                    continue
+                if records:
+                    connection.executemany(insert, records)
+                    records = []
+                if callable(item):
+                    item(connection)
+            if records:
+                connection.executemany(insert, records)
+    
+    def flush(self):
+        """انتظار كتابة كل السجلات في الطابور"""
+        if self.writer is not None:
+            self.queue.join()
+    
+    # ---- الاستعلام ----
+    
+    def page(self, limit=HISTORY_PAGE_SIZE, before=None, platform=None):
+        """صفحة من السجل من الأحدث إلى الأقدم
+        
+        before هو (downloaded_at, id) لآخر سجل في الصفحة السابقة؛ الانتقال بالمفتاح
+        بدلاً من OFFSET يبقي زمن الصفحة ثابتاً مهما كبر السجل.
+        """
+        conditions, parameters = [], []
+        if platform:
+            conditions.append("platform = ?")
+            parameters.append(platform)
+        if before:
+            conditions.append("(downloaded_at, id) < (?, ?)")
+            parameters.extend(before)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._read(
+            f"SELECT * FROM downloads {where} ORDER BY downloaded_at DESC, id DESC LIMIT ?",
+            (*parameters, limit)
+        )
+    
+    def count(self, platform=None):
+        if platform:
+            rows = self._read("SELECT COUNT(*) AS n FROM downloads WHERE platform = ?", (platform,))
+        else:
+            rows = self._read("SELECT COUNT(*) AS n FROM downloads")
+        return rows[0]['n']
+    
+    def find(self, url=None, video_id=None, platform=None, kind=None, filename=None):
+        """آخر تنزيل لنفس الرابط أو لنفس معرف الفيديو على المنصة أو لنفس مسار الملف (بحث بالفهرس)"""
+        with self.lock:
+            for record in reversed(self.pending):
+                if kind and record['kind'] != kind:
+                    continue
+                if (url and record['url'] == url) or (
+                    video_id and record['video_id'] == video_id and record['platform'] == platform
+                ) or (filename and record['filename'] == filename):
+                    return dict(record)
+        
+        kind_condition = " AND kind = ?" if kind else ""
+        kind_parameters = (kind,) if kind else ()
+        if url:
+            rows = self._read(
+                f"SELECT * FROM downloads WHERE url = ?{kind_condition} ORDER BY id DESC LIMIT 1",
+                (url, *kind_parameters)
+            )
+            if rows:
+                return rows[0]
+        if video_id:
+            rows = self._read(
+                f"SELECT * FROM downloads WHERE platform = ? AND video_id = ?{kind_condition} ORDER BY id DESC LIMIT 1",
+                (platform, video_id, *kind_parameters)
+            )
+            if rows:
+                return rows[0]
+        if filename:
+            rows = self._read(
+                f"SELECT * FROM downloads WHERE filename = ?{kind_condition} ORDER BY id DESC LIMIT 1",
+                (filename, *kind_parameters)
+            )
+            if rows:
+                return rows[0]
+        return None
+    
+    # ---- المهام المجدولة ----
+    
+    def save_job(self, job):
+        """حفظ مهمة مجدولة أو تحديث حالتها (في thread الكتابة بترتيب الطابور)"""
+        row = tuple(job.get(column) for column in JOB_COLUMNS)
+        placeholders = ", ".join("?" * len(JOB_COLUMNS))
+        
+        def save(connection):
+            connection.execute(
+                f"INSERT OR REPLACE INTO scheduled_jobs ({', '.join(JOB_COLUMNS)}) VALUES ({placeholders})", row
+            )
+        
+        self._start()
+        self.queue.put(save)
+    
+    def delete_job(self, job_id):
+        self._start()
+        self.queue.put(lambda connection: connection.execute("DELETE FROM scheduled_jobs WHERE id = ?", (job_id,)))
+    
+    def scheduled_jobs(self):
+        """المهام المجدولة المحفوظة بترتيب إضافتها"""
+        self.flush()
+        return self._read(f"SELECT {', '.join(JOB_COLUMNS)} FROM scheduled_jobs ORDER BY created_at, id")
+    
+    # ---- الاشتراكات ----
+    
+    def save_feed(self, feed):
+        """حفظ اشتراك أو تحديث حالة استطلاعه"""
+        row = tuple(feed.get(column) for column in FEED_COLUMNS)
+        placeholders = ", ".join("?" * len(FEED_COLUMNS))
+        
+        def save(connection):
+            connection.execute(
+                f"INSERT OR REPLACE INTO feeds ({', '.join(FEED_COLUMNS)}) VALUES ({placeholders})", row
+            )
+        
+        self._start()
+        self.queue.put(save)
+    
+    def delete_feed(self, feed_id):
+        """حذف اشتراك مع معرفات عناصره"""
+        def delete(connection):
+            connection.execute("DELETE FROM feed_items WHERE feed_id = ?", (feed_id,))
+            connection.execute("DELETE FROM feeds WHERE id = ?", (feed_id,))
+        
+        self._start()
+        self.queue.put(delete)
+    
+    def feeds(self):
+        """الاشتراكات المحفوظة بترتيب إضافتها"""
+        self.flush()
+        return self._read(f"SELECT {', '.join(FEED_COLUMNS)} FROM feeds ORDER BY created_at, id")
+    
+    def known_item(self, feed_id, video_id):
+        """هل ظهر هذا العنصر في الاشتراك سابقاً (بحث بالمفتاح الأساسي)"""
+        return bool(self._read(
+            "SELECT 1 FROM feed_items WHERE feed_id = ? AND video_id = ?", (feed_id, video_id)
+        ))
+    
+    def add_feed_items(self, feed_id, video_ids, seen_at=None):
+        """تسجيل عناصر اشتراك كمعروفة"""
+        seen_at = seen_at or time.time()
+        rows = [(feed_id, video_id, seen_at) for video_id in video_ids]
+        
+        self._start()
+        self.queue.put(lambda connection: connection.executemany(
+            "INSERT OR IGNORE INTO feed_items (feed_id, video_id, seen_at) VALUES (?, ?, ?)", rows
+        ))
+    
+    # ---- سلامة الملفات ----
+    
+    def save_integrity(self, record):
+        """حفظ بصمات ملف مكتمل ونتيجة آخر تحقق"""
+        row = tuple(record.get(column) for column in INTEGRITY_COLUMNS)
+        placeholders = ", ".join("?" * len(INTEGRITY_COLUMNS))
+        
+        def save(connection):
+            connection.execute(
+                f"INSERT OR REPLACE INTO file_integrity ({', '.join(INTEGRITY_COLUMNS)}) VALUES ({placeholders})", row
+            )
+        
+        self._start()
+        self.queue.put(save)
+    
+    def integrity(self, path):
+        """بصمات الملف المحفوظة أو None"""
+        self.flush()
+        rows = self._read(f"SELECT {', '.join(INTEGRITY_COLUMNS)} FROM file_integrity WHERE path = ?", (path,))
+        return rows[0] if rows else None
+    
+    # ---- الاحتفاظ والضغط ----
+    
+    def apply_retention(self, max_age_days=HISTORY_RETENTION_DAYS, max_entries=HISTORY_MAX_ENTRIES):
+        """حذف السجلات القديمة والمكررة ثم ضغط الملف (ينفذ في thread الكتابة)"""
+        def retention(connection):
+            deleted = 0
+            if max_age_days:
+                deleted += connection.execute(
+                    "DELETE FROM downloads WHERE downloaded_at < ?",
+                    (time.time() - max_age_days * 86400,)
+                ).rowcount
+            # السجلات المكررة لنفس الملف فقط؛ نسخ الجودات المختلفة ملفات حقيقية تبقى
+            deleted += connection.execute(
+                "DELETE FROM downloads WHERE id NOT IN ("
+                "SELECT MAX(id) FROM downloads GROUP BY url, kind, quality, filename)"
+            ).rowcount
+            if max_entries:
+                deleted += connection.execute(
+                    "DELETE FROM downloads WHERE id IN ("
+                    "SELECT id FROM downloads ORDER BY downloaded_at DESC, id DESC LIMIT -1 OFFSET ?)",
+                    (max_entries,)
+                ).rowcount
+            if deleted:
+                logger.info(f"تم حذف {deleted} سجل من سجل التنزيلات")
+                self._compact(connection)
+        
+        self._start()
+        self.queue.put(retention)
+        self.flush()
+    
+    @staticmethod
+    def _compact(connection):
+        # executescript ينهي المعاملة المفتوحة وينفذ الأمر حتى نهايته؛
+        # execute يحرر صفحة واحدة فقط في كل خطوة
+        connection.executescript("PRAGMA incremental_vacuum;")
+        connection.execute("PRAGMA optimize")
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    
+    def compact(self):
+        """إعادة الصفحات الفارغة إلى نظام الملفات وتقليص ملف WAL"""
+        self._start()
+        self.queue.put(self._compact)
+        self.flush()
+    
+    def close(self):
+        """كتابة ما تبقى وإغلاق الاتصالات"""
+        if self.writer is not None:
+            self.queue.put(None)
+            self.writer.join(timeout=5)
+        with self.lock:
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
+
+# إنشاء كائنات عامة
+history_store = HistoryStore()
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+جدولة التنزيلات حسب الموقع: حد للاتصالات المتزامنة، تباعد طلبات البيانات، وتخفيض تلقائي عند الحظر
+"""
+import time
+import threading
+from urllib.parse import urlparse
+from contextlib import contextmanager
+from utils import logger, settings_manager
+from url_canonical import canonicalize, UNKNOWN_PLATFORM
+from config import HOST_MAX_CONNECTIONS, HOST_METADATA_INTERVAL, HOST_THROTTLE_COOLDOWN
+
+def host_key(url):
+    """اسم المنصة المعروفة، أو النطاق للمواقع الأخرى"""
+    platform = canonicalize(url).platform
+    if platform != UNKNOWN_PLATFORM:
+        return platform
+    domain = urlparse(url).netloc.lower()
+    return domain[4:] if domain.startswith("www.") else domain
+
+class HostState:
+    """حالة موقع واحد"""
+    
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.next_request = 0.0
+        self.throttled_until = 0.0
+
+class HostScheduler:
+    """توزيع الاتصالات على المواقع مع تخفيض الحد عند ظهور 429/403 واستعادته تدريجياً"""
+    
+    def __init__(self):
+        self.hosts = {}
+        self.condition = threading.Condition()
+    
+    @property
+    def max_connections(self):
+        return max(1, int(settings_manager.get("host_max_connections", HOST_MAX_CONNECTIONS)))
+    
+    def _state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState(self.max_connections)
+        return state
+    
+    @contextmanager
+    def connection(self, url, on_wait=None, cancelled=None):
+        """حجز اتصال للموقع طوال مدة التنزيل؛ ينتظر إن بلغ الموقع حده"""
+        host = host_key(url)
+        with self.condition:
+            state = self._state(host)
+            if state.active >= state.limit and on_wait:
+                on_wait()
+            while state.active >= state.limit:
+                if cancelled and cancelled():
+                    raise RuntimeError("تم إلغاء التنزيل قبل بدئه")
+                self.condition.wait(timeout=0.5)
+            state.active += 1
+        try:
+            yield host
+        finally:
+            with self.condition:
+                state.active -= 1
+                self.condition.notify_all()
+    
+    def pace(self, url):
+        """فرض حد أدنى بين طلبات البيانات الوصفية لنفس الموقع"""
+        with self.condition:
+            state = self._state(host_key(url))
+            now = time.monotonic()
+            start = max(now, state.next_request)
+            state.next_request = start + HOST_METADATA_INTERVAL
+        if start > now:
+            time.sleep(start - now)
+    
+    def report_throttled(self, url):
+        """رد 429/403: خفض حد الموقع إلى النصف"""
+        host = host_key(url)
+        with self.condition:
+            state = self._state(host)
+            state.limit = max(1, state.limit // 2)
+            state.throttled_until = time.monotonic() + HOST_THROTTLE_COOLDOWN
+            # تأخير طلبات البيانات التالية أيضاً
+            state.next_request = max(state.next_request, time.monotonic() + HOST_METADATA_INTERVAL * 4)
+        logger.warning(f"تم تقييد الطلبات من {host}؛ الحد الحالي {state.limit} اتصال")
+    
+    def report_success(self, url):
+        """تنزيل ناجح: رفع الحد تدريجياً بعد انتهاء فترة التهدئة"""
+        with self.condition:
+            state = self._state(host_key(url))
+            if time.monotonic() >= state.throttled_until and state.limit < self.max_connections:
+                state.limit += 1
+                self.condition.notify_all()
+    
+    def active_connections(self):
+        """عدد التنزيلات الجارية في كل المواقع"""
+        with self.condition:
+            return sum(state.active for state in self.hosts.values())
+    
+    def apply_settings(self):
+        """تطبيق الحد الجديد من الإعدادات على كل المواقع"""
+        with self.condition:
+            now = time.monotonic()
+            for state in self.hosts.values():
+                if now >= state.throttled_until:
+                    state.limit = self.max_connections
+                else:
+                    state.limit = min(state.limit, self.max_connections)
+            self.condition.notify_all()
+
+# إنشاء كائنات عامة
+host_scheduler = HostScheduler()
\ No newline at end of file
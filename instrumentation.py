@@ -0,0 +1,227 @@
+"""
+قياس الأداء: فترات زمنية، مدرجات تكرارية، وتحليل أداء مهمة واحدة عند الطلب
+"""
+import sys
+import time
+import json
+import pstats
+import cProfile
+import threading
+import functools
+from io import StringIO
+from collections import deque, Counter
+from contextlib import contextmanager
+from utils import logger
+from config import CONFIG_DIR, METRICS_RESERVOIR_SIZE, PROFILE_SAMPLE_INTERVAL
+
+PROFILES_DIR = CONFIG_DIR / "profiles"
+
+class Histogram:
+    """مدرج تكراري لأزمنة التنفيذ مع عينة محدودة لحساب النسب المئوية"""
+    
+    def __init__(self, reservoir_size=METRICS_RESERVOIR_SIZE):
+        self.samples = deque(maxlen=reservoir_size)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+    
+    def observe(self, value):
+        with self.lock:
+            self.samples.append(value)
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+    
+    @staticmethod
+    def _quantile(ordered, q):
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[index]
+    
+    def snapshot(self):
+        """ملخص القيم: العدد والمجموع والنسب p50/p95/p99"""
+        with self.lock:
+            ordered = sorted(self.samples)
+            return {
+                'count': self.count,
+                'sum': self.total,
+                'min': self.min or 0.0,
+                'max': self.max or 0.0,
+                'p50': self._quantile(ordered, 0.50),
+                'p95': self._quantile(ordered, 0.95),
+                'p99': self._quantile(ordered, 0.99),
+            }
+
+class MetricsRegistry:
+    """سجل المقاييس داخل العملية"""
+    
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.armed_profile = None
+    
+    def histogram(self, name):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            return histogram
+    
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+    
+    @contextmanager
+    def span(self, name):
+        """قياس زمن كتلة برمجية"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+    
+    def timed(self, name):
+        """مزخرف لقياس زمن دالة"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+    
+    def job(self, name):
+        """مزخرف لدوال المهام (المعامل الأول بعد self هو معرف المهمة): قياس الزمن وتحليل الأداء إن طُلب"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(instance, job_id, *args, **kwargs):
+                with self.profile_job(job_id), self.span(name):
+                    return func(instance, job_id, *args, **kwargs)
+            return wrapper
+        return decorator
+    
+    def postprocessor_hook(self):
+        """hook لـ yt-dlp يقيس زمن كل معالج لاحق باسمه"""
+        started = {}
+        
+        def hook(d):
+            name = d.get('postprocessor', 'unknown')
+            if d.get('status') == 'started':
+                started[name] = time.perf_counter()
+            elif d.get('status') == 'finished' and name in started:
+                self.observe(f"postprocess.{name}", time.perf_counter() - started.pop(name))
+        
+        return hook
+    
+    def snapshot(self):
+        with self.lock:
+            names = list(self.histograms.items())
+        return {name: histogram.snapshot() for name, histogram in sorted(names)}
+    
+    def export_json(self):
+        """تصدير المقاييس بصيغة JSON"""
+        return json.dumps({'timestamp': time.time(), 'spans': self.snapshot()}, indent=2)
+    
+    def export_prometheus(self):
+        """تصدير المقاييس بصيغة Prometheus النصية (summary)"""
+        lines = [
+            "# HELP snaptube_span_seconds Duration of instrumented spans.",
+            "# TYPE snaptube_span_seconds summary"
+        ]
+        for name, stats in self.snapshot().items():
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                lines.append(f'snaptube_span_seconds{{span="{label}",quantile="{quantile}"}} {stats[key]:.6f}')
+            lines.append(f'snaptube_span_seconds_sum{{span="{label}"}} {stats["sum"]:.6f}')
+            lines.append(f'snaptube_span_seconds_count{{span="{label}"}} {stats["count"]}')
+        return "\n".join(lines) + "\n"
+    
+    def write(self, path):
+        """كتابة المقاييس في ملف؛ الصيغة حسب الامتداد (.prom أو .json)"""
+        path = str(path)
+        content = self.export_prometheus() if path.endswith((".prom", ".txt")) else self.export_json()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+    
+    def arm_profile(self, mode="cprofile"):
+        """تفعيل تحليل الأداء للمهمة التالية فقط (cprofile أو sampling، أو None للإلغاء)"""
+        self.armed_profile = mode
+    
+    @contextmanager
+    def profile_job(self, job_id):
+        """تحليل أداء مهمة إن كان التحليل مفعلاً لها"""
+        with self.lock:
+            mode, self.armed_profile = self.armed_profile, None
+        
+        if mode is None:
+            yield
+            return
+        
+        PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+        name = f"{job_id}-{int(time.time())}"
+        
+        if mode == "sampling":
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+            try:
+                yield
+            finally:
+                sampler.stop()
+                sampler.write(PROFILES_DIR / f"{name}.folded")
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(str(PROFILES_DIR / f"{name}.prof"))
+                report = StringIO()
+                pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(40)
+                with open(PROFILES_DIR / f"{name}.txt", "w", encoding="utf-8") as f:
+                    f.write(report.getvalue())
+        
+        logger.info(f"تم حفظ تحليل أداء المهمة: {name}")
+
+class StackSampler:
+    """محلل أداء بالعينات لـ thread واحد؛ يكتب المكدسات بصيغة folded لرسوم اللهب"""
+    
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.running = False
+        self.thread = None
+    
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def _run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+    
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+    
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+# إنشاء كائنات عامة
+metrics = MetricsRegistry()
\ No newline at end of file
@@ -0,0 +1,388 @@
+"""
+التحقق من سلامة الملفات المكتملة: بنية الحاوية، الحجم المتوقع، وبصمة لكل جزء مع إصلاح الأجزاء التالفة فقط
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import platform
+import base64
+import binascii
+import hashlib
+import threading
+import yt_dlp
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import HTTPError
+from utils import logger, notification_manager
+from media_probe import media_probe
+from history_store import history_store
+from host_scheduler import host_scheduler
+from instrumentation import metrics
+from config import INTEGRITY_CHUNK_SIZE, INTEGRITY_BUSY_RATE, INTEGRITY_DURATION_TOLERANCE
+
+# نتائج التحقق
+VERIFIED = "verified"      # سليم
+REPAIRED = "repaired"      # أُعيد جلب أجزاء تالفة أو ناقصة وأصبح سليماً
+UNVERIFIED = "unverified"  # بنية الحاوية سليمة ولا مرجع لمقارنة البايتات (صيغ مدمجة أو محولة)
+CORRUPT = "corrupt"        # تالف ولا يمكن إصلاحه بجلب أجزاء فقط
+
+DIGEST_SIZE = hashlib.sha256().digest_size
+# ترويسات يرسل فيها بعض الخوادم بصمة الملف كاملاً
+DIGEST_HEADERS = ("Repr-Digest", "Digest", "X-Goog-Hash")
+# ioprio_set في لينكس: رقم الاستدعاء حسب المعمارية وأولوية IDLE للـ thread
+IOPRIO_SYSCALLS = {"x86_64": 251, "aarch64": 30, "i386": 289, "i686": 289}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
+class IntegrityError(Exception):
+    """الملف تالف ولا يمكن إصلاحه بجلب الأجزاء التالفة"""
+
+def source_of(info, path):
+    """مصدر الملف إن كان نسخة مطابقة لصيغة HTTP واحدة، وإلا None
+    
+    الصيغ المدمجة والمحولة وأجزاء HLS/DASH المعاد تجميعها لا تقابل بايتات رابط واحد،
+    فلا يمكن إصلاحها بطلبات Range.
+    """
+    if not info or info.get('requested_formats') or info.get('protocol') not in ('http', 'https'):
+        return None
+    if not info.get('url') or info.get('container') or os.path.splitext(path)[1].lstrip(".") != info.get('ext'):
+        return None
+    return {
+        'url': info['url'],
+        'page_url': info.get('webpage_url') or info.get('original_url'),
+        'format_id': info.get('format_id'),
+        'http_headers': {
+            name: value for name, value in (info.get('http_headers') or {}).items() if name.lower() != "cookie"
+        },
+    }
+
+def header_checksum(headers):
+    """بصمة الملف كاملاً من ترويسات الرد: (الخوارزمية، البايتات) أو None"""
+    found = {}
+    for name in DIGEST_HEADERS:
+        for part in (headers.get(name) or "").split(","):
+            algorithm, _, value = part.strip().partition("=")
+            algorithm = algorithm.lower().replace("-", "")
+            if algorithm in ("sha256", "md5") and value:
+                found.setdefault(algorithm, value.strip(":"))
+    if headers.get("Content-MD5"):
+        found.setdefault("md5", headers["Content-MD5"].strip())
+    for algorithm in ("sha256", "md5"):
+        if algorithm in found:
+            try:
+                return algorithm, base64.b64decode(found[algorithm], validate=True)
+            except (binascii.Error, ValueError):
+                continue
+    return None
+
+def bad_chunks(digests, expected):
+    """أرقام الأجزاء التي تختلف بصمتها عن البصمات المحفوظة (ومنها الأجزاء الناقصة في آخر الملف)"""
+    return [
+        index for index in range(len(expected) // DIGEST_SIZE)
+        if digests[index * DIGEST_SIZE:(index + 1) * DIGEST_SIZE] != expected[index * DIGEST_SIZE:(index + 1) * DIGEST_SIZE]
+    ]
+
+def chunk_ranges(indices, chunk_size, size):
+    """مديات البايتات [start, end) للأجزاء، مع دمج الأجزاء المتتالية في طلب واحد"""
+    ranges = []
+    for index in indices:
+        start, end = index * chunk_size, min((index + 1) * chunk_size, size)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+class IntegrityChecker:
+    """تحقق في الخلفية بعد اكتمال التنزيل أو عند فشل التشغيل
+    
+    المهام تُنفذ واحدة تلو الأخرى في thread بأقل أولوية، والقراءة تُبطأ ما دامت
+    هناك تنزيلات نشطة حتى لا تنافسها على القرص. بصمات الأجزاء تُحفظ بعد أول تحقق
+    ناجح، فيُعرف لاحقاً أي جزء تلف ويُعاد جلب مداه فقط من رابط المصدر.
+    """
+    
+    def __init__(self, chunk_size=INTEGRITY_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.thread = None
+    
+    def submit(self, path, info=None, copied=True, callback=None):
+        """التحقق من ملف تنزيل مكتمل؛ copied=False إن عُولج الملف بعد التنزيل (تحويل الصوت مثلاً)"""
+        self._enqueue(path, self.verify_download, (path, info, copied), callback)
+    
+    def recheck(self, path, callback=None):
+        """إعادة التحقق من ملف في المكتبة (بعد فشل تشغيله مثلاً) وإصلاحه إن أمكن"""
+        self._enqueue(path, self.verify_file, (path,), callback)
+    
+    def _enqueue(self, path, task, args, callback):
+        path = str(path)
+        with self.lock:
+            if path in self.pending:
+                return
+            self.pending.add(path)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._worker, name="integrity", daemon=True)
+                self.thread.start()
+        self.queue.put((path, task, args, callback))
+    
+    @staticmethod
+    def _set_idle_io_priority():
+        """أولوية القرص IDLE للـ thread الحالي عبر ioprio_set
+        
+        setpriority لا يغير إلا أولوية المعالج؛ مع IDLE لا يقرأ التحقق من القرص إلا حين
+        لا يحتاجه غيره، ولا أثر له إن لم تكن المعمارية معروفة أو فشل الاستدعاء.
+        """
+        number = IOPRIO_SYSCALLS.get(platform.machine())
+        if number is None:
+            return False
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            return libc.syscall(number, IOPRIO_WHO_PROCESS, threading.get_native_id(),
+                                IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) == 0
+        except (OSError, AttributeError):
+            return False
+    
+    def _worker(self):
+        # أقل أولوية للمعالج وللقرص؛ قراءة الأجزاء تُبطأ أيضاً أثناء التنزيل في _throttle
+        if sys.platform.startswith("linux"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+            except (AttributeError, OSError):
+                pass
+            self._set_idle_io_priority()
+        while True:
+            path, task, args, callback = self.queue.get()
+            try:
+                status = task(*args)
+            except IntegrityError as e:
+                status = CORRUPT
+                logger.error(f"ملف تالف {path}: {e}")
+                notification_manager.notify(f"الملف تالف ولا يمكن إصلاحه: {os.path.basename(path)}", "error")
+            except FileNotFoundError:
+                # حُذف الملف أثناء التحقق
+                status = None
+            except Exception as e:
+                status = None
+                logger.error(f"خطأ في التحقق من {path}: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(path)
+            if status == REPAIRED:
+                notification_manager.notify(f"تم إصلاح الملف: {os.path.basename(path)}", "success")
+            if callback:
+                callback(path, status)
+    
+    # ---- التحقق ----
+    
+    @metrics.timed("integrity.download")
+    def verify_download(self, path, info=None, copied=True):
+        """تحقق ملف تنزيل جديد: الحجم وبصمة المصدر إن وجدا، ثم بنية الحاوية، ثم حفظ بصمات الأجزاء"""
+        if not os.path.exists(path):
+            # نُقل أو حُذف قبل دوره في الطابور
+            return None
+        source = source_of(info, path) if copied else None
+        status = VERIFIED if source else UNVERIFIED
+        remote = None
+        if source:
+            with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+                remote = self._resolve(ydl, source)
+                size = os.path.getsize(path)
+                if remote and size != remote['size']:
+                    if size > remote['size']:
+                        raise IntegrityError(f"الحجم {size} أكبر من حجم المصدر {remote['size']}")
+                    # ملف ناقص: جلب المدى الناقص فقط
+                    logger.warning(f"ملف ناقص {path}: {size} من {remote['size']} بايت")
+                    self._write_ranges(ydl, remote, path, [(size, remote['size'])], remote['size'])
+                    status = REPAIRED
+        
+        self._check_container(path, (info or {}).get('duration'))
+        digests, whole = self._scan(path, remote['checksum'][0] if remote and remote['checksum'] else None)
+        if whole is not None and whole != remote['checksum'][1]:
+            raise IntegrityError("بصمة الملف لا تطابق البصمة التي أرسلها الخادم")
+        self._save(path, digests, source, status)
+        logger.info(f"تحقق {status}: {path}")
+        return status
+    
+    @metrics.timed("integrity.file")
+    def verify_file(self, path):
+        """مقارنة الملف ببصماته المحفوظة وإعادة جلب الأجزاء المختلفة فقط"""
+        if not os.path.exists(path):
+            raise IntegrityError("الملف غير موجود")
+        record = history_store.integrity(path)
+        if record is None:
+            # ملف بلا بصمات (من قبل هذه الميزة أو من خارج التطبيق): فحص البنية فقط
+            self._check_container(path)
+            digests, _ = self._scan(path)
+            self._save(path, digests, None, UNVERIFIED)
+            return UNVERIFIED
+        
+        expected_size, chunk_size = record['size'], record['chunk_size']
+        size = os.path.getsize(path)
+        digests, _ = self._scan(path, chunk_size=chunk_size)
+        bad = bad_chunks(digests, record['digests'])
+        if not bad:
+            if size == expected_size:
+                return VERIFIED
+            # بايتات زائدة بعد نهاية الملف فقط
+            os.truncate(path, expected_size)
+            self._save(path, record['digests'], json.loads(record['source'] or "null"), REPAIRED, chunk_size)
+            return REPAIRED
+        
+        source = json.loads(record['source']) if record['source'] else None
+        if source is None:
+            raise IntegrityError(f"{len(bad)} جزء تالف ولا يوجد مصدر لإعادة جلبه")
+        logger.warning(f"أجزاء تالفة في {path}: {bad}")
+        
+        ranges = chunk_ranges(bad, chunk_size, expected_size)
+        with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+            remote = self._resolve(ydl, source, expected_size)
+            if remote is None:
+                raise IntegrityError("تعذر الوصول إلى المصدر")
+            self._write_ranges(ydl, remote, path, ranges, expected_size, record['digests'], chunk_size)
+        
+        self._check_container(path)
+        self._save(path, self._scan(path, chunk_size=chunk_size)[0], source, REPAIRED, chunk_size)
+        return REPAIRED
+    
+    def _check_container(self, path, duration=None):
+        """فحص سريع لرأس الحاوية وفهرسها عبر ffprobe، ومطابقة المدة المعلنة إن وجدت"""
+        if shutil.which("ffprobe") is None:
+            # دون ffprobe يُكتفى بالحجم والبصمات
+            return
+        probe = media_probe.probe(path)
+        if not probe['valid']:
+            raise IntegrityError("بنية الحاوية غير صالحة")
+        if duration and probe['duration']:
+            tolerance = max(2.0, duration * INTEGRITY_DURATION_TOLERANCE)
+            if abs(probe['duration'] - duration) > tolerance:
+                raise IntegrityError(f"المدة {probe['duration']:.1f} ثانية بدلاً من {duration:.1f}")
+    
+    def _save(self, path, digests, source, status, chunk_size=None):
+        history_store.save_integrity({
+            'path': str(path),
+            'size': os.path.getsize(path),
+            'chunk_size': chunk_size or self.chunk_size,
+            'digests': digests,
+            'source': json.dumps(source, ensure_ascii=False) if source else None,
+            'status': status,
+            'verified_at': time.time(),
+        })
+    
+    def _scan(self, path, algorithm=None, chunk_size=None):
+        """بصمات الأجزاء (متتالية في bytes) وبصمة الملف كاملاً بالخوارزمية المطلوبة"""
+        chunk_size = chunk_size or self.chunk_size
+        whole = hashlib.new(algorithm) if algorithm else None
+        digests = bytearray()
+        with open(path, "rb") as f:
+            offset = 0
+            while True:
+                started = time.monotonic()
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                digests += hashlib.sha256(data).digest()
+                if whole is not None:
+                    whole.update(data)
+                # لا داعي لإبقاء الملف في ذاكرة النظام على حساب التنزيلات
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), offset, len(data), os.POSIX_FADV_DONTNEED)
+                offset += len(data)
+                self._throttle(len(data), started)
+        return bytes(digests), whole.digest() if whole is not None else None
+    
+    @staticmethod
+    def _throttle(length, started):
+        """إبطاء القراءة إلى INTEGRITY_BUSY_RATE ما دامت هناك تنزيلات نشطة"""
+        if host_scheduler.active_connections():
+            remaining = length / INTEGRITY_BUSY_RATE - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+    
+    # ---- المصدر ----
+    
+    def _resolve(self, ydl, source, expected_size=None):
+        """رابط صالح للمصدر مع حجمه وبصمته: {url, headers, size, checksum} أو None
+        
+        رابط الصيغة قد ينتهي؛ يُعاد الاستخراج بنفس الصيغة مرة واحدة. الرابط الجديد
+        يُقبل فقط إن كان حجمه مطابقاً للحجم المحفوظ.
+        """
+        url, headers = source['url'], source.get('http_headers') or {}
+        for attempt in range(2):
+            try:
+                with ydl.urlopen(Request(url, headers=headers, method="HEAD")) as response:
+                    size = int(response.headers.get("Content-Length") or 0)
+                    checksum = header_checksum(response.headers)
+            except HTTPError as e:
+                if e.status in (403, 429):
+                    host_scheduler.report_throttled(url)
+                if attempt or e.status not in (403, 404, 410) or not source.get('page_url'):
+                    logger.warning(f"تعذر الوصول إلى مصدر الملف: {e}")
+                    return None
+                url, headers = self._reextract(source)
+                continue
+            if not size or (expected_size and size != expected_size):
+                return None
+            return {'url': url, 'headers': headers, 'size': size, 'checksum': checksum}
+        return None
+    
+    @staticmethod
+    def _reextract(source):
+        """رابط جديد لنفس الصيغة بعد انتهاء صلاحية الرابط المحفوظ"""
+        host_scheduler.pace(source['page_url'])
+        with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True, 'format': source['format_id']}) as ydl:
+            info = ydl.extract_info(source['page_url'], download=False)
+        return info['url'], info.get('http_headers') or {}
+    
+    def _write_ranges(self, ydl, remote, path, ranges, size, expected=None, chunk_size=None):
+        """جلب المديات [start, end) بطلبات Range وكتابتها في مكانها جزءاً جزءاً
+        
+        الرد يُقرأ بحجم الجزء فلا يُحمَّل المدى كاملاً في الذاكرة؛ ومع البصمات المحفوظة
+        يُقارن كل جزء ببصمته قبل كتابته.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        with open(path, "r+b") as f:
+            if os.path.getsize(path) != size:
+                f.truncate(size)
+            for start, end in ranges:
+                request = Request(remote['url'], headers={**remote['headers'], 'Range': f"bytes={start}-{end - 1}"})
+                with ydl.urlopen(request) as response:
+                    if response.status != 206:
+                        raise IntegrityError("الخادم لا يدعم جلب جزء من الملف")
+                    offset = start
+                    while offset < end:
+                        # حدود الأجزاء كما في البصمات
+                        length = min(chunk_size - offset % chunk_size, end - offset)
+                        data = self._read_exact(response, length)
+                        if len(data) != length:
+                            raise IntegrityError(f"انقطع الرد عند البايت {offset + len(data)} بدلاً من {end}")
+                        if expected is not None:
+                            index = offset // chunk_size
+                            if hashlib.sha256(data).digest() != expected[index * DIGEST_SIZE:(index + 1) * DIGEST_SIZE]:
+                                raise IntegrityError("الجزء المجلوب لا يطابق البصمة المحفوظة؛ تغير الملف في المصدر")
+                        f.seek(offset)
+                        f.write(data)
+                        offset += length
+            f.flush()
+            os.fsync(f.fileno())
+    
+    @staticmethod
+    def _read_exact(response, length):
+        """قراءة length بايت من الرد أو أقل عند انتهائه"""
+        parts = []
+        while length > 0:
+            data = response.read(length)
+            if not data:
+                break
+            parts.append(data)
+            length -= len(data)
+        return b"".join(parts)
+
+# إنشاء كائنات عامة
+integrity_checker = IntegrityChecker()
\ No newline at end of file
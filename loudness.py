@@ -0,0 +1,116 @@
+"""
+قياس الجهارة المتكاملة (EBU R128) وتوحيد مستوى الصوت
+"""
+import math
+import subprocess
+import numpy as np
+from utils import logger, FileResultCache
+from media_probe import media_probe
+from workers import postprocess_pool
+from config import CONFIG_DIR, LOUDNESS_TARGET_LUFS, LOUDNESS_MAX_GAIN_DB, LOUDNESS_TOLERANCE_DB
+
+MEASURE_RATE = 48000
+SUB_BLOCK = MEASURE_RATE // 10  # كتل 100 ms؛ كل كتلة قياس 400 ms = أربع كتل متتالية
+
+# ترشيح K من ITU-R BS.1770 كمرشحين من الدرجة الثانية في ffmpeg
+K_WEIGHTING = (
+    "highshelf=f=1681.974450955533:g=3.999843853973347:t=q:w=0.7071752369554196,"
+    "highpass=f=38.13547087602444:poles=2:t=q:w=0.5003270373238773"
+)
+
+def integrated_loudness(sub_block_power):
+    """الجهارة المتكاملة من قدرة كتل 100 ms (بعد ترشيح K وجمع القنوات)"""
+    if len(sub_block_power) < 4:
+        return None
+    
+    # كتل 400 ms بتداخل 75%
+    blocks = np.convolve(sub_block_power, np.ones(4) / 4, mode="valid")
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(blocks)
+    
+    # البوابة المطلقة -70 LUFS ثم البوابة النسبية -10 LU
+    gated = blocks[loudness > -70]
+    if not len(gated):
+        return None
+    relative_gate = -0.691 + 10 * math.log10(gated.mean()) - 10
+    gated = blocks[(loudness > -70) & (loudness > relative_gate)]
+    if not len(gated):
+        return None
+    return float(-0.691 + 10 * math.log10(gated.mean()))
+
+def measure_loudness(path, channels=2):
+    """الجهارة المتكاملة بوحدة LUFS بقراءة دفعات PCM متدفقة من ffmpeg"""
+    process = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-v", "error", "-i", str(path), "-vn",
+         "-af", K_WEIGHTING, "-ac", str(channels), "-ar", str(MEASURE_RATE),
+         "-f", "f32le", "pipe:1"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    
+    # قراءة ثانية واحدة في كل دفعة دون تحميل الملف كاملاً
+    frame_bytes = 4 * channels
+    chunk_bytes = SUB_BLOCK * 10 * frame_bytes
+    powers = []
+    remainder = b""
+    try:
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            data = remainder + data
+            usable = len(data) - len(data) % (SUB_BLOCK * frame_bytes)
+            remainder = data[usable:]
+            if not usable:
+                continue
+            samples = np.frombuffer(data[:usable], dtype=np.float32).reshape(-1, SUB_BLOCK, channels)
+            # متوسط المربعات لكل قناة ثم الجمع بأوزان 1 للقناتين الأماميتين
+            powers.append(np.square(samples, dtype=np.float64).mean(axis=1).sum(axis=1))
+    finally:
+        process.stdout.close()
+        process.wait()
+    
+    if process.returncode != 0 or not powers:
+        raise RuntimeError("تعذر قياس جهارة الملف")
+    
+    integrated = integrated_loudness(np.concatenate(powers))
+    return -70.0 if integrated is None else integrated
+
+class LoudnessAnalyzer:
+    """قياس الجهارة في عمال المعالجة مع تخزين النتيجة لكل ملف"""
+    
+    def __init__(self):
+        self.cache = FileResultCache(CONFIG_DIR / "loudness.json")
+    
+    def measure(self, path):
+        """الجهارة المتكاملة بوحدة LUFS (من الذاكرة إن أمكن)"""
+        cached = self.cache.get(path)
+        if cached is not None:
+            return cached['integrated']
+        
+        channels = min(media_probe.probe(path).get('channels') or 2, 2)
+        integrated = postprocess_pool.run("loudness", str(path), channels)
+        self.cache.put(path, {'integrated': integrated})
+        return integrated
+    
+    def gain_for(self, path, target=LOUDNESS_TARGET_LUFS):
+        """الكسب المطلوب بالديسيبل للوصول إلى الجهارة الهدف"""
+        gain = target - self.measure(path)
+        return max(min(gain, LOUDNESS_MAX_GAIN_DB), -LOUDNESS_MAX_GAIN_DB)
+    
+    def filter_for(self, path, target=LOUDNESS_TARGET_LUFS):
+        """مرشح ffmpeg لتطبيق الكسب في نفس مرحلة الترميز، أو None إن لم يلزم"""
+        try:
+            gain = self.gain_for(path, target)
+        except Exception as e:
+            logger.warning(f"تعذر قياس الجهارة: {e}")
+            return None
+        if abs(gain) < LOUDNESS_TOLERANCE_DB:
+            return None
+        audio_filter = f"volume={gain:.2f}dB"
+        if gain > 0:
+            # منع القص عند رفع المستوى
+            audio_filter += ",alimiter=limit=0.891:level=false"
+        return audio_filter
+
+# إنشاء كائنات عامة
+loudness_analyzer = LoudnessAnalyzer()
\ No newline at end of file
@@ -8,12 +8,29 @@ import customtkinter as ctk
 from pathlib import Path
 import webbrowser
 import threading
+import time
+import multiprocessing
 from PIL import Image, ImageTk
 
 from config import *
 from utils import *
 from downloader import video_downloader, video_converter
 from media_player import create_media_player
+from thumbnails import thumbnail_service
+from media_probe import media_probe
+from instrumentation import metrics
+from workers import postprocess_pool
+from host_scheduler import host_scheduler
+from disk_space import disk_space
+from staging import staging_area, library_events
+from output_layout import validate_template
+from history_store import history_store
+from url_canonical import canonicalize
+from metadata_service import metadata_service
+from session_bundle import export_bundle, bundle_importer
+from download_scheduler import download_scheduler, parse_windows, format_windows, parse_after
+from subscriptions import subscription_manager
+from integrity import integrity_checker, VERIFIED, REPAIRED, UNVERIFIED
 
 # إعداد المظهر
 ctk.set_appearance_mode("dark")
@@ -31,10 +48,19 @@ class SnapTubeApp:
         # كائنات التطبيق
         self.media_player = None
         self.current_video_info = None
+        self.library_paths = []
+        self.library_index = {}
         
         # إشعارات
         notification_manager.add_callback(self.show_notification)
         
+        # التنزيلات المجدولة المحفوظة (قبل التنظيف حتى تبقى ملفاتها الجزئية)
+        download_scheduler.start()
+        subscription_manager.start()
+        
+        # تنظيف الملفات الجزئية ومجلدات العمل المتبقية من جلسات سابقة
+        threading.Thread(target=self.collect_leftovers, daemon=True).start()
+        
         logger.info("تم تشغيل SnapTube Pro")
     
     def setup_window(self):
@@ -60,6 +86,13 @@ class SnapTubeApp:
         self.audio_quality_var = tk.StringVar(value="192")
         self.progress_var = tk.DoubleVar()
         self.status_var = tk.StringVar(value="جاهز")
+        self.clipboard_monitor_var = tk.BooleanVar(value=settings_manager.get("clipboard_monitor", False))
+        self.windowed_var = tk.BooleanVar(value=False)
+        self.after_var = tk.StringVar()
+        self.last_clipboard = None
+        self.analyze_request = None
+        self.analyze_generation = 0
+        self.clipboard_job = None
     
     def setup_ui(self):
         """إعداد واجهة المستخدم"""
@@ -182,10 +215,23 @@ class SnapTubeApp:
         )
         analyze_btn.pack(side=tk.RIGHT, padx=5)
         
+        # مراقبة الحافظة وجلب بيانات الروابط المنسوخة مسبقاً
+        clipboard_switch = ctk.CTkSwitch(
+            url_frame,
+            text="مراقبة الحافظة",
+            variable=self.clipboard_monitor_var,
+            command=self.toggle_clipboard_monitor
+        )
+        clipboard_switch.pack(anchor=tk.W, padx=10, pady=5)
+        
         # معلومات الفيديو
         self.info_frame = ctk.CTkFrame(self.download_tab)
         self.info_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
         
+        # الصورة المصغرة للفيديو
+        self.thumbnail_label = tk.Label(self.info_frame, bg="#2b2b2b", bd=0)
+        self.thumbnail_label.pack(side=tk.LEFT, padx=10, pady=10)
+        
         self.info_label = ctk.CTkLabel(
             self.info_frame,
             text="أدخل رابط فيديو لعرض المعلومات",
@@ -236,6 +282,29 @@ class SnapTubeApp:
         )
         self.audio_quality_menu.pack(side=tk.LEFT, padx=10)
         
+        # جدولة التنزيل: داخل نوافذ التنزيل و/أو بعد وقت محدد
+        schedule_frame = ctk.CTkFrame(options_frame, fg_color="transparent")
+        schedule_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ctk.CTkLabel(schedule_frame, text="الجدولة:", font=ctk.CTkFont(weight="bold")).pack(side=tk.LEFT, padx=5)
+        
+        windowed_switch = ctk.CTkSwitch(schedule_frame, text="في نوافذ التنزيل فقط", variable=self.windowed_var)
+        windowed_switch.pack(side=tk.LEFT, padx=10)
+        
+        ctk.CTkLabel(schedule_frame, text="بعد:").pack(side=tk.LEFT, padx=5)
+        
+        after_entry = ctk.CTkEntry(schedule_frame, textvariable=self.after_var, placeholder_text="HH:MM", width=140)
+        after_entry.pack(side=tk.LEFT, padx=5)
+        
+        # الاشتراك في القناة أو القائمة بالرابط الحالي ونفس خيارات التنزيل
+        subscribe_btn = ctk.CTkButton(
+            schedule_frame,
+            text="🔔 اشتراك / إلغاء",
+            width=140,
+            command=self.toggle_subscription
+        )
+        subscribe_btn.pack(side=tk.RIGHT, padx=10)
+        
         # زر التنزيل
         download_btn = ctk.CTkButton(
             options_frame,
@@ -337,6 +406,129 @@ class SnapTubeApp:
         
         cancel_btn = ctk.CTkButton(control_frame, text="❌ إلغاء", width=100)
         cancel_btn.pack(side=tk.LEFT, padx=5)
+        
+        import_btn = ctk.CTkButton(control_frame, text="📥 استيراد جلسة", width=120, command=self.import_session)
+        import_btn.pack(side=tk.RIGHT, padx=5)
+        
+        export_btn = ctk.CTkButton(control_frame, text="📤 تصدير الجلسة", width=120, command=self.export_session)
+        export_btn.pack(side=tk.RIGHT, padx=5)
+        
+        # سجل التنزيلات (صفحات من قاعدة البيانات)
+        history_frame = ctk.CTkFrame(self.downloads_tab)
+        history_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        
+        ctk.CTkLabel(history_frame, text="سجل التنزيلات", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=10)
+        
+        self.history_tree = ttk.Treeview(
+            history_frame,
+            columns=("title", "platform", "quality", "date"),
+            show="headings",
+            height=8
+        )
+        
+        self.history_tree.heading("title", text="العنوان")
+        self.history_tree.heading("platform", text="المنصة")
+        self.history_tree.heading("quality", text="الجودة")
+        self.history_tree.heading("date", text="التاريخ")
+        
+        self.history_tree.column("title", width=300)
+        self.history_tree.column("platform", width=100)
+        self.history_tree.column("quality", width=100)
+        self.history_tree.column("date", width=130)
+        
+        self.history_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        history_controls = ctk.CTkFrame(history_frame, fg_color="transparent")
+        history_controls.pack(fill=tk.X, padx=10, pady=10)
+        
+        newer_btn = ctk.CTkButton(history_controls, text="◀ الأحدث", width=100, command=self.show_newer_history)
+        newer_btn.pack(side=tk.LEFT, padx=5)
+        
+        older_btn = ctk.CTkButton(history_controls, text="الأقدم ▶", width=100, command=self.show_older_history)
+        older_btn.pack(side=tk.LEFT, padx=5)
+        
+        # مفاتيح بداية الصفحات المعروضة للرجوع إليها
+        self.history_cursors = [None]
+        self.history_last_key = None
+        self.load_history_page()
+    
+    def export_session(self):
+        """تصدير التنزيلات النشطة إلى حزمة جلسة"""
+        if not video_downloader.get_all_downloads():
+            self.show_notification("لا توجد تنزيلات نشطة للتصدير", "warning")
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=BUNDLE_EXTENSION,
+            filetypes=[("حزمة جلسة", f"*{BUNDLE_EXTENSION}")]
+        )
+        if path:
+            try:
+                count = export_bundle(path)
+                self.show_notification(f"تم تصدير {count} تنزيل", "success")
+            except OSError as e:
+                messagebox.showerror("خطأ", f"تعذر تصدير الجلسة: {e}")
+    
+    def import_session(self):
+        """استيراد حزمة جلسة؛ التنزيلات تبدأ تباعاً ضمن حد التنزيلات المتزامنة"""
+        path = filedialog.askopenfilename(filetypes=[("حزمة جلسة", f"*{BUNDLE_EXTENSION}")])
+        if not path:
+            return
+        
+        def finished(stats):
+            message = f"تمت إضافة {stats['started']} تنزيل من الحزمة (تم تخطي {stats['skipped']} تنزيل سابق)"
+            if stats.get('partial'):
+                notification_manager.notify(f"{message}؛ الحزمة مقطوعة أو تالفة ولم تُستورد كاملة", "warning")
+            else:
+                notification_manager.notify(message, "success")
+        
+        try:
+            bundle_importer.start(path, on_finished=finished)
+        except (OSError, ValueError, RuntimeError) as e:
+            messagebox.showerror("خطأ", f"تعذر استيراد الجلسة: {e}")
+    
+    def load_history_page(self):
+        """تحميل صفحة السجل الحالية في الخلفية"""
+        cursor = self.history_cursors[-1]
+        
+        def load():
+            try:
+                rows = history_store.page(HISTORY_PAGE_SIZE, before=cursor)
+            except Exception as e:
+                logger.error(f"خطأ في قراءة سجل التنزيلات: {e}")
+                return
+            ui_dispatcher.call(self.show_history_page, rows)
+        
+        threading.Thread(target=load, daemon=True).start()
+    
+    def show_history_page(self, rows):
+        """عرض صفحة من السجل"""
+        if not rows and len(self.history_cursors) > 1:
+            # لا توجد سجلات أقدم: البقاء على الصفحة السابقة
+            self.history_cursors.pop()
+            return
+        
+        self.history_tree.delete(*self.history_tree.get_children())
+        for record in rows:
+            self.insert_history_row(record, tk.END)
+        self.history_last_key = (rows[-1]['downloaded_at'], rows[-1]['id']) if rows else None
+    
+    def insert_history_row(self, record, index):
+        self.history_tree.insert("", index, values=(
+            record.get('title') or "",
+            record.get('platform') or "",
+            record.get('quality') or "",
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(record['downloaded_at']))
+        ))
+    
+    def show_older_history(self):
+        if self.history_last_key:
+            self.history_cursors.append(self.history_last_key)
+            self.load_history_page()
+    
+    def show_newer_history(self):
+        if len(self.history_cursors) > 1:
+            self.history_cursors.pop()
+        self.load_history_page()
     
     def create_library_tab(self):
         """إنشاء تبويب المكتبة"""
@@ -359,6 +551,9 @@ class SnapTubeApp:
         downloads_btn = ctk.CTkButton(buttons_frame, text="📁 التنزيلات", command=lambda: self.open_folder("downloads"))
         downloads_btn.pack(side=tk.LEFT, padx=5)
         
+        verify_btn = ctk.CTkButton(buttons_frame, text="🛡 تحقق من الملف", command=self.verify_selected_file)
+        verify_btn.pack(side=tk.RIGHT, padx=5)
+        
         # قائمة الملفات
         files_frame = ctk.CTkFrame(self.library_tab)
         files_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
@@ -370,8 +565,13 @@ class SnapTubeApp:
             fg="#ffffff",
             selectbackground="#1f538d"
         )
-        self.files_listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.files_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=10, pady=10)
         self.files_listbox.bind("<Double-Button-1>", self.play_selected_file)
+        self.files_listbox.bind("<<ListboxSelect>>", self.show_library_thumbnail)
+        
+        # معاينة الصورة المصغرة للملف المحدد
+        self.library_thumbnail_label = tk.Label(files_frame, bg="#212121", bd=0)
+        self.library_thumbnail_label.pack(side=tk.RIGHT, padx=10, pady=10)
         
         # تحديث قائمة الملفات
         self.refresh_file_list()
@@ -406,8 +606,25 @@ class SnapTubeApp:
         """إعداد callbacks الأحداث"""
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
+        # تمرير نتائج threads العمل إلى حلقة Tk
+        ui_dispatcher.install(self.root)
+        
+        # إضافة الملفات المكتملة إلى المكتبة دون إعادة فحص المجلد
+        library_events.subscribe(lambda path: ui_dispatcher.call(self.add_library_file, path))
+        
         # تحديث دوري للتنزيلات
         self.update_downloads_display()
+        
+        if self.clipboard_monitor_var.get():
+            self.poll_clipboard()
+    
+    @staticmethod
+    def collect_leftovers():
+        """حذف بقايا التنزيلات غير المكتملة، عدا ملفات التنزيلات المجدولة الموقوفة"""
+        scheduled = download_scheduler.job_directories()
+        disk_space.collect_partial_files(keep=scheduled)
+        staging_area.collect_stale(keep=[directory.name for directory in scheduled])
+        history_store.apply_retention()
     
     def paste_url(self):
         """لصق رابط من الحافظة"""
@@ -421,6 +638,35 @@ class SnapTubeApp:
         except:
             self.show_notification("لا يوجد محتوى في الحافظة", "warning")
     
+    def toggle_clipboard_monitor(self):
+        """تشغيل أو إيقاف مراقبة الحافظة"""
+        enabled = self.clipboard_monitor_var.get()
+        settings_manager.set("clipboard_monitor", enabled)
+        if self.clipboard_job:
+            self.root.after_cancel(self.clipboard_job)
+            self.clipboard_job = None
+        if enabled:
+            self.poll_clipboard()
+    
+    def poll_clipboard(self):
+        """قراءة الحافظة دورياً وجلب بيانات الروابط الجديدة في الخلفية"""
+        self.clipboard_job = None
+        if not self.clipboard_monitor_var.get():
+            return
+        
+        try:
+            content = self.root.clipboard_get()
+        except tk.TclError:
+            content = None
+        
+        if content and content != self.last_clipboard:
+            self.last_clipboard = content
+            content = content.strip()
+            if len(content) < 2048 and "\n" not in content:
+                metadata_service.prefetch(content)
+        
+        self.clipboard_job = self.root.after(CLIPBOARD_POLL_INTERVAL, self.poll_clipboard)
+    
     def analyze_url(self):
         """تحليل الرابط والحصول على معلومات الفيديو"""
         url = self.url_var.get().strip()
@@ -429,10 +675,16 @@ class SnapTubeApp:
             self.show_notification("الرابط غير صحيح", "error")
             return
         
-        self.status_var.set("جاري تحليل الرابط...")
-        self.info_label.configure(text="جاري الحصول على معلومات الفيديو...")
+        # الطلب الجديد يلغي السابق؛ نتيجة أي طلب أقدم تُسقط برقم الجيل
+        if self.analyze_request:
+            self.analyze_request.cancel()
+        self.analyze_generation += 1
+        generation = self.analyze_generation
         
         def analyze_callback(video_info, error):
+            if generation != self.analyze_generation:
+                return
+            self.analyze_request = None
             if video_info:
                 self.current_video_info = video_info
                 self.display_video_info(video_info)
@@ -441,12 +693,13 @@ class SnapTubeApp:
                 self.info_label.configure(text=f"خطأ: {error}")
                 self.status_var.set("خطأ في التحليل")
         
-        # تشغيل التحليل في thread منفصل
-        threading.Thread(
-            target=video_downloader.get_video_info,
-            args=(url, analyze_callback),
-            daemon=True
-        ).start()
+        self.status_var.set("جاري تحليل الرابط...")
+        self.info_label.configure(text="جاري الحصول على معلومات الفيديو...")
+        
+        # من الذاكرة المؤقتة فوراً، أو استخراج واحد مشترك لكل الطلبات المتزامنة لنفس الفيديو
+        self.analyze_request = metadata_service.request(
+            url, lambda info, error: ui_dispatcher.call(analyze_callback, info, error)
+        )
     
     def display_video_info(self, video_info):
         """عرض معلومات الفيديو"""
@@ -466,6 +719,17 @@ class SnapTubeApp:
             justify=tk.LEFT,
             anchor="nw"
         )
+        
+        # تحميل الصورة المصغرة دون إيقاف الواجهة
+        self.thumbnail_label.configure(image="")
+        url = video_info['url']
+        
+        def show_thumbnail(photo):
+            if self.current_video_info and self.current_video_info['url'] == url:
+                self.thumbnail_label.configure(image=photo)
+                self.thumbnail_label.image = photo
+        
+        thumbnail_service.request(video_info.get('thumbnail'), "info", show_thumbnail)
     
     def start_download(self):
         """بدء التنزيل"""
@@ -476,6 +740,17 @@ class SnapTubeApp:
         url = self.current_video_info['url']
         download_type = self.download_type_var.get()
         
+        # تنزيل سابق لنفس الرابط أو لنفس الفيديو
+        previous = history_store.find(
+            url=canonicalize(url).url,
+            video_id=self.current_video_info.get('id'),
+            platform=self.current_video_info.get('extractor_key'),
+            kind=download_type
+        )
+        if previous and previous.get('filename') and Path(previous['filename']).exists():
+            if not messagebox.askyesno("تنزيل سابق", f"تم تنزيل هذا الملف سابقاً:\n{previous['filename']}\n\nهل تريد تنزيله مرة أخرى؟"):
+                return
+        
         def progress_callback(download_id, progress, downloaded, total):
             self.progress_bar.set(progress / 100)
             size_info = f"{format_file_size(downloaded)} / {format_file_size(total)}"
@@ -486,21 +761,41 @@ class SnapTubeApp:
                 self.progress_bar.set(1)
                 self.status_var.set("تم التنزيل بنجاح")
                 self.show_notification(f"تم تنزيل: {result['title']}", "success")
-                self.refresh_file_list()
+                if len(self.history_cursors) == 1:
+                    self.insert_history_row(result, 0)
             else:
                 self.progress_bar.set(0)
                 self.status_var.set("فشل التنزيل")
                 self.show_notification(f"خطأ: {result}", "error")
         
+        quality = self.quality_var.get() if download_type == "video" else AUDIO_QUALITIES[self.audio_quality_var.get()]
+        try:
+            not_before = parse_after(self.after_var.get())
+        except ValueError as e:
+            self.show_notification(str(e), "warning")
+            return
+        windowed = self.windowed_var.get()
+        if windowed and not settings_manager.get("download_windows"):
+            self.show_notification("لم تُحدد نوافذ تنزيل في الإعدادات", "warning")
+            return
+        
+        if windowed or not_before:
+            download_scheduler.submit(
+                download_type, url, quality,
+                not_before=not_before, windowed=windowed,
+                progress_callback=progress_callback,
+                completion_callback=completion_callback
+            )
+            self.status_var.set("تمت جدولة التنزيل")
+            return
+        
         if download_type == "video":
-            quality = self.quality_var.get()
             download_id = video_downloader.download_video(
                 url, quality, 
                 progress_callback=progress_callback,
                 completion_callback=completion_callback
             )
         else:
-            quality = AUDIO_QUALITIES[self.audio_quality_var.get()]
             download_id = video_downloader.download_audio(
                 url, quality,
                 progress_callback=progress_callback, 
@@ -509,6 +804,29 @@ class SnapTubeApp:
         
         self.status_var.set("بدء التنزيل...")
     
+    def toggle_subscription(self):
+        """الاشتراك في قناة أو قائمة تشغيل (تُنزَّل عناصرها الجديدة تلقائياً) أو إلغاء الاشتراك"""
+        url = self.url_var.get().strip()
+        if not validate_url(url):
+            self.show_notification("الرابط غير صحيح", "error")
+            return
+        
+        feed = subscription_manager.find(url)
+        if feed:
+            if messagebox.askyesno("إلغاء الاشتراك", f"إلغاء الاشتراك في:\n{feed['title'] or feed['url']}؟"):
+                subscription_manager.unsubscribe(url)
+                self.status_var.set("تم إلغاء الاشتراك")
+            return
+        
+        windowed = self.windowed_var.get()
+        if windowed and not settings_manager.get("download_windows"):
+            self.show_notification("لم تُحدد نوافذ تنزيل في الإعدادات", "warning")
+            return
+        download_type = self.download_type_var.get()
+        quality = self.quality_var.get() if download_type == "video" else AUDIO_QUALITIES[self.audio_quality_var.get()]
+        subscription_manager.subscribe(url, download_type, quality, windowed)
+        self.show_notification("تم الاشتراك؛ ستُنزَّل العناصر الجديدة فقط", "success")
+    
     def select_video_file(self):
         """اختيار ملف فيديو للتحويل"""
         filetypes = [
@@ -540,7 +858,6 @@ class SnapTubeApp:
             if success:
                 self.convert_progress.set(1)
                 self.show_notification("تم التحويل بنجاح", "success")
-                self.refresh_file_list()
             else:
                 self.convert_progress.set(0)
                 self.show_notification(f"خطأ في التحويل: {result}", "error")
@@ -552,17 +869,93 @@ class SnapTubeApp:
             completion_callback=completion_callback
         )
     
+    @metrics.timed("ui.refresh_file_list")
     def refresh_file_list(self):
         """تحديث قائمة الملفات"""
         self.files_listbox.delete(0, tk.END)
+        self.library_paths = []
+        self.library_index = {}
         
         # إضافة الملفات من مجلد التنزيلات
         try:
             for file_path in DOWNLOADS_DIR.rglob("*"):
                 if file_path.is_file():
-                    self.files_listbox.insert(tk.END, file_path.name)
+                    self.library_paths.append(file_path)
+            self.files_listbox.insert(tk.END, *[path.name for path in self.library_paths])
+            self.library_index = {path: i for i, path in enumerate(self.library_paths)}
         except Exception as e:
             logger.error(f"خطأ في تحديث قائمة الملفات: {e}")
+        
+        # المدد من خدمة الفحص (في الخلفية)
+        media_files = [
+            path for path in self.library_paths
+            if path.suffix.lower() in SUPPORTED_VIDEO_FORMATS + SUPPORTED_AUDIO_FORMATS
+        ]
+        media_probe.probe_many(
+            media_files,
+            lambda path, info: ui_dispatcher.call(self.show_library_duration, path, info)
+        )
+    
+    def add_library_file(self, path):
+        """إضافة ملف مكتمل إلى المكتبة (حدث اكتمال واحد لكل ملف)"""
+        path = Path(path)
+        try:
+            path.relative_to(DOWNLOADS_DIR)
+        except ValueError:
+            return
+        if path in self.library_index:
+            return
+        
+        self.library_index[path] = len(self.library_paths)
+        self.library_paths.append(path)
+        self.files_listbox.insert(tk.END, path.name)
+        
+        if path.suffix.lower() in SUPPORTED_VIDEO_FORMATS + SUPPORTED_AUDIO_FORMATS:
+            media_probe.probe_async(
+                path,
+                lambda probed_path, info: ui_dispatcher.call(self.show_library_duration, probed_path, info)
+            )
+    
+    def show_library_duration(self, path, info):
+        """إضافة المدة بجانب اسم الملف في المكتبة"""
+        if not info['duration']:
+            return
+        index = self.library_index.get(Path(path))
+        if index is None:
+            return
+        
+        selected = index in self.files_listbox.curselection()
+        self.files_listbox.delete(index)
+        self.files_listbox.insert(index, f"{Path(path).name}  ({format_duration(info['duration'])})")
+        if selected:
+            self.files_listbox.selection_set(index)
+    
+    def show_library_thumbnail(self, event):
+        """عرض الصورة المصغرة للملف المحدد في المكتبة"""
+        self.library_thumbnail_label.configure(image="")
+        selection = self.files_listbox.curselection()
+        if not selection:
+            return
+        
+        path = self.library_paths[selection[0]]
+        
+        def show_thumbnail(photo):
+            current = self.files_listbox.curselection()
+            if current and self.library_paths[current[0]] == path:
+                self.library_thumbnail_label.configure(image=photo)
+                self.library_thumbnail_label.image = photo
+        
+        def load():
+            # رابط الصورة من سجل التنزيلات بالمسار الكامل للملف
+            try:
+                record = history_store.find(filename=str(path))
+            except Exception as e:
+                logger.error(f"خطأ في قراءة سجل التنزيلات: {e}")
+                return
+            if record and record.get('thumbnail'):
+                ui_dispatcher.call(thumbnail_service.request, record['thumbnail'], "library", show_thumbnail)
+        
+        threading.Thread(target=load, daemon=True).start()
     
     def open_folder(self, folder_type):
         """فتح مجلد"""
@@ -589,14 +982,34 @@ class SnapTubeApp:
         """تشغيل الملف المحدد"""
         selection = self.files_listbox.curselection()
         if selection:
-            filename = self.files_listbox.get(selection[0])
-            file_path = DOWNLOADS_DIR / filename
+            file_path = self.library_paths[selection[0]]
             
             if file_path.exists():
                 if not self.media_player:
                     self.open_media_player()
                 self.media_player.load_file(str(file_path))
     
+    def verify_selected_file(self):
+        """التحقق من سلامة الملف المحدد وإصلاح أجزائه التالفة في الخلفية"""
+        selection = self.files_listbox.curselection()
+        if not selection:
+            self.show_notification("اختر ملفاً من المكتبة أولاً", "warning")
+            return
+        
+        messages = {
+            VERIFIED: ("الملف سليم", "success"),
+            REPAIRED: None,  # إشعار الإصلاح يرسله المتحقق
+            UNVERIFIED: ("بنية الملف سليمة؛ حُفظت بصماته للتحقق لاحقاً", "info"),
+        }
+        
+        def done(path, status):
+            message = messages.get(status)
+            if message:
+                ui_dispatcher.call(self.show_notification, *message)
+        
+        integrity_checker.recheck(str(self.library_paths[selection[0]]), callback=done)
+        self.status_var.set("جاري التحقق من الملف...")
+    
     def open_media_player(self):
         """فتح مشغل الوسائط"""
         if not self.media_player:
@@ -616,6 +1029,7 @@ class SnapTubeApp:
         """عرض نافذة المساعدة"""
         help_window = HelpWindow(self.root)
     
+    @metrics.timed("ui.update_downloads_display")
     def update_downloads_display(self):
         """تحديث عرض التنزيلات"""
         # مسح العناصر الحالية
@@ -629,12 +1043,38 @@ class SnapTubeApp:
                 download_info.get('url', '')[:50],
                 f"{download_info.get('progress', 0)}%",
                 "تحديد...",  # السرعة
-                download_info.get('status', 'غير معروف')
+                self.format_download_status(download_info)
+            ))
+        
+        # التنزيلات المجدولة التي لم تبدأ أو أُوقفت مع انتهاء النافذة
+        for job in download_scheduler.pending():
+            self.downloads_tree.insert("", tk.END, values=(
+                job['url'][:50],
+                "-",
+                "-",
+                self.format_scheduled_status(job)
             ))
         
         # جدولة التحديث التالي
         self.root.after(2000, self.update_downloads_display)
     
+    def format_download_status(self, download_info):
+        """حالة التنزيل مع عدد مرات إعادة المحاولة"""
+        status = download_info.get('status', 'غير معروف')
+        retries = download_info.get('retry_count', 0)
+        if retries:
+            status = f"{status} ({retries})"
+        return status
+    
+    @staticmethod
+    def format_scheduled_status(job):
+        """حالة التنزيل المجدول: موقوف، أو ينتظر النافذة و/أو وقت البدء"""
+        if job['state'] == "paused":
+            return "موقوف حتى النافذة التالية" if job['windowed'] else "موقوف"
+        if job['not_before'] > time.time():
+            return f"بعد {time.strftime('%Y-%m-%d %H:%M', time.localtime(job['not_before']))}"
+        return "ينتظر نافذة التنزيل"
+    
     def show_notification(self, message, type="info"):
         """عرض إشعار"""
         colors = {
@@ -676,6 +1116,14 @@ class SnapTubeApp:
         except:
             pass
         
+        bundle_importer.cancel()
+        download_scheduler.stop()
+        subscription_manager.stop()
+        thumbnail_service.shutdown()
+        media_probe.shutdown()
+        postprocess_pool.shutdown()
+        history_store.close()
+        
         logger.info("إغلاق SnapTube Pro")
         self.root.quit()
         self.root.destroy()
@@ -691,7 +1139,7 @@ class SettingsWindow:
         self.parent = parent
         self.window = ctk.CTkToplevel(parent)
         self.window.title("الإعدادات")
-        self.window.geometry("500x400")
+        self.window.geometry("500x730")
         self.window.resizable(False, False)
         
         self.setup_ui()
@@ -731,6 +1179,59 @@ class SettingsWindow:
         concurrent_entry = ctk.CTkEntry(concurrent_frame, textvariable=self.concurrent_var, width=60)
         concurrent_entry.pack(side=tk.LEFT, padx=10)
         
+        # عدد الاتصالات لكل موقع
+        host_frame = ctk.CTkFrame(download_frame, fg_color="transparent")
+        host_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ctk.CTkLabel(host_frame, text="الاتصالات لكل موقع:").pack(side=tk.LEFT)
+        
+        self.host_connections_var = tk.StringVar(value=str(settings_manager.get("host_max_connections", HOST_MAX_CONNECTIONS)))
+        host_entry = ctk.CTkEntry(host_frame, textvariable=self.host_connections_var, width=60)
+        host_entry.pack(side=tk.LEFT, padx=10)
+        
+        # عدد أجزاء HLS/DASH المتزامنة
+        fragment_frame = ctk.CTkFrame(download_frame, fg_color="transparent")
+        fragment_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ctk.CTkLabel(fragment_frame, text="الأجزاء المتزامنة (HLS/DASH):").pack(side=tk.LEFT)
+        
+        self.fragment_workers_var = tk.StringVar(value=str(settings_manager.get("fragment_workers", FRAGMENT_WORKERS)))
+        fragment_entry = ctk.CTkEntry(fragment_frame, textvariable=self.fragment_workers_var, width=60)
+        fragment_entry.pack(side=tk.LEFT, padx=10)
+        
+        # قالب أسماء الملفات والمجلدات
+        template_frame = ctk.CTkFrame(download_frame, fg_color="transparent")
+        template_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ctk.CTkLabel(template_frame, text="قالب الإخراج:").pack(side=tk.LEFT)
+        
+        self.template_var = tk.StringVar(value=settings_manager.get("output_template", OUTPUT_TEMPLATE))
+        template_menu = ctk.CTkComboBox(
+            template_frame,
+            variable=self.template_var,
+            values=OUTPUT_TEMPLATE_PRESETS,
+            width=300
+        )
+        template_menu.pack(side=tk.LEFT, padx=10)
+        
+        # نوافذ التنزيل المجدولة
+        windows_frame = ctk.CTkFrame(download_frame, fg_color="transparent")
+        windows_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ctk.CTkLabel(windows_frame, text="نوافذ التنزيل:").pack(side=tk.LEFT)
+        
+        self.windows_var = tk.StringVar(value=format_windows(settings_manager.get("download_windows", [])))
+        windows_entry = ctk.CTkEntry(
+            windows_frame, textvariable=self.windows_var, width=300,
+            placeholder_text="01:00-07:00/4, 23:00-23:30"
+        )
+        windows_entry.pack(side=tk.LEFT, padx=10)
+        
+        # توحيد مستوى الصوت
+        self.normalize_var = tk.BooleanVar(value=settings_manager.get("normalize_audio", False))
+        normalize_switch = ctk.CTkSwitch(download_frame, text="توحيد مستوى الصوت (EBU R128)", variable=self.normalize_var)
+        normalize_switch.pack(anchor=tk.W, padx=10, pady=5)
+        
         # إعدادات المظهر
         theme_frame = ctk.CTkFrame(self.window)
         theme_frame.pack(fill=tk.X, padx=20, pady=10)
@@ -752,6 +1253,29 @@ class SettingsWindow:
         )
         appearance_menu.pack(side=tk.LEFT, padx=10)
         
+        # قياس الأداء
+        performance_frame = ctk.CTkFrame(self.window)
+        performance_frame.pack(fill=tk.X, padx=20, pady=10)
+        
+        ctk.CTkLabel(performance_frame, text="قياس الأداء", font=ctk.CTkFont(size=14, weight="bold")).pack(pady=10)
+        
+        profile_frame = ctk.CTkFrame(performance_frame, fg_color="transparent")
+        profile_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ctk.CTkLabel(profile_frame, text="تحليل المهمة التالية:").pack(side=tk.LEFT)
+        
+        self.profile_var = tk.StringVar(value=metrics.armed_profile or "off")
+        profile_menu = ctk.CTkOptionMenu(
+            profile_frame,
+            variable=self.profile_var,
+            values=["off", "cprofile", "sampling"],
+            width=110
+        )
+        profile_menu.pack(side=tk.LEFT, padx=10)
+        
+        export_btn = ctk.CTkButton(profile_frame, text="تصدير المقاييس", width=120, command=self.export_metrics)
+        export_btn.pack(side=tk.RIGHT)
+        
         # أزرار الحفظ والإلغاء
         buttons_frame = ctk.CTkFrame(self.window, fg_color="transparent")
         buttons_frame.pack(fill=tk.X, padx=20, pady=20)
@@ -768,18 +1292,60 @@ class SettingsWindow:
         if folder:
             self.path_var.set(folder)
     
+    def export_metrics(self):
+        """تصدير مقاييس الأداء بصيغة JSON أو Prometheus"""
+        path = filedialog.asksaveasfilename(
+            parent=self.window,
+            defaultextension=".json",
+            filetypes=[("JSON", "*.json"), ("Prometheus", "*.prom")]
+        )
+        if path:
+            try:
+                metrics.write(path)
+            except OSError as e:
+                messagebox.showerror("خطأ", f"تعذر تصدير المقاييس: {e}")
+    
     def change_appearance(self, value):
         """تغيير مظهر التطبيق"""
         ctk.set_appearance_mode(value)
     
     def save_settings(self):
-        """حفظ الإعدادات"""
+        """حفظ الإعدادات؛ تُتحقق كل الحقول أولاً فلا يُحفظ شيء إن كان أحدها غير صالح"""
+        try:
+            values = {
+                "download_path": self.path_var.get(),
+                "concurrent_downloads": int(self.concurrent_var.get()),
+                "theme": self.appearance_var.get(),
+                "normalize_audio": self.normalize_var.get(),
+                "host_max_connections": self._positive_int(self.host_connections_var, "الاتصالات لكل موقع"),
+                "fragment_workers": self._positive_int(self.fragment_workers_var, "الأجزاء المتزامنة"),
+                "output_template": validate_template(self.template_var.get().strip()),
+                "download_windows": parse_windows(self.windows_var.get()),
+            }
+        except ValueError as e:
+            messagebox.showerror("خطأ", str(e))
+            return
+        
         # حفظ الإعدادات باستخدام SettingsManager
-        settings_manager.set("download_path", self.path_var.get())
-        settings_manager.set("concurrent_downloads", int(self.concurrent_var.get()))
-        settings_manager.set("theme", self.appearance_var.get())
+        settings_manager.update(values)
+        host_scheduler.apply_settings()
+        download_scheduler.wakeup.set()
+        
+        profile_mode = self.profile_var.get()
+        metrics.arm_profile(None if profile_mode == "off" else profile_mode)
         
         self.window.destroy()
+    
+    @staticmethod
+    def _positive_int(variable, label):
+        """قيمة حقل عددي؛ يرفع ValueError برسالة واضحة إن لم يكن رقماً صحيحاً موجباً"""
+        try:
+            value = int(variable.get().strip())
+        except ValueError:
+            raise ValueError(f"قيمة «{label}» يجب أن تكون رقماً صحيحاً") from None
+        if value < 1:
+            raise ValueError(f"قيمة «{label}» يجب أن تكون 1 على الأقل")
+        return value
 
 class HelpWindow:
     """نافذة المساعدة"""
@@ -850,6 +1416,9 @@ Vimeo, Dailymotion وأكثر من 50 موقع آخر
         close_btn.pack(pady=20)
 
 if __name__ == "__main__":
+    # ضروري لعمال المعالجة عند التجميع في ملف تنفيذي
+    multiprocessing.freeze_support()
+    
     # التحقق من المتطلبات
     try:
         import yt_dlp
@@ -2,15 +2,22 @@
 مشغل الوسائط المدمج
 """
 import os
-import threading
-import time
 from pathlib import Path
 import pygame
 import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk
 from utils import logger, format_duration
-from config import SUPPORTED_VIDEO_FORMATS, SUPPORTED_AUDIO_FORMATS
+from playback import PlaybackEngine
+from media_probe import media_probe
+from playlist import Playlist
+from waveform import waveform_service
+from integrity import integrity_checker
+from utils import ui_dispatcher
+from config import (
+    SUPPORTED_VIDEO_FORMATS, SUPPORTED_AUDIO_FORMATS, PLAYBACK_SAMPLE_RATE,
+    PLAYBACK_CHANNELS, PLAYBACK_VIDEO_SIZE
+)
 
 class MediaPlayer:
     """مشغل الوسائط المدمج"""
@@ -24,15 +31,24 @@ class MediaPlayer:
         self.duration = 0
         self.volume = 0.7
         
-        # تهيئة pygame للصوت
+        # تهيئة pygame للصوت بنفس صيغة PCM التي ينتجها فك الترميز
         try:
-            pygame.mixer.init()
+            pygame.mixer.init(frequency=PLAYBACK_SAMPLE_RATE, size=-16, channels=PLAYBACK_CHANNELS)
             self.audio_available = True
         except:
             self.audio_available = False
             logger.warning("فشل تهيئة مشغل الصوت")
         
+        self.engine = PlaybackEngine()
+        self.engine.set_volume(self.volume)
+        self.playlist = Playlist()
+        self.waveform = None
+        self.waveform_view = (0, 0)
+        
         self.setup_ui()
+        
+        # عرض الإطارات وتغذية الصوت على حلقة Tk
+        self.schedule_tick()
     
     def setup_ui(self):
         """إعداد واجهة المشغل"""
@@ -58,7 +74,7 @@ class MediaPlayer:
         self.display_label.pack(expand=True, fill=tk.BOTH)
         
         # شريط التحكم
-        self.control_frame = tk.Frame(self.player_window, bg="#2d2d2d", height=80)
+        self.control_frame = tk.Frame(self.player_window, bg="#2d2d2d", height=130)
         self.control_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
         self.control_frame.pack_propagate(False)
         
@@ -66,6 +82,15 @@ class MediaPlayer:
         self.progress_frame = tk.Frame(self.control_frame, bg="#2d2d2d")
         self.progress_frame.pack(fill=tk.X, pady=(10, 5))
         
+        # الموجة الصوتية (عجلة الفأرة للتكبير، النقر للانتقال)
+        self.waveform_canvas = tk.Canvas(self.progress_frame, height=48, bg="#1e1e1e", highlightthickness=0)
+        self.waveform_canvas.pack(fill=tk.X, padx=10, pady=(0, 4))
+        self.waveform_canvas.bind("<Configure>", lambda event: self.draw_waveform())
+        self.waveform_canvas.bind("<Button-1>", self.on_waveform_click)
+        self.waveform_canvas.bind("<MouseWheel>", self.on_waveform_zoom)
+        self.waveform_canvas.bind("<Button-4>", self.on_waveform_zoom)
+        self.waveform_canvas.bind("<Button-5>", self.on_waveform_zoom)
+        
         self.progress_var = tk.DoubleVar()
         self.progress_scale = ttk.Scale(
             self.progress_frame,
@@ -118,6 +143,50 @@ class MediaPlayer:
         )
         self.stop_button.pack(side=tk.LEFT, padx=2)
         
+        # أزرار التنقل في القائمة
+        tk.Button(
+            self.buttons_frame,
+            text="⏮",
+            font=("Arial", 14),
+            bg="#2196F3",
+            fg="white",
+            width=3,
+            command=self.play_previous
+        ).pack(side=tk.LEFT, padx=2)
+        
+        tk.Button(
+            self.buttons_frame,
+            text="⏭",
+            font=("Arial", 14),
+            bg="#2196F3",
+            fg="white",
+            width=3,
+            command=self.play_next
+        ).pack(side=tk.LEFT, padx=2)
+        
+        # الخلط والتكرار
+        self.shuffle_button = tk.Button(
+            self.buttons_frame,
+            text="🔀",
+            font=("Arial", 14),
+            bg="#555555",
+            fg="white",
+            width=3,
+            command=self.toggle_shuffle
+        )
+        self.shuffle_button.pack(side=tk.LEFT, padx=2)
+        
+        self.repeat_button = tk.Button(
+            self.buttons_frame,
+            text="🔁",
+            font=("Arial", 14),
+            bg="#555555",
+            fg="white",
+            width=3,
+            command=self.cycle_repeat
+        )
+        self.repeat_button.pack(side=tk.LEFT, padx=2)
+        
         # شريط الصوت
         self.volume_frame = tk.Frame(self.buttons_frame, bg="#2d2d2d")
         self.volume_frame.pack(side=tk.LEFT, padx=10)
@@ -139,10 +208,9 @@ class MediaPlayer:
         # قائمة الملفات
         self.setup_file_list()
         
-        # بدء thread المراقبة
+        # تحديث التقدم على حلقة Tk
         self.monitoring = True
-        self.monitor_thread = threading.Thread(target=self.monitor_playback, daemon=True)
-        self.monitor_thread.start()
+        self.schedule_progress_update()
     
     def setup_file_list(self):
         """إعداد قائمة الملفات"""
@@ -207,38 +275,113 @@ class MediaPlayer:
             filetypes=filetypes
         )
         
-        for file_path in files:
-            filename = Path(file_path).name
-            self.file_listbox.insert(tk.END, filename)
-            # حفظ المسار الكامل كسمة
-            self.file_listbox.insert(tk.END, file_path)
-            self.file_listbox.delete(tk.END)  # حذف المسار المكرر
-            
-            # إضافة المسار كبيانات مخفية
-            index = self.file_listbox.size() - 1
-            self.file_listbox.insert(index, file_path)
-            self.file_listbox.delete(index)
-            self.file_listbox.insert(tk.END, filename)
+        self.add_paths(files)
+    
+    def add_paths(self, paths):
+        """إضافة مسارات للقائمة مع إدراجها في الواجهة دفعة واحدة"""
+        entries = self.playlist.add_paths(paths)
+        if entries:
+            self.file_listbox.insert(tk.END, *[entry.title for entry in entries])
+            self.preload_next()
     
     def remove_file(self):
         """حذف ملف من القائمة"""
         selection = self.file_listbox.curselection()
         if selection:
+            self.playlist.remove(selection[0])
             self.file_listbox.delete(selection[0])
+            self.preload_next()
     
     def clear_playlist(self):
         """مسح قائمة التشغيل"""
+        self.playlist.clear()
+        self.engine.cancel_preload()
         self.file_listbox.delete(0, tk.END)
     
     def on_file_select(self, event):
         """عند اختيار ملف من القائمة"""
         selection = self.file_listbox.curselection()
         if selection:
-            filename = self.file_listbox.get(selection[0])
-            # البحث عن المسار الكامل (يحتاج تحسين)
-            # هذا مثال مبسط، في التطبيق الحقيقي نحتاج نظام أفضل
-            from tkinter import messagebox
-            messagebox.showinfo("تشغيل", f"سيتم تشغيل: {filename}")
+            self.play_index(selection[0])
+    
+    def play_index(self, index):
+        """تشغيل عنصر من القائمة حسب موضعه"""
+        self.playlist.set_current(index)
+        entry = self.playlist.current
+        if entry is None:
+            return
+        self.load_file(entry.path)
+        self.play()
+        self.highlight_current()
+        self.preload_next()
+    
+    def play_entry(self, entry):
+        if entry is not None:
+            self.play_index(self.playlist.entries.index(entry))
+    
+    def play_next(self):
+        """تشغيل العنصر التالي"""
+        self.play_entry(self.playlist.advance())
+    
+    def play_previous(self):
+        """تشغيل العنصر السابق"""
+        self.play_entry(self.playlist.advance(-1))
+    
+    def toggle_shuffle(self):
+        """تفعيل/تعطيل الخلط"""
+        self.playlist.set_shuffle(not self.playlist.shuffle)
+        self.shuffle_button.config(bg="#4CAF50" if self.playlist.shuffle else "#555555")
+        self.preload_next()
+    
+    def cycle_repeat(self):
+        """التبديل بين أوضاع التكرار"""
+        mode = self.playlist.cycle_repeat()
+        self.repeat_button.config(
+            text="🔂" if mode == "one" else "🔁",
+            bg="#555555" if mode == "off" else "#4CAF50"
+        )
+        self.preload_next()
+    
+    def preload_next(self):
+        """تجهيز المسار التالي مسبقاً ليبدأ دون فاصل"""
+        if self.playlist.current is None or self.current_file != self.playlist.current.path:
+            return
+        entry = self.playlist.peek_next()
+        if entry is None:
+            self.engine.cancel_preload()
+            return
+        try:
+            self.engine.preload(entry.path, with_video=self.is_video_path(entry.path))
+        except Exception as e:
+            logger.warning(f"تعذر تجهيز المسار التالي: {e}")
+    
+    def highlight_current(self):
+        """تحديد العنصر الحالي في الواجهة"""
+        index = self.playlist.current_index
+        self.file_listbox.selection_clear(0, tk.END)
+        if index is not None:
+            self.file_listbox.selection_set(index)
+            self.file_listbox.see(index)
+    
+    @staticmethod
+    def is_video_path(path):
+        return Path(path).suffix.lower() in SUPPORTED_VIDEO_FORMATS
+    
+    def on_track_changed(self):
+        """انتقال المحرك إلى المسار التالي دون فاصل"""
+        entry = self.playlist.advance()
+        self.current_file = self.engine.current_track
+        self.duration = self.engine.duration
+        if entry is not None:
+            entry.duration = self.duration
+        
+        filename = Path(self.current_file).name
+        if not self.engine.has_video:
+            self.display_label.config(text=f"🎵\n{filename}\n\nملف صوتي", image="")
+        
+        self.load_waveform(self.current_file)
+        self.highlight_current()
+        self.preload_next()
     
     def load_file(self, file_path):
         """تحميل ملف وسائط"""
@@ -246,6 +389,10 @@ class MediaPlayer:
             if not os.path.exists(file_path):
                 raise FileNotFoundError("الملف غير موجود")
             
+            # تحديث واجهة المستخدم
+            filename = Path(file_path).name
+            self.display_label.config(text=f"جاري تحميل:\n{filename}", image="")
+            
             self.current_file = file_path
             file_ext = Path(file_path).suffix.lower()
             
@@ -256,13 +403,15 @@ class MediaPlayer:
             else:
                 raise ValueError("نوع الملف غير مدعوم")
             
-            # تحديث واجهة المستخدم
-            filename = Path(file_path).name
-            self.display_label.config(text=f"جاري تحميل:\n{filename}")
+            self.update_time_display()
+            self.load_waveform(file_path)
             
         except Exception as e:
             logger.error(f"خطأ في تحميل الملف: {e}")
             self.display_label.config(text=f"خطأ في تحميل الملف:\n{str(e)}")
+            # قد يكون الملف تالفاً: التحقق منه وإصلاح أجزائه في الخلفية
+            if os.path.exists(file_path):
+                integrity_checker.recheck(file_path)
     
     def load_audio(self, audio_path):
         """تحميل ملف صوتي"""
@@ -270,9 +419,10 @@ class MediaPlayer:
             raise Exception("مشغل الصوت غير متاح")
         
         try:
-            pygame.mixer.music.load(audio_path)
-            self.duration = self.get_audio_length(audio_path)
+            self.engine.load(audio_path)
+            self.duration = self.engine.duration
             self.is_playing = False
+            self.is_paused = False
             self.position = 0
             
             # تحديث الواجهة للصوت
@@ -286,18 +436,19 @@ class MediaPlayer:
             raise Exception(f"فشل تحميل الملف الصوتي: {e}")
     
     def load_video(self, video_path):
-        """تحميل ملف فيديو (مبسط)"""
+        """تحميل ملف فيديو"""
         try:
-            # للفيديو، نعرض فقط معلومات أساسية
-            # في تطبيق حقيقي، نحتاج مكتبة تشغيل فيديو مثل opencv أو vlc
+            self.engine.load(video_path, with_video=True)
+            self.duration = self.engine.duration
+            self.is_playing = False
+            self.is_paused = False
+            self.position = 0
+            
             filename = Path(video_path).name
             self.display_label.config(
-                text=f"🎬\n{filename}\n\nملف فيديو\n(تشغيل الصوت فقط)",
+                text=f"🎬\n{filename}\n\nملف فيديو",
                 font=("Arial", 14)
             )
-            
-            # محاولة تشغيل الصوت من الفيديو
-            # هذا مثال مبسط، في التطبيق الحقيقي نحتاج استخراج الصوت
             self.current_file = video_path
             
         except Exception as e:
@@ -310,30 +461,29 @@ class MediaPlayer:
         
         try:
             if self.audio_available:
-                if self.is_paused:
-                    pygame.mixer.music.unpause()
-                else:
-                    pygame.mixer.music.play(start=self.position)
+                self.engine.play()
                 
                 self.is_playing = True
                 self.is_paused = False
                 self.play_button.config(text="⏸", bg="#FF9800")
                 
+                if self.engine.preloaded is None:
+                    self.preload_next()
+        
         except Exception as e:
             logger.error(f"خطأ في التشغيل: {e}")
     
     def pause(self):
         """إيقاف مؤقت"""
         if self.is_playing and self.audio_available:
-            pygame.mixer.music.pause()
+            self.engine.pause()
             self.is_paused = True
             self.is_playing = False
             self.play_button.config(text="▶", bg="#4CAF50")
     
     def stop(self):
         """إيقاف التشغيل"""
-        if self.audio_available:
-            pygame.mixer.music.stop()
+        self.engine.stop()
         
         self.is_playing = False
         self.is_paused = False
@@ -354,52 +504,178 @@ class MediaPlayer:
         if self.duration > 0:
             new_position = (float(value) / 100) * self.duration
             self.position = new_position
-            # في تطبيق حقيقي، نحتاج تنفيذ seek للموضع الجديد
+            self.engine.seek(new_position)
     
     def on_volume_change(self, value):
         """عند تغيير مستوى الصوت"""
         self.volume = float(value) / 100
         if self.audio_available:
-            pygame.mixer.music.set_volume(self.volume)
+            self.engine.set_volume(self.volume)
     
     def get_audio_length(self, audio_path):
-        """الحصول على مدة الملف الصوتي (مبسط)"""
-        # في تطبيق حقيقي، نستخدم مكتبة مثل mutagen
+        """الحصول على مدة الملف من بيانات الحاوية"""
+        return media_probe.probe(audio_path)['duration']
+    
+    def schedule_tick(self):
+        """جدولة الدورة التالية للتشغيل دون حجب حلقة Tk"""
+        delay = 15 if self.engine.has_video else 40
         try:
-            import wave
-            with wave.open(audio_path, 'r') as wav_file:
-                frames = wav_file.getnframes()
-                rate = wav_file.getframerate()
-                duration = frames / float(rate)
-                return duration
-        except:
-            return 180  # قيمة افتراضية 3 دقائق
-    
-    def monitor_playback(self):
-        """مراقبة حالة التشغيل"""
-        while self.monitoring:
-            try:
-                if self.is_playing and not self.is_paused:
-                    self.position += 1
-                    
-                    if self.duration > 0:
-                        progress = (self.position / self.duration) * 100
-                        self.progress_var.set(progress)
-                        
-                        current_time = format_duration(self.position)
-                        total_time = format_duration(self.duration)
-                        self.time_label.config(text=f"{current_time} / {total_time}")
-                
-                time.sleep(1)
+            self.tick_job = self.player_window.after(delay, self.tick)
+        except tk.TclError:
+            pass
+    
+    def tick(self):
+        """تغذية الصوت وعرض الإطار الذي حان وقته"""
+        try:
+            self.engine.pump()
+            
+            if self.engine.current_track and self.engine.current_track != self.current_file:
+                self.on_track_changed()
+            
+            frame = self.engine.next_frame()
+            if frame is not None:
+                image = Image.frombuffer("RGB", PLAYBACK_VIDEO_SIZE, frame, "raw", "RGB", 0, 1)
+                self.frame_image = ImageTk.PhotoImage(image)
+                self.display_label.config(image=self.frame_image, text="")
+            
+            if self.engine.state == 'ended' and self.is_playing:
+                self.is_playing = False
+                self.is_paused = False
+                self.position = self.engine.position
+                self.update_time_display()
+                self.play_button.config(text="▶", bg="#4CAF50")
                 
-            except Exception as e:
-                logger.error(f"خطأ في مراقبة التشغيل: {e}")
-                time.sleep(1)
+                # المسار التالي لم يُجهز مسبقاً (مثل ملف بلا صوت)
+                if self.playlist.current is not None and self.current_file == self.playlist.current.path:
+                    self.play_entry(self.playlist.advance())
+        except Exception as e:
+            logger.error(f"خطأ في دورة التشغيل: {e}")
+        
+        self.schedule_tick()
+    
+    def update_time_display(self):
+        """تحديث شريط التقدم والوقت"""
+        if self.duration > 0:
+            self.progress_var.set((self.position / self.duration) * 100)
+        current_time = format_duration(self.position)
+        total_time = format_duration(self.duration)
+        self.time_label.config(text=f"{current_time} / {total_time}")
+        self.draw_playhead()
+    
+    def load_waveform(self, file_path):
+        """طلب فهرس الموجة للملف الحالي"""
+        self.waveform = None
+        self.waveform_view = (0, self.duration)
+        self.waveform_canvas.delete("all")
+        
+        def on_ready(path, index):
+            if path == str(self.current_file):
+                self.waveform = index
+                self.draw_waveform()
+        
+        waveform_service.request(
+            file_path,
+            lambda path, index: ui_dispatcher.call(on_ready, path, index)
+        )
+    
+    def draw_waveform(self):
+        """رسم الموجة للنطاق المعروض من الفهرس المحسوب مسبقاً"""
+        canvas = self.waveform_canvas
+        canvas.delete("wave")
+        if self.waveform is None:
+            return
+        
+        width = canvas.winfo_width()
+        height = canvas.winfo_height()
+        start, end = self.waveform_view
+        if end <= start:
+            end = self.duration or self.waveform.duration
+            self.waveform_view = (start, end)
+        
+        peaks = self.waveform.render(start, end, width)
+        if peaks is None:
+            return
+        
+        mins, maxs, rms = peaks
+        step = width / len(mins)
+        middle = height / 2
+        for i in range(len(mins)):
+            x = i * step
+            canvas.create_line(x, middle - maxs[i] * middle, x, middle - mins[i] * middle, fill="#3b6ea5", tags="wave")
+            canvas.create_line(x, middle - rms[i] * middle, x, middle + rms[i] * middle, fill="#64b5f6", tags="wave")
+        self.draw_playhead()
+    
+    def draw_playhead(self):
+        """رسم مؤشر الموضع الحالي فوق الموجة"""
+        canvas = self.waveform_canvas
+        canvas.delete("playhead")
+        start, end = self.waveform_view
+        if self.waveform is None or end <= start or not start <= self.position <= end:
+            return
+        x = (self.position - start) / (end - start) * canvas.winfo_width()
+        canvas.create_line(x, 0, x, canvas.winfo_height(), fill="#FF9800", tags="playhead")
+    
+    def waveform_time_at(self, x):
+        start, end = self.waveform_view
+        return start + (end - start) * x / max(self.waveform_canvas.winfo_width(), 1)
+    
+    def on_waveform_click(self, event):
+        """الانتقال إلى الموضع المنقور على الموجة"""
+        if self.duration > 0:
+            position = self.waveform_time_at(event.x)
+            self.on_seek(position / self.duration * 100)
+            self.progress_var.set(position / self.duration * 100)
+            self.draw_playhead()
+    
+    def on_waveform_zoom(self, event):
+        """تكبير/تصغير الموجة حول موضع الفأرة"""
+        if self.waveform is None or self.duration <= 0:
+            return
+        zoom_in = event.num == 4 or getattr(event, "delta", 0) > 0
+        factor = 0.5 if zoom_in else 2.0
+        
+        start, end = self.waveform_view
+        anchor = self.waveform_time_at(event.x)
+        span = min(max((end - start) * factor, 0.5), self.duration)
+        ratio = (anchor - start) / (end - start)
+        start = min(max(anchor - span * ratio, 0), self.duration - span)
+        self.waveform_view = (start, start + span)
+        self.draw_waveform()
+    
+    def progress_interval(self):
+        """فترة التحديث بالمللي ثانية: بقدر زمن بكسل واحد من شريط التقدم"""
+        if not (self.is_playing and not self.is_paused) or self.duration <= 0:
+            return 500
+        
+        width = max(self.progress_scale.winfo_width(), 1)
+        seconds_per_pixel = self.duration / width
+        return int(min(max(seconds_per_pixel * 1000, 40), 500))
+    
+    def schedule_progress_update(self):
+        """جدولة تحديث التقدم التالي"""
+        if not self.monitoring:
+            return
+        try:
+            self.progress_job = self.player_window.after(self.progress_interval(), self.update_progress)
+        except tk.TclError:
+            pass
+    
+    def update_progress(self):
+        """قراءة ساعة التشغيل وتحديث الواجهة"""
+        try:
+            if self.is_playing and not self.is_paused:
+                self.position = self.engine.position
+                self.update_time_display()
+        except Exception as e:
+            logger.error(f"خطأ في مراقبة التشغيل: {e}")
+        
+        self.schedule_progress_update()
     
     def close(self):
         """إغلاق المشغل"""
         self.monitoring = False
         self.stop()
+        self.engine.close()
         
         try:
             self.playlist_window.destroy()
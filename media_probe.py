@@ -0,0 +1,145 @@
+"""
+خدمة فحص الوسائط: المدة والترميز ومعدل البت مع تخزين مؤقت دائم
+"""
+import os
+import json
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from utils import logger, FileResultCache
+from config import CONFIG_DIR, MEDIA_PROBE_WORKERS
+
+class MediaProbe:
+    """تشغيل ffprobe في مجموعة عمال وتخزين النتائج حسب (المسار، الحجم، وقت التعديل)"""
+    
+    def __init__(self, cache_file=CONFIG_DIR / "media_probe.json", max_workers=MEDIA_PROBE_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="probe")
+        self.lock = threading.RLock()
+        self.cache = FileResultCache(cache_file)
+        self.inflight = {}
+    
+    def cached(self, path):
+        """نتيجة الفحص المخزنة إن كانت صالحة للملف الحالي"""
+        return self.cache.get(path)
+    
+    def probe(self, path):
+        """فحص ملف (من الذاكرة إن أمكن)"""
+        path = str(path)
+        info = self.cached(path)
+        if info is not None:
+            return info
+        
+        if not os.path.exists(path):
+            return self._empty_info()
+        
+        info = self._run_ffprobe(path)
+        if info['valid']:
+            self.cache.put(path, info)
+        return info
+    
+    def probe_async(self, path, callback=None):
+        """فحص ملف في مجموعة العمال؛ الطلبات المتزامنة لنفس الملف تشترك في عملية واحدة"""
+        path = str(path)
+        info = self.cached(path)
+        if info is not None:
+            if callback:
+                callback(path, info)
+            return None
+        
+        with self.lock:
+            future = self.inflight.get(path)
+            if future is None:
+                future = self.executor.submit(self.probe, path)
+                self.inflight[path] = future
+                future.add_done_callback(lambda f: self._forget(path))
+        
+        if callback:
+            future.add_done_callback(lambda f: self._deliver(path, f, callback))
+        return future
+    
+    def probe_many(self, paths, callback):
+        """فحص مجموعة ملفات في الخلفية"""
+        for path in paths:
+            self.probe_async(path, callback)
+    
+    def _forget(self, path):
+        with self.lock:
+            self.inflight.pop(path, None)
+    
+    @staticmethod
+    def _deliver(path, future, callback):
+        try:
+            callback(path, future.result())
+        except Exception as e:
+            logger.error(f"خطأ في فحص الوسائط: {e}")
+    
+    @staticmethod
+    def _empty_info():
+        return {
+            'valid': False, 'duration': 0, 'format': '', 'bit_rate': 0,
+            'has_audio': False, 'has_video': False, 'fps': 0,
+            'audio_codec': None, 'audio_bitrate': 0, 'sample_rate': 0, 'channels': 0,
+            'video_codec': None, 'width': 0, 'height': 0
+        }
+    
+    def _run_ffprobe(self, path):
+        """تشغيل ffprobe وتحويل مخرجاته إلى قاموس مختصر"""
+        info = self._empty_info()
+        try:
+            output = subprocess.run(
+                ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", path],
+                capture_output=True, timeout=30, check=True
+            ).stdout
+            data = json.loads(output or b"{}")
+        except Exception as e:
+            logger.warning(f"تعذر فحص الملف عبر ffprobe: {e}")
+            return info
+        
+        fmt = data.get('format', {})
+        info['valid'] = True
+        info['duration'] = float(fmt.get('duration') or 0)
+        info['format'] = fmt.get('format_name', '')
+        info['bit_rate'] = int(fmt.get('bit_rate') or 0)
+        
+        for stream in data.get('streams', []):
+            codec_type = stream.get('codec_type')
+            if codec_type == 'audio' and not info['has_audio']:
+                info['has_audio'] = True
+                info['audio_codec'] = stream.get('codec_name')
+                info['audio_bitrate'] = int(stream.get('bit_rate') or 0)
+                info['sample_rate'] = int(stream.get('sample_rate') or 0)
+                info['channels'] = int(stream.get('channels') or 0)
+            elif codec_type == 'video' and not info['has_video']:
+                # صورة الغلاف في ملفات الصوت ليست مساراً مرئياً
+                if stream.get('disposition', {}).get('attached_pic'):
+                    continue
+                info['has_video'] = True
+                info['video_codec'] = stream.get('codec_name')
+                info['width'] = int(stream.get('width') or 0)
+                info['height'] = int(stream.get('height') or 0)
+                num, _, den = (stream.get('avg_frame_rate') or "0/1").partition("/")
+                try:
+                    info['fps'] = float(num) / float(den or 1)
+                except (ValueError, ZeroDivisionError):
+                    pass
+        
+        if not info['duration']:
+            for stream in data.get('streams', []):
+                info['duration'] = max(info['duration'], float(stream.get('duration') or 0))
+        return info
+    
+    def matches_audio_target(self, path, codec, bitrate_kbps, tolerance=0.08):
+        """هل ترميز الصوت ومعدل البت في الملف يطابقان الهدف (لتجنب إعادة الترميز)"""
+        info = self.probe(path)
+        if not info['has_audio'] or info['audio_codec'] != codec or not info['audio_bitrate']:
+            return False
+        target = int(bitrate_kbps) * 1000
+        return abs(info['audio_bitrate'] - target) <= target * tolerance
+    
+    def shutdown(self):
+        """حفظ الذاكرة وإيقاف العمال"""
+        self.cache.save()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+# إنشاء كائنات عامة
+media_probe = MediaProbe()
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""
+البيانات الوصفية للروابط: استخراج واحد لكل فيديو، ذاكرة مؤقتة محدودة، وجلب مسبق للروابط المنسوخة
+"""
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from utils import logger, validate_url
+from url_canonical import canonicalize, UNKNOWN_PLATFORM
+from downloader import video_downloader
+from config import (
+    METADATA_CACHE_SIZE, METADATA_CACHE_TTL, METADATA_PREFETCH_QUEUE,
+    METADATA_PREFETCH_WORKERS, METADATA_REQUEST_TIMEOUT
+)
+
+class MetadataCache:
+    """نتائج get_video_info حسب مفتاح الرابط الموحد مع إخلاء الأقدم استخداماً"""
+    
+    def __init__(self, max_entries=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # المفتاح -> (وقت الجلب، البيانات)
+    
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+    
+    def put(self, key, info):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), info)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+    
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+class MetadataRequest:
+    """طلب تحليل واحد؛ يُستدعى callback مرة واحدة فقط: بالنتيجة أو بانتهاء المهلة، أو لا يُستدعى بعد الإلغاء"""
+    
+    def __init__(self, url, callback):
+        self.url = url
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.done = False
+        self.timer = None
+    
+    def finish(self, info, error):
+        with self.lock:
+            if self.done:
+                return
+            self.done = True
+        if self.timer:
+            self.timer.cancel()
+        self.callback({**info, 'url': self.url} if info else None, error)
+    
+    def cancel(self):
+        """إسقاط النتيجة؛ الاستخراج المشترك يكمل ويحفظ نتيجته في الذاكرة المؤقتة"""
+        with self.lock:
+            self.done = True
+        if self.timer:
+            self.timer.cancel()
+
+class MetadataService:
+    """استخراج واحد لكل رابط موحد مهما تعددت الطلبات، مع جلب مسبق للروابط المنسوخة"""
+    
+    def __init__(self, max_pending=METADATA_PREFETCH_QUEUE, max_workers=METADATA_PREFETCH_WORKERS):
+        self.cache = MetadataCache()
+        self.max_workers = max_workers
+        self.condition = threading.Condition()
+        # الطابور محدود: النسخ السريع المتكرر يُسقط أقدم الروابط المنتظرة
+        self.pending = deque(maxlen=max_pending)
+        self.flights = {}  # مفتاح الرابط الموحد -> Future للاستخراج الجاري
+        self.workers = []
+    
+    def lookup(self, url):
+        """البيانات المحفوظة للرابط (بأي شكل من أشكاله) أو None"""
+        info = self.cache.get(canonicalize(url).key)
+        if info is None:
+            return None
+        return {**info, 'url': url}
+    
+    def request(self, url, callback, timeout=METADATA_REQUEST_TIMEOUT):
+        """تحليل رابط: من الذاكرة المؤقتة، أو بالانضمام إلى استخراج جارٍ لنفس الفيديو، أو باستخراج جديد"""
+        request = MetadataRequest(url, callback)
+        key = canonicalize(url).key
+        info = self.cache.get(key)
+        if info is not None:
+            request.finish(info, None)
+            return request
+        
+        with self.condition:
+            future, started = self._flight(key)
+        if started:
+            threading.Thread(target=self._extract, args=(key, url, future), name="metadata-request", daemon=True).start()
+        
+        request.timer = threading.Timer(timeout, request.finish, (None, "انتهت مهلة الحصول على معلومات الفيديو"))
+        request.timer.daemon = True
+        request.timer.start()
+        future.add_done_callback(lambda done: request.finish(*done.result()))
+        return request
+    
+    def _flight(self, key):
+        """الاستخراج الجاري للمفتاح، أو Future جديد (يُستدعى مع القفل)"""
+        future = self.flights.get(key)
+        if future is not None:
+            return future, False
+        future = self.flights[key] = Future()
+        return future, True
+    
+    def _extract(self, key, url, future):
+        """تنفيذ الاستخراج وتوزيع نتيجته على كل المنتظرين"""
+        result = [None, None]
+        
+        def extracted(info, error):
+            result[:] = [info, error]
+        
+        try:
+            video_downloader.get_video_info(url, extracted)
+            if result[0]:
+                self.cache.put(key, result[0])
+        except Exception as e:
+            logger.error(f"خطأ في الحصول على البيانات الوصفية: {e}")
+            result[1] = str(e)
+        finally:
+            with self.condition:
+                self.flights.pop(key, None)
+            future.set_result(tuple(result))
+    
+    def prefetch(self, url):
+        """جدولة جلب البيانات في الخلفية؛ يتجاهل الروابط المحفوظة أو الجاري جلبها"""
+        if not validate_url(url):
+            return False
+        canonical = canonicalize(url)
+        # الروابط من منصات معروفة فقط: لا داعي لإرسال كل رابط منسوخ إلى المستخرج
+        if canonical.platform == UNKNOWN_PLATFORM or canonical.key in self.cache:
+            return False
+        
+        with self.condition:
+            if canonical.key in self.flights or any(key == canonical.key for key, _ in self.pending):
+                return False
+            self.pending.append((canonical.key, url))
+            if len(self.workers) < self.max_workers:
+                worker = threading.Thread(target=self._worker, name="metadata-prefetch", daemon=True)
+                self.workers.append(worker)
+                worker.start()
+            self.condition.notify()
+        return True
+    
+    def _worker(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                key, url = self.pending.pop()  # الأحدث أولاً: آخر رابط نسخه المستخدم
+                future, started = self._flight(key)
+            if started:
+                self._extract(key, url, future)
+
+# إنشاء كائنات عامة
+metadata_service = MetadataService()
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+تخطيط مجلد المكتبة: قوالب أسماء الملفات، مجلدات فرعية مجزأة، وحل تعارض الأسماء
+"""
+import os
+import re
+import hashlib
+import threading
+from string import Formatter
+from pathlib import Path
+from utils import sanitize_filename, settings_manager, get_video_info_from_url
+from config import OUTPUT_TEMPLATE, OUTPUT_COMPONENT_MAX_LENGTH
+
+UNKNOWN = "غير معروف"
+TEMPLATE_FIELDS = ("platform", "uploader", "title", "id", "date", "year", "month", "shard")
+
+# "الاسم (3)" كما تنشئه claim
+SUFFIX_PATTERN = re.compile(r"^(?P<stem>.+) \((?P<number>\d+)\)$")
+# أسماء محجوزة في Windows لا يمكن استخدامها كاسم ملف أو مجلد
+RESERVED_NAMES = {"con", "prn", "aux", "nul"} | {f"{prefix}{i}" for prefix in ("com", "lpt") for i in range(1, 10)}
+
+def validate_template(template):
+    """التحقق من القالب؛ يرفع ValueError عند وجود حقل غير معروف أو قالب فارغ"""
+    if not template or not template.strip("/ "):
+        raise ValueError("قالب الإخراج فارغ")
+    for _, field, _, _ in Formatter().parse(template):
+        if field is not None and field not in TEMPLATE_FIELDS:
+            raise ValueError(f"حقل غير معروف في قالب الإخراج: {{{field}}}")
+    return template
+
+def clean_component(value, max_length=OUTPUT_COMPONENT_MAX_LENGTH):
+    """جزء واحد من المسار: تنظيف الاسم، تحديد طوله، وتجنب الأسماء المحجوزة"""
+    value = sanitize_filename(str(value))[:max_length].rstrip('. ')
+    if value.split('.')[0].lower() in RESERVED_NAMES:
+        value = f"_{value}"
+    return value
+
+def template_fields(info):
+    """قيم حقول القالب من معلومات yt-dlp"""
+    url = info.get('webpage_url') or info.get('original_url') or ""
+    platform = get_video_info_from_url(url)["platform"] if url else UNKNOWN
+    if platform == UNKNOWN:
+        platform = info.get('extractor_key') or UNKNOWN
+    
+    upload_date = str(info.get('upload_date') or "")
+    if len(upload_date) == 8 and upload_date.isdigit():
+        year, month, day = upload_date[:4], upload_date[4:6], upload_date[6:]
+        date = f"{year}-{month}-{day}"
+    else:
+        year = month = date = UNKNOWN
+    
+    video_id = str(info.get('id') or "")
+    title = info.get('title') or "فيديو بدون عنوان"
+    # مجلد فرعي ثابت لكل فيديو يوزع المكتبة على 256 مجلداً
+    shard = hashlib.sha1((video_id or title).encode("utf-8")).hexdigest()[:2]
+    
+    fields = {
+        'platform': platform,
+        'uploader': info.get('uploader') or info.get('channel') or info.get('uploader_id') or UNKNOWN,
+        'title': title,
+        'id': video_id or UNKNOWN,
+        'date': date,
+        'year': year,
+        'month': month,
+        'shard': shard,
+    }
+    return {key: clean_component(value) or UNKNOWN for key, value in fields.items()}
+
+class OutputLayout:
+    """مسارات الإخراج حسب القالب مع فهرس أسماء في الذاكرة لحل التعارض"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.names = {}     # المجلد -> {الاسم بدون حساسية لحالة الأحرف: الاسم على القرص} من آخر فحص
+        self.claims = {}    # المجلد -> أسماء محجوزة لملفات لم تصل إلى القرص بعد
+        self.suffixes = {}  # (المجلد، الاسم) -> رقم اللاحقة التالي
+    
+    @property
+    def template(self):
+        template = settings_manager.get("output_template", OUTPUT_TEMPLATE)
+        try:
+            return validate_template(template)
+        except ValueError:
+            return OUTPUT_TEMPLATE
+    
+    def render(self, info, ext, template=None):
+        """المسار النسبي للملف حسب القالب"""
+        fields = template_fields(info)
+        parts = []
+        for segment in (template or self.template).split("/"):
+            part = clean_component(segment.format_map(fields))
+            if part:
+                parts.append(part)
+        if not parts:
+            parts.append(fields['title'])
+        
+        ext = f".{ext.lstrip('.')}" if ext else ""
+        return Path(*parts[:-1], parts[-1] + ext)
+    
+    def destination(self, root, info, ext, template=None):
+        """حجز مسار فريد داخل root للملف حسب القالب (قالب الإعدادات إن لم يُحدد)"""
+        return self.claim(Path(root) / self.render(info, ext, template))
+    
+    def _directory_names(self, directory):
+        """الأسماء في المجلد؛ يُقرأ المجلد مرة واحدة فقط ثم يُحدَّث الفهرس في الذاكرة"""
+        names = self.names.get(directory)
+        if names is None:
+            try:
+                with os.scandir(directory) as entries:
+                    names = {entry.name.casefold(): entry.name for entry in entries}
+            except OSError:
+                names = {}
+            self.names[directory] = names
+        return names
+    
+    def _taken(self, directory, name):
+        """الاسم محجوز أو موجود؛ أسماء الفحص تُؤكَّد على القرص وتُحذف إن لم تعد موجودة"""
+        folded = name.casefold()
+        if folded in self.claims.get(directory, ()):
+            return True
+        names = self._directory_names(directory)
+        existing = names.get(folded)
+        if existing is not None:
+            if os.path.lexists(os.path.join(directory, existing)):
+                return True
+            self._forget(directory, existing)
+        if os.path.lexists(os.path.join(directory, name)):
+            names[folded] = name
+            return True
+        return False
+    
+    def _forget(self, directory, name):
+        """حذف اسم لم يعد موجوداً من الفهرس وإرجاع رقم اللاحقة ليُعاد استخدامه"""
+        self.names.get(directory, {}).pop(name.casefold(), None)
+        match = SUFFIX_PATTERN.match(Path(name).stem)
+        if match:
+            key = (directory, (match.group('stem') + Path(name).suffix).casefold())
+            number = int(match.group('number'))
+            if number < self.suffixes.get(key, 2):
+                self.suffixes[key] = number
+    
+    def claim(self, path):
+        """حجز اسم غير مستخدم: الاسم نفسه، أو "الاسم (2)"، "الاسم (3)"...
+        
+        رقم اللاحقة التالي محفوظ لكل اسم، فلا يُعاد فحص اللواحق السابقة
+        مهما تكرر نفس العنوان؛ ويعود إلى الخلف عند تحرير اسم سابق.
+        """
+        path = Path(path)
+        directory = str(path.parent)
+        stem = clean_component(path.stem) or UNKNOWN
+        candidate = stem + path.suffix
+        
+        with self.lock:
+            key = (directory, candidate.casefold())
+            if not self._taken(directory, candidate):
+                self.suffixes.pop(key, None)
+            else:
+                number = self.suffixes.get(key, 2)
+                while True:
+                    candidate = f"{stem} ({number}){path.suffix}"
+                    number += 1
+                    if not self._taken(directory, candidate):
+                        break
+                self.suffixes[key] = number
+            self.claims.setdefault(directory, set()).add(candidate.casefold())
+        return path.parent / candidate
+    
+    def committed(self, path):
+        """الملف وصل إلى القرص: ينتقل اسمه من الحجوزات إلى فهرس المجلد"""
+        path = Path(path)
+        directory = str(path.parent)
+        with self.lock:
+            self._discard_claim(directory, path.name)
+            self._directory_names(directory)[path.name.casefold()] = path.name
+    
+    def release(self, path):
+        """إلغاء حجز اسم لم يُستخدم (فشل نقل الملف)"""
+        path = Path(path)
+        directory = str(path.parent)
+        with self.lock:
+            self._discard_claim(directory, path.name)
+            if not os.path.lexists(path):
+                self._forget(directory, path.name)
+    
+    def _discard_claim(self, directory, name):
+        claims = self.claims.get(directory)
+        if claims is not None:
+            claims.discard(name.casefold())
+            if not claims:
+                del self.claims[directory]
+
+# إنشاء كائنات عامة
+output_layout = OutputLayout()
\ No newline at end of file
@@ -0,0 +1,422 @@
+"""
+محرك التشغيل: فك ترميز الصوت والإطارات عبر ffmpeg مع مخزن قراءة مسبقة
+"""
+import time
+import threading
+import subprocess
+from collections import deque
+import pygame
+from utils import logger
+from media_probe import media_probe
+from config import (
+    PLAYBACK_SAMPLE_RATE, PLAYBACK_CHANNELS, PLAYBACK_CHUNK_SECONDS,
+    PLAYBACK_BUFFER_SECONDS, PLAYBACK_VIDEO_SIZE, PLAYBACK_MAX_FPS,
+    PLAYBACK_VIDEO_BUFFER_FRAMES
+)
+
+BYTES_PER_SECOND = PLAYBACK_SAMPLE_RATE * PLAYBACK_CHANNELS * 2
+
+class RingBuffer:
+    """مخزن دائري محدود آمن بين thread المنتج وحلقة Tk"""
+    
+    def __init__(self, capacity):
+        self.items = deque()
+        self.capacity = capacity
+        self.condition = threading.Condition()
+        self.closed = False
+        self.eof = False
+    
+    def put(self, item):
+        """إضافة عنصر مع الانتظار عند امتلاء المخزن؛ يعيد False عند الإغلاق"""
+        with self.condition:
+            while len(self.items) >= self.capacity and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                return False
+            self.items.append(item)
+            return True
+    
+    def get(self):
+        """سحب عنصر دون انتظار"""
+        with self.condition:
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.condition.notify()
+            return item
+    
+    def peek(self):
+        with self.condition:
+            return self.items[0] if self.items else None
+    
+    def finish(self):
+        """إعلام نهاية البيانات من المنتج"""
+        with self.condition:
+            self.eof = True
+            self.condition.notify_all()
+    
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.items.clear()
+            self.condition.notify_all()
+    
+    @property
+    def drained(self):
+        with self.condition:
+            return self.eof and not self.items
+    
+    def __len__(self):
+        with self.condition:
+            return len(self.items)
+
+class FFmpegDecoder:
+    """فك ترميز ملف بدءاً من زمن محدد عبر أنبوب ffmpeg في thread خلفي"""
+    
+    def __init__(self, path, start=0, with_audio=True, with_video=False, fps=0):
+        self.path = str(path)
+        self.start = start
+        self.fps = min(fps or PLAYBACK_MAX_FPS, PLAYBACK_MAX_FPS)
+        self.processes = []
+        self.threads = []
+        self.stopped = False
+        
+        chunk_count = max(2, int(PLAYBACK_BUFFER_SECONDS / PLAYBACK_CHUNK_SECONDS))
+        self.audio_buffer = RingBuffer(chunk_count) if with_audio else None
+        self.video_buffer = RingBuffer(PLAYBACK_VIDEO_BUFFER_FRAMES) if with_video else None
+    
+    def start_decoding(self):
+        """تشغيل عمليات ffmpeg و threads القراءة"""
+        base = ["ffmpeg", "-nostdin", "-v", "error", "-ss", f"{self.start:.3f}", "-i", self.path]
+        
+        if self.audio_buffer is not None:
+            command = base + [
+                "-vn", "-f", "s16le", "-acodec", "pcm_s16le",
+                "-ac", str(PLAYBACK_CHANNELS), "-ar", str(PLAYBACK_SAMPLE_RATE), "pipe:1"
+            ]
+            chunk_bytes = int(BYTES_PER_SECOND * PLAYBACK_CHUNK_SECONDS) // 4 * 4
+            self._spawn(command, self.audio_buffer, chunk_bytes, chunk_bytes / BYTES_PER_SECOND)
+        
+        if self.video_buffer is not None:
+            width, height = PLAYBACK_VIDEO_SIZE
+            video_filter = (
+                f"fps={self.fps},scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2"
+            )
+            command = base + ["-an", "-vf", video_filter, "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"]
+            self._spawn(command, self.video_buffer, width * height * 3, 1 / self.fps)
+    
+    def _spawn(self, command, buffer, item_bytes, item_seconds):
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.processes.append(process)
+        
+        thread = threading.Thread(
+            target=self._read_loop,
+            args=(process, buffer, item_bytes, item_seconds),
+            daemon=True
+        )
+        self.threads.append(thread)
+        thread.start()
+    
+    def _read_loop(self, process, buffer, item_bytes, item_seconds):
+        """قراءة البيانات من الأنبوب إلى المخزن مع حساب الطابع الزمني"""
+        pts = self.start
+        try:
+            while not self.stopped:
+                data = process.stdout.read(item_bytes)
+                if not data:
+                    break
+                if not buffer.put((pts, data)):
+                    break
+                pts += item_seconds * len(data) / item_bytes
+        except Exception as e:
+            if not self.stopped:
+                logger.error(f"خطأ في فك الترميز: {e}")
+        finally:
+            buffer.finish()
+    
+    def stop(self):
+        """إيقاف فك الترميز وتحرير الموارد"""
+        self.stopped = True
+        for buffer in (self.audio_buffer, self.video_buffer):
+            if buffer is not None:
+                buffer.close()
+        for process in self.processes:
+            try:
+                process.kill()
+                process.wait(timeout=2)
+            except Exception:
+                pass
+        for thread in self.threads:
+            thread.join(timeout=2)
+
+class PlaybackClock:
+    """ساعة التشغيل مشتقة من موضع جهاز الصوت
+    
+    تُثبَّت الساعة عند بداية كل مقطع PCM على القناة؛ وعندما تتعاقب المقاطع دون
+    انقطاع يُحسب زمن بداية المقطع من نهاية سابقه بدلاً من لحظة اكتشافه، فلا
+    تتأثر الدقة بتأخر حلقة Tk.
+    """
+    
+    def __init__(self):
+        self.anchor_pts = 0
+        self.anchor_time = None
+        self.chunk_end = 0
+        self.frozen = 0
+        self.running = False
+    
+    def reset(self, position):
+        """إيقاف الساعة عند موضع محدد"""
+        self.anchor_time = None
+        self.frozen = position
+        self.running = False
+    
+    def chunk_started(self, pts, duration, contiguous):
+        """تسجيل بدء تشغيل مقطع على الجهاز"""
+        now = time.monotonic()
+        if contiguous and self.anchor_time is not None:
+            start_time = min(self.anchor_time + (self.chunk_end - self.anchor_pts), now)
+        else:
+            start_time = now
+        self.anchor_pts = pts
+        self.anchor_time = start_time
+        self.chunk_end = pts + duration
+        self.running = True
+    
+    def pause(self):
+        self.frozen = self.position()
+        self.running = False
+    
+    def resume(self):
+        if self.anchor_time is not None:
+            self.anchor_time = time.monotonic() - (self.frozen - self.anchor_pts)
+            self.running = True
+    
+    def position(self):
+        """الموضع الحالي بالثواني، لا يتجاوز نهاية المقطع المشغل"""
+        if not self.running or self.anchor_time is None:
+            return self.frozen
+        return min(self.anchor_pts + (time.monotonic() - self.anchor_time), self.chunk_end)
+
+class PlaybackEngine:
+    """محرك التشغيل: يغذي قناة pygame من مخزن القراءة المسبقة ويدعم الانتقال الدقيق"""
+    
+    def __init__(self):
+        self.path = None
+        self.info = {}
+        self.duration = 0
+        self.with_video = False
+        self.state = 'stopped'  # stopped, playing, paused, ended
+        self.decoder = None
+        self.scheduled = deque()  # (الطابع الزمني، المدة، المسار) للمقطع المشغل والمنتظر في القناة
+        self.clock = PlaybackClock()
+        self.preloaded = None
+        self.current_track = None  # المسار المسموع فعلياً على الجهاز
+        self.volume = 0.7
+        self.channel = None
+    
+    def _get_channel(self):
+        if self.channel is None:
+            pygame.mixer.set_reserved(1)
+            self.channel = pygame.mixer.Channel(0)
+            self.channel.set_volume(self.volume)
+        return self.channel
+    
+    def load(self, path, with_video=False):
+        """تحميل ملف وقراءة مدته الحقيقية"""
+        self.stop()
+        self.path = str(path)
+        self.info = media_probe.probe(path)
+        self.duration = self.info['duration']
+        self.with_video = with_video and self.info['has_video']
+        self.current_track = self.path
+    
+    def preload(self, path, with_video=False):
+        """فتح المسار التالي وبدء فك ترميزه مسبقاً للتشغيل دون فواصل"""
+        path = str(path)
+        if self.preloaded and self.preloaded['path'] == path:
+            return
+        self.cancel_preload()
+        
+        info = media_probe.probe(path)
+        with_video = with_video and info['has_video']
+        decoder = FFmpegDecoder(
+            path,
+            with_audio=info['has_audio'],
+            with_video=with_video,
+            fps=info['fps']
+        )
+        decoder.start_decoding()
+        self.preloaded = {'path': path, 'info': info, 'with_video': with_video, 'decoder': decoder}
+    
+    def cancel_preload(self):
+        if self.preloaded is not None:
+            self.preloaded['decoder'].stop()
+            self.preloaded = None
+    
+    def _switch_to_preloaded(self):
+        """متابعة التغذية من المسار المحمل مسبقاً دون إيقاف القناة"""
+        self.decoder.stop()
+        track = self.preloaded
+        self.preloaded = None
+        self.decoder = track['decoder']
+        self.path = track['path']
+        self.info = track['info']
+        self.duration = self.info['duration']
+        self.with_video = track['with_video']
+    
+    @property
+    def has_video(self):
+        return self.path is not None and self.with_video
+    
+    def _start_decoder(self, position):
+        self._stop_decoder()
+        self.decoder = FFmpegDecoder(
+            self.path,
+            start=position,
+            with_audio=self.info['has_audio'],
+            with_video=self.with_video,
+            fps=self.info['fps']
+        )
+        self.decoder.start_decoding()
+        self.clock.reset(position)
+        self.current_track = self.path
+        
+        # ملف بلا صوت: الساعة تجري حرة من لحظة البدء
+        if self.decoder.audio_buffer is None:
+            self.clock.chunk_started(position, float("inf"), contiguous=False)
+    
+    def _stop_decoder(self):
+        if self.decoder is not None:
+            self.decoder.stop()
+            self.decoder = None
+        if self.channel is not None:
+            self.channel.stop()
+        self.scheduled.clear()
+    
+    def play(self):
+        """بدء التشغيل أو الاستئناف"""
+        if not self.path:
+            return
+        if self.state == 'paused' and self.decoder is not None:
+            self._get_channel().unpause()
+            self.clock.resume()
+        else:
+            start = 0 if self.state == 'ended' else self.clock.position()
+            self._start_decoder(start)
+        self.state = 'playing'
+    
+    def pause(self):
+        """إيقاف مؤقت"""
+        if self.state == 'playing':
+            self._get_channel().pause()
+            self.clock.pause()
+            self.state = 'paused'
+    
+    def stop(self):
+        """إيقاف التشغيل وإعادة الموضع للبداية"""
+        self.cancel_preload()
+        self._stop_decoder()
+        self.state = 'stopped'
+        self.clock.reset(0)
+    
+    def seek(self, position):
+        """الانتقال إلى موضع محدد بإعادة تشغيل فك الترميز عنده"""
+        if not self.path:
+            return
+        if self.duration > 0:
+            position = max(0, min(position, self.duration))
+        
+        if self.state in ('playing', 'paused'):
+            paused = self.state == 'paused'
+            self._start_decoder(position)
+            if paused:
+                self._get_channel().pause()
+                self.clock.pause()
+        else:
+            self.clock.reset(position)
+            if self.state == 'ended':
+                self.state = 'stopped'
+    
+    def set_volume(self, volume):
+        self.volume = volume
+        if self.channel is not None:
+            self.channel.set_volume(volume)
+    
+    @property
+    def position(self):
+        """الموضع الحالي بالثواني"""
+        return self.clock.position()
+    
+    def pump(self):
+        """تغذية قناة الصوت من المخزن (تُستدعى دورياً من حلقة Tk)"""
+        if self.state != 'playing' or self.decoder is None:
+            return
+        
+        buffer = self.decoder.audio_buffer
+        if buffer is None:
+            if self.duration and self.position >= self.duration:
+                self._finish()
+            return
+        
+        channel = self._get_channel()
+        
+        # المقطع المنتظر بدأ تشغيله مباشرة بعد سابقه
+        if channel.get_queue() is None and len(self.scheduled) > 1:
+            self.scheduled.popleft()
+            self._chunk_started(self.scheduled[0], contiguous=True)
+        if not channel.get_busy():
+            self.scheduled.clear()
+        
+        while channel.get_queue() is None:
+            item = buffer.get()
+            if item is None:
+                # نهاية المسار الحالي: المتابعة من المسار التالي المحمل مسبقاً
+                if buffer.drained and self.preloaded and self.preloaded['decoder'].audio_buffer is not None:
+                    self._switch_to_preloaded()
+                    buffer = self.decoder.audio_buffer
+                    continue
+                break
+            pts, data = item
+            chunk = (pts, len(data) / BYTES_PER_SECOND, self.path)
+            sound = pygame.mixer.Sound(buffer=data)
+            if channel.get_busy():
+                channel.queue(sound)
+            else:
+                channel.play(sound)
+                self.scheduled.clear()
+                self._chunk_started(chunk, contiguous=False)
+            self.scheduled.append(chunk)
+        
+        if buffer.drained and not channel.get_busy():
+            self._finish()
+    
+    def _chunk_started(self, chunk, contiguous):
+        pts, duration, track = chunk
+        self.clock.chunk_started(pts, duration, contiguous)
+        self.current_track = track
+    
+    def _finish(self):
+        self.clock.reset(self.duration or self.clock.position())
+        self.state = 'ended'
+    
+    def next_frame(self):
+        """أحدث إطار حان وقت عرضه حسب ساعة التشغيل، أو None"""
+        if self.decoder is None or self.decoder.video_buffer is None:
+            return None
+        # إطارات المسار التالي تنتظر حتى يُسمع أول مقطع منه
+        if self.current_track != self.path:
+            return None
+        
+        position = self.position
+        buffer = self.decoder.video_buffer
+        frame = None
+        while True:
+            head = buffer.peek()
+            if head is None or head[0] > position:
+                break
+            frame = buffer.get()
+        return frame[1] if frame else None
+    
+    def close(self):
+        self.stop()
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""
+نموذج قائمة التشغيل: المسارات والبيانات وترتيب التشغيل
+"""
+import random
+from pathlib import Path
+
+REPEAT_MODES = ["off", "all", "one"]
+
+class PlaylistEntry:
+    """عنصر في قائمة التشغيل"""
+    
+    __slots__ = ("path", "title", "duration")
+    
+    def __init__(self, path, title=None, duration=0):
+        self.path = str(path)
+        self.title = title or Path(path).name
+        self.duration = duration
+
+class Playlist:
+    """قائمة تشغيل مستقلة عن الواجهة مع دعم الخلط والتكرار"""
+    
+    def __init__(self):
+        self.entries = []
+        self.order = []  # ترتيب التشغيل كفهارس في entries
+        self.position = -1  # الموضع الحالي في order
+        self.shuffle = False
+        self.repeat = "off"
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def add_paths(self, paths):
+        """إضافة مسارات وإرجاع العناصر الجديدة لإدراجها في الواجهة دفعة واحدة"""
+        start = len(self.entries)
+        new_entries = [PlaylistEntry(path) for path in paths]
+        self.entries.extend(new_entries)
+        
+        new_indexes = list(range(start, len(self.entries)))
+        if self.shuffle:
+            # خلط العناصر الجديدة ضمن ما لم يُشغل بعد فقط
+            upcoming = self.order[self.position + 1:] + new_indexes
+            random.shuffle(upcoming)
+            self.order = self.order[:self.position + 1] + upcoming
+        else:
+            self.order.extend(new_indexes)
+        return new_entries
+    
+    def remove(self, index):
+        """حذف عنصر حسب موضعه في الواجهة"""
+        if not 0 <= index < len(self.entries):
+            return
+        current = self.current_index
+        del self.entries[index]
+        
+        self.order = [i - (i > index) for i in self.order if i != index]
+        if current == index:
+            self.position -= 1
+        elif current is not None:
+            self.position = self.order.index(current - (current > index))
+    
+    def clear(self):
+        self.entries.clear()
+        self.order.clear()
+        self.position = -1
+    
+    @property
+    def current_index(self):
+        if 0 <= self.position < len(self.order):
+            return self.order[self.position]
+        return None
+    
+    @property
+    def current(self):
+        index = self.current_index
+        return self.entries[index] if index is not None else None
+    
+    def set_current(self, index):
+        """اختيار عنصر للتشغيل حسب موضعه في الواجهة"""
+        if 0 <= index < len(self.entries):
+            self.position = self.order.index(index)
+    
+    def set_shuffle(self, enabled):
+        """تفعيل الخلط مع إبقاء العنصر الحالي في مكانه"""
+        self.shuffle = enabled
+        current = self.current_index
+        if enabled:
+            rest = [i for i in range(len(self.entries)) if i != current]
+            random.shuffle(rest)
+            self.order = ([current] if current is not None else []) + rest
+            self.position = 0 if current is not None else -1
+        else:
+            self.order = list(range(len(self.entries)))
+            self.position = current if current is not None else -1
+    
+    def cycle_repeat(self):
+        """التبديل بين أوضاع التكرار"""
+        self.repeat = REPEAT_MODES[(REPEAT_MODES.index(self.repeat) + 1) % len(REPEAT_MODES)]
+        return self.repeat
+    
+    def _next_position(self, step=1):
+        if not self.order:
+            return None
+        if self.repeat == "one" and self.position >= 0:
+            return self.position
+        position = self.position + step
+        if 0 <= position < len(self.order):
+            return position
+        if self.repeat == "all":
+            return position % len(self.order)
+        return None
+    
+    def peek_next(self):
+        """العنصر الذي سيُشغل بعد الحالي دون التقدم إليه"""
+        position = self._next_position()
+        return self.entries[self.order[position]] if position is not None else None
+    
+    def advance(self, step=1):
+        """التقدم للعنصر التالي (أو السابق) وإرجاعه"""
+        position = self._next_position(step)
+        if position is None:
+            return None
+        self.position = position
+        return self.current
\ No newline at end of file
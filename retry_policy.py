@@ -0,0 +1,147 @@
+"""
+سياسة إعادة المحاولة: تصنيف الأخطاء، تأخير أسي مع عشوائية، وميزانية لكل صنف
+"""
+import re
+import random
+import socket
+from yt_dlp.utils import ContentTooShortError, GeoRestrictedError, UnsupportedError
+from yt_dlp.networking.exceptions import HTTPError, TransportError
+from config import RETRY_BUDGETS, RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_THROTTLE_FACTOR, FRAGMENT_RETRIES, YDL_INNER_RETRIES
+
+# أصناف الأخطاء
+THROTTLED = "throttled"    # 429: الخادم يطلب الإبطاء
+SERVER = "server"          # 5xx: خطأ مؤقت في الخادم
+NETWORK = "network"        # انقطاع الاتصال أو انتهاء المهلة
+INCOMPLETE = "incomplete"  # ملف أو أجزاء ناقصة
+FORMAT = "format"          # 403/404/410 على رابط الصيغة: الانتقال إلى صيغة بديلة
+FATAL = "fatal"            # لا فائدة من إعادة المحاولة
+
+NETWORK_PATTERNS = re.compile(
+    r"timed out|connection (reset|aborted|refused)|broken pipe|remote end closed|"
+    r"temporary failure in name resolution|incompleteread|eof occurred",
+    re.IGNORECASE
+)
+HTTP_STATUS_PATTERN = re.compile(r"HTTP Error (\d{3})")
+
+def _causes(error):
+    """الخطأ وكل الأخطاء المغلفة داخله (exc_info في yt-dlp و __cause__)"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        exc_info = getattr(error, 'exc_info', None)
+        wrapped = exc_info[1] if exc_info and len(exc_info) > 1 else None
+        error = wrapped or error.__cause__ or error.__context__
+
+def http_status(error):
+    """رمز حالة HTTP المسبب للخطأ إن وجد"""
+    for cause in _causes(error):
+        if isinstance(cause, HTTPError):
+            return cause.status
+    match = HTTP_STATUS_PATTERN.search(str(error))
+    return int(match.group(1)) if match else None
+
+def retry_after(error):
+    """ثوانٍ من ترويسة Retry-After في رد HTTP المسبب للخطأ، أو None"""
+    for cause in _causes(error):
+        if isinstance(cause, HTTPError) and cause.response is not None:
+            value = (cause.response.headers.get('Retry-After') or "").strip()
+            return int(value) if value.isdigit() else None
+    return None
+
+def _status_class(status):
+    if status == 429:
+        return THROTTLED
+    if 500 <= status < 600:
+        return SERVER
+    if status in (403, 404, 410):
+        return FORMAT
+    return FATAL
+
+def classify_error(error):
+    """تصنيف خطأ تنزيل لاختيار ميزانية إعادة المحاولة"""
+    for cause in _causes(error):
+        if isinstance(cause, HTTPError):
+            return _status_class(cause.status)
+        if isinstance(cause, ContentTooShortError):
+            return INCOMPLETE
+        if isinstance(cause, (GeoRestrictedError, UnsupportedError)):
+            return FATAL
+        if isinstance(cause, (TransportError, ConnectionError, socket.timeout, TimeoutError)):
+            return NETWORK
+    
+    # yt-dlp يحول بعض الأخطاء إلى نص فقط
+    message = str(error)
+    match = HTTP_STATUS_PATTERN.search(message)
+    if match:
+        return _status_class(int(match.group(1)))
+    if NETWORK_PATTERNS.search(message):
+        return NETWORK
+    if "fragment" in message.lower():
+        return INCOMPLETE
+    return FATAL
+
+class RetryPolicy:
+    """تأخير أسي مع عشوائية وميزانية مستقلة لكل صنف خطأ"""
+    
+    def __init__(self, budgets=RETRY_BUDGETS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.budgets = dict(budgets)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    def delay(self, attempt, error_class=None):
+        """زمن الانتظار قبل المحاولة رقم attempt (تبدأ من 0)"""
+        base = self.base_delay * (RETRY_THROTTLE_FACTOR if error_class == THROTTLED else 1)
+        ceiling = min(self.max_delay, base * 2 ** attempt)
+        return random.uniform(ceiling / 2, ceiling)
+    
+    def ydl_options(self):
+        """إعادة المحاولة داخل yt-dlp: طلبات HTTP وأجزاء الصيغ المقسمة (HLS/DASH)
+        
+        الطلبات والاستخراج يُعاد داخلياً مرة واحدة فقط للأعطال اللحظية؛ ما بعدها
+        يُحتسب من ميزانية الصنف في RetryState وحدها حتى لا تتضاعف المحاولات.
+        """
+        return {
+            'retries': YDL_INNER_RETRIES,
+            'fragment_retries': FRAGMENT_RETRIES,
+            'extractor_retries': YDL_INNER_RETRIES,
+            'skip_unavailable_fragments': False,
+            'retry_sleep_functions': {
+                'http': lambda n: self.delay(n),
+                'fragment': lambda n: self.delay(n),
+                'extractor': lambda n: self.delay(n),
+            },
+        }
+    
+    def start(self):
+        """حالة محاولات جديدة لمهمة واحدة"""
+        return RetryState(self)
+
+class RetryState:
+    """الميزانية المتبقية وسجل المحاولات لمهمة واحدة"""
+    
+    def __init__(self, policy):
+        self.policy = policy
+        self.used = {}
+        self.history = []
+    
+    def next_delay(self, error_class):
+        """زمن الانتظار قبل المحاولة التالية، أو None إن نفدت ميزانية الصنف"""
+        used = self.used.get(error_class, 0)
+        if used >= self.policy.budgets.get(error_class, 0):
+            return None
+        self.used[error_class] = used + 1
+        return self.policy.delay(used, error_class)
+    
+    def record(self, error_class, reason, delay=None, format_id=None):
+        entry = {
+            'class': error_class,
+            'reason': reason[:300],
+            'delay': round(delay, 2) if delay is not None else None,
+            'format': format_id,
+        }
+        self.history.append(entry)
+        return entry
+
+# إنشاء كائنات عامة
+retry_policy = RetryPolicy()
\ No newline at end of file
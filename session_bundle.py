@@ -0,0 +1,273 @@
+"""
+حزم جلسات التنزيل: تصدير طابور التنزيلات مع بياناته المستخرجة واستيراده في نسخة أخرى
+"""
+import os
+import re
+import zlib
+import gzip
+import json
+import time
+import threading
+from urllib.parse import urlparse, parse_qsl
+from utils import logger, settings_manager
+from downloader import video_downloader
+from output_layout import output_layout, validate_template
+from history_store import history_store
+from url_canonical import canonicalize
+from config import BUNDLE_METADATA_TTL, BUNDLE_EXPIRY_MARGIN
+
+BUNDLE_FORMAT = "snaptube-bundle"
+BUNDLE_VERSION = 1
+
+# حقول كبيرة لا يحتاجها التنزيل
+DROPPED_KEYS = {
+    "formats", "requested_formats", "requested_downloads", "requested_subtitles",
+    "thumbnails", "subtitles", "automatic_captions", "heatmap", "comments",
+    "description", "chapters", "tags", "categories",
+}
+# معامل انتهاء الصلاحية في روابط الصيغ: ?expire=... أو /expire/.../ (YouTube وغيره)
+EXPIRY_PATTERN = re.compile(r"/(?:expire|expires)/(\d{9,11})(?:/|$)")
+EXPIRY_PARAMS = ("expire", "expires", "exp")
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def selected_formats(info, format_id):
+    """الصيغ المختارة فقط من قائمة formats ("137+140" صيغتان)"""
+    wanted = str(format_id).split("+")
+    formats = {fmt.get('format_id'): fmt for fmt in info.get('formats') or []}
+    return [formats[fid] for fid in wanted if fid in formats]
+
+def compact_info(info, format_id):
+    """البيانات المستخرجة بلا الحقول الكبيرة، مع الصيغ المختارة فقط؛ None إن لم تتوفر الصيغ"""
+    formats = selected_formats(info, format_id)
+    if not formats:
+        return None
+    compact = {key: value for key, value in info.items() if key not in DROPPED_KEYS}
+    compact['formats'] = formats
+    return compact
+
+def stream_expiry(formats, default):
+    """أقرب انتهاء صلاحية في روابط الصيغ، أو default إن لم تحدده الروابط"""
+    expiries = []
+    for fmt in formats:
+        for url in (fmt.get('url'), fmt.get('manifest_url')):
+            if not url:
+                continue
+            parsed = urlparse(url)
+            for key, value in parse_qsl(parsed.query):
+                if key in EXPIRY_PARAMS and value.isdigit():
+                    expiries.append(int(value))
+            match = EXPIRY_PATTERN.search(parsed.path)
+            if match:
+                expiries.append(int(match.group(1)))
+    return min(expiries) if expiries else default
+
+def job_record(job, created):
+    """سطر مهمة واحدة في الحزمة من بيانات مهمة نشطة"""
+    record = {
+        'kind': job.get('type', 'video'),
+        'url': job['url'],
+        'quality': job.get('preset') or job.get('quality'),
+    }
+    if job.get('output_template'):
+        record['output_template'] = job['output_template']
+    
+    info = job.get('info')
+    format_id = job.get('format') or (info or {}).get('format_id')
+    if info and format_id:
+        compact = compact_info(info, format_id)
+        if compact:
+            record['format_id'] = format_id
+            record['info'] = compact
+            record['expires_at'] = stream_expiry(compact['formats'], created + BUNDLE_METADATA_TTL)
+    return record
+
+class BundleWriter:
+    """كتابة حزمة: سطر JSON للرأس ثم سطر لكل مهمة، مضغوطة بـ gzip
+    
+    الكتابة إلى ملف مؤقت ثم استبداله، فلا تبقى حزمة ناقصة عند الفشل.
+    """
+    
+    def __init__(self, path, output_template=None):
+        self.path = str(path)
+        self.created = time.time()
+        self.count = 0
+        self.stream = gzip.open(f"{self.path}.part", "wt", encoding="utf-8")
+        self.stream.write(_dumps({
+            'format': BUNDLE_FORMAT,
+            'version': BUNDLE_VERSION,
+            'created': self.created,
+            'output_template': output_template or output_layout.template,
+        }) + "\n")
+    
+    def add(self, record):
+        self.stream.write(_dumps(record) + "\n")
+        self.count += 1
+    
+    def close(self):
+        self.stream.close()
+        os.replace(f"{self.path}.part", self.path)
+    
+    def discard(self):
+        self.stream.close()
+        if os.path.exists(f"{self.path}.part"):
+            os.remove(f"{self.path}.part")
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+def export_bundle(path, downloads=None):
+    """تصدير التنزيلات النشطة (أو downloads) إلى حزمة؛ يعيد عدد المهام"""
+    if downloads is None:
+        downloads = video_downloader.get_all_downloads()
+    with BundleWriter(path) as writer:
+        for job in downloads.values():
+            writer.add(job_record(job, writer.created))
+    logger.info(f"تم تصدير {writer.count} مهمة إلى {path}")
+    return writer.count
+
+def read_bundle(path):
+    """رأس الحزمة ومولّد لمهامها؛ المهام تُقرأ سطراً بسطر دون تحميل الملف"""
+    stream = gzip.open(path, "rt", encoding="utf-8")
+    try:
+        header = json.loads(stream.readline() or "{}")
+    except (OSError, ValueError, EOFError, zlib.error) as e:
+        stream.close()
+        raise ValueError(f"ملف الحزمة غير صالح: {e}") from e
+    if header.get('format') != BUNDLE_FORMAT or header.get('version', 0) > BUNDLE_VERSION:
+        stream.close()
+        raise ValueError("ملف الحزمة غير صالح أو من إصدار أحدث")
+    
+    def jobs():
+        with stream:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+    
+    return header, jobs()
+
+class BundleImporter:
+    """استيراد حزمة في الخلفية: المهام تدخل الطابور عندما يتوفر مكان فقط
+    
+    لا يُقرأ من الحزمة إلا ما يبدأ الآن، فيبقى استخدام الذاكرة ثابتاً مهما كان عدد المهام.
+    عدد التنزيلات النشطة محدود بإعداد concurrent_downloads.
+    """
+    
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.thread = None
+        self.cancelled = False
+        self.stats = {}
+    
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+    
+    def start(self, path, output_path=None, completion_callback=None, on_finished=None):
+        """بدء الاستيراد؛ يرفع ValueError إن كانت الحزمة غير صالحة"""
+        if self.running:
+            raise RuntimeError("استيراد حزمة آخر قيد التشغيل")
+        header, jobs = read_bundle(path)
+        self.cancelled = False
+        self.stats = {
+            'imported': 0, 'started': 0, 'reextract': 0, 'skipped': 0, 'completed': 0, 'failed': 0,
+            'partial': False  # الحزمة انتهت قبل آخر مهمة (ملف مقطوع أو تالف)
+        }
+        self.thread = threading.Thread(
+            target=self._run,
+            args=(header, jobs, output_path, completion_callback, on_finished),
+            name="bundle-import",
+            daemon=True
+        )
+        self.thread.start()
+    
+    def cancel(self):
+        with self.condition:
+            self.cancelled = True
+            self.condition.notify_all()
+    
+    def _run(self, header, jobs, output_path, completion_callback, on_finished):
+        def completed(download_id, success, result):
+            with self.condition:
+                self.stats['completed' if success else 'failed'] += 1
+                self.condition.notify_all()
+            if completion_callback:
+                completion_callback(download_id, success, result)
+        
+        try:
+            for job in jobs:
+                if not self._wait_for_slot():
+                    break
+                self.stats['imported'] += 1
+                try:
+                    self._submit(job, header, output_path, completed)
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    logger.error(f"مهمة غير صالحة في الحزمة: {e}")
+        except (OSError, ValueError, EOFError, zlib.error) as e:
+            # ملف مقطوع (نسخ لم يكتمل): المهام المقروءة قبله تبقى مستوردة
+            self.stats['partial'] = True
+            logger.error(f"خطأ في قراءة الحزمة بعد {self.stats['imported']} مهمة: {e}")
+        finally:
+            jobs.close()
+            logger.info(f"انتهى استيراد الحزمة: {self.stats}")
+            if on_finished:
+                on_finished(dict(self.stats))
+    
+    def _wait_for_slot(self):
+        """انتظار مكان في الطابور؛ False إن أُلغي الاستيراد"""
+        with self.condition:
+            while not self.cancelled:
+                limit = max(1, int(settings_manager.get("concurrent_downloads", 3)))
+                if len(video_downloader.active_downloads) < limit:
+                    return True
+                # إشعار عند اكتمال مهمة من الحزمة؛ المهلة تغطي التنزيلات الأخرى
+                self.condition.wait(timeout=1.0)
+            return False
+    
+    def _submit(self, job, header, output_path, completion_callback):
+        url = job['url']
+        kind = job.get('kind', 'video')
+        previous = history_store.find(url=canonicalize(url).url, kind=kind)
+        if previous and previous.get('filename') and os.path.exists(previous['filename']):
+            self.stats['skipped'] += 1
+            return
+        
+        bundle = {'output_template': self._template(job, header)}
+        if job.get('info') and job.get('expires_at', 0) - BUNDLE_EXPIRY_MARGIN > time.time():
+            bundle['info'] = job['info']
+            bundle['format_id'] = job.get('format_id')
+            bundle['expires_at'] = job['expires_at']
+        else:
+            self.stats['reextract'] += 1
+        
+        if kind == 'audio':
+            video_downloader.download_audio(
+                url, str(job.get('quality') or "192"), output_path,
+                completion_callback=completion_callback, bundle=bundle
+            )
+        else:
+            video_downloader.download_video(
+                url, job.get('quality') or "720p", output_path,
+                completion_callback=completion_callback, bundle=bundle
+            )
+        self.stats['started'] += 1
+    
+    @staticmethod
+    def _template(job, header):
+        """قالب الإخراج من المهمة أو من رأس الحزمة؛ القالب غير الصالح يُستبدل بقالب الإعدادات"""
+        template = job.get('output_template') or header.get('output_template')
+        try:
+            return validate_template(template)
+        except ValueError:
+            return None
+
+# إنشاء كائنات عامة
+bundle_importer = BundleImporter()
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""
+تجهيز الملفات في مجلد مؤقت ثم نقلها ذرياً إلى المكتبة مع حدث اكتمال لكل ملف
+"""
+import os
+import errno
+import shutil
+import threading
+import time
+from pathlib import Path
+from utils import logger
+from config import TEMP_DIR, PARTIAL_FILE_MAX_AGE
+
+STAGING_DIR = TEMP_DIR / "staging"
+
+def _fsync_file(path):
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+def _fsync_directory(path):
+    """تثبيت إدخال الدليل بعد إعادة التسمية (غير مدعوم على Windows)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class LibraryEvents:
+    """حدث واحد لكل ملف مكتمل في المكتبة"""
+    
+    def __init__(self):
+        self.callbacks = []
+        self.lock = threading.Lock()
+    
+    def subscribe(self, callback):
+        with self.lock:
+            self.callbacks.append(callback)
+    
+    def publish(self, path):
+        with self.lock:
+            callbacks = list(self.callbacks)
+        for callback in callbacks:
+            try:
+                callback(Path(path))
+            except Exception as e:
+                logger.error(f"خطأ في حدث المكتبة: {e}")
+
+class StagingArea:
+    """مجلد عمل لكل مهمة داخل TEMP_DIR؛ لا يظهر في المكتبة إلا الملف المكتمل"""
+    
+    def __init__(self, root=STAGING_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+    
+    def create(self, job_id):
+        """مجلد عمل جديد للمهمة"""
+        directory = self.root / str(job_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory
+    
+    def discard(self, job_id):
+        """حذف مجلد عمل المهمة وما تبقى فيه"""
+        shutil.rmtree(self.root / str(job_id), ignore_errors=True)
+    
+    def directory(self, job_id):
+        """مسار مجلد عمل المهمة (دون إنشائه)"""
+        return self.root / str(job_id)
+    
+    def collect_stale(self, max_age=PARTIAL_FILE_MAX_AGE, keep=()):
+        """حذف مجلدات العمل المتبقية من جلسات سابقة، عدا مجلدات المهام في keep"""
+        cutoff = time.time() - max_age
+        keep = {str(job_id) for job_id in keep}
+        for directory in self.root.iterdir():
+            try:
+                if directory.name in keep:
+                    continue
+                if directory.is_dir() and directory.stat().st_mtime < cutoff:
+                    shutil.rmtree(directory, ignore_errors=True)
+            except OSError:
+                continue
+    
+    def commit(self, staged_path, destination):
+        """تثبيت الملف على القرص ثم نقله ذرياً إلى وجهته وإطلاق حدث الاكتمال"""
+        staged_path = Path(staged_path)
+        destination = Path(destination)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        
+        _fsync_file(staged_path)
+        try:
+            os.replace(staged_path, destination)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # وجهة على وحدة تخزين أخرى: نسخ إلى ملف مؤقت بجانب الوجهة ثم إعادة تسمية ذرية
+            temporary = destination.with_name(f".{destination.name}.staging")
+            shutil.copyfile(staged_path, temporary)
+            _fsync_file(temporary)
+            os.replace(temporary, destination)
+            staged_path.unlink(missing_ok=True)
+        _fsync_directory(destination.parent)
+        
+        library_events.publish(destination)
+        return destination
+
+# إنشاء كائنات عامة
+library_events = LibraryEvents()
+staging_area = StagingArea()
\ No newline at end of file
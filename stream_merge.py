@@ -0,0 +1,278 @@
+"""
+دمج الفيديو والصوت المنفصلين أثناء التنزيل: نسخ التدفقات بـ ffmpeg من أنابيب مسماة بذاكرة ثابتة
+"""
+import os
+import time
+import errno
+import shutil
+import tempfile
+import threading
+from functools import lru_cache
+from yt_dlp.downloader import get_suitable_downloader
+from yt_dlp.downloader.external import FFmpegFD
+from yt_dlp.postprocessor.ffmpeg import FFmpegMergerPP
+from yt_dlp.utils import prepend_extension
+from utils import logger
+from workers import postprocess_pool
+from instrumentation import metrics
+from config import MERGE_CHUNK_SIZE, MERGE_POLL_INTERVAL, MERGE_THREAD_QUEUE, MERGE_MUXING_QUEUE, MERGE_INTERLEAVE_DELTA
+
+@lru_cache(maxsize=1)
+def merge_available():
+    """ffmpeg متاح لدمج صيغ منفصلة"""
+    return FFmpegMergerPP(None).available
+
+class MergeStream:
+    """تدفق واحد (فيديو أو صوت): ملف التنزيل، الأنبوب المسمى، وما نُقل منه إلى ffmpeg"""
+    
+    def __init__(self, index, info, filename, fifo):
+        self.index = index
+        self.info = info
+        self.filename = filename
+        self.fifo = fifo
+        self.done = threading.Event()
+        self.error = None
+        self.downloaded = 0
+        self.total = 0
+        self.fed = 0
+        self.finished_at = None
+
+class StreamingMerge:
+    """تنزيل الصيغ المطلوبة معاً وتغذية ffmpeg من ملفاتها الجزئية أثناء كتابتها
+    
+    كل تدفق يُنزَّل إلى اسم الملف الذي يستخدمه yt-dlp للصيغة، ويُقرأ ملفه الجزئي
+    بقطع ثابتة الحجم إلى أنبوب مسمى؛ ffmpeg ينسخ التدفقات (-c copy) إلى الملف النهائي.
+    الذاكرة محدودة بحجم القطعة وطوابير ffmpeg مهما كان حجم الملفات.
+    إن فشل الدمج المتدفق (حاوية لا تُقرأ تسلسلياً مثلاً) تبقى ملفات الصيغ كاملة
+    ويدمجها yt-dlp بالطريقة المعتادة.
+    """
+    
+    def __init__(self, ydl, info, filename):
+        self.ydl = ydl
+        self.info = info
+        self.filename = filename
+        self.streams = []
+        self.aborted = False
+        self.hooks = []
+    
+    @classmethod
+    def for_info(cls, ydl, info):
+        """دمج متدفق لصيغتين منفصلتين، أو None إن لم يكن مناسباً"""
+        formats = info.get('requested_formats') or []
+        if len(formats) != 2 or not hasattr(os, "mkfifo") or not merge_available():
+            return None
+        if info.get('is_live') or info.get('section_start') or info.get('section_end'):
+            return None
+        if ydl.params.get('allow_unplayable_formats'):
+            return None
+        for fmt in formats:
+            downloader = get_suitable_downloader(dict(fmt), ydl.params)
+            if downloader is None or downloader is FFmpegFD:
+                return None
+        
+        filename = ydl.prepare_filename(info, 'temp')
+        if os.path.exists(filename):
+            return None
+        return cls(ydl, info, filename)
+    
+    def _stream_filename(self, fmt):
+        """نفس اسم ملف الصيغة في yt-dlp، حتى يجدها كاملة إن احتاج إلى الدمج المعتاد"""
+        base = os.path.splitext(self.filename)[0]
+        return prepend_extension(f"{base}.{fmt['ext']}", f"f{fmt['format_id']}", fmt['ext'])
+    
+    def run(self):
+        """تنفيذ الدمج؛ يعيد إحصاءات الدمج، ويرفع خطأ التنزيل إن فشل أحد التدفقات"""
+        workdir = tempfile.mkdtemp(prefix="merge-", dir=os.path.dirname(os.path.abspath(self.filename)))
+        output = prepend_extension(self.filename, "temp")
+        # مؤشرات التقدم تُجمع لكل التدفقات بدلاً من تقدم كل صيغة على حدة
+        self.hooks, self.ydl._progress_hooks = self.ydl._progress_hooks, [self._progress]
+        try:
+            for index, fmt in enumerate(self.info['requested_formats']):
+                info = dict(self.info)
+                del info['requested_formats']
+                info.update(fmt)
+                stream = MergeStream(index, info, self._stream_filename(fmt), os.path.join(workdir, f"stream-{index}"))
+                os.mkfifo(stream.fifo)
+                self.streams.append(stream)
+            
+            start = time.perf_counter()
+            downloads = [self._thread(self._download, stream, "merge-download") for stream in self.streams]
+            merge = postprocess_pool.submit("ffmpeg", self._ffmpeg_args(output), self.info.get('duration') or 0)
+            feeders = [self._thread(self._feed, stream, "merge-feed", merge) for stream in self.streams]
+            for thread in downloads + feeders:
+                thread.join()
+            
+            try:
+                merge.result()
+                merged = not self.aborted
+            except Exception as e:
+                logger.warning(f"تعذر الدمج أثناء التنزيل، سيُدمج الملفان بعد اكتماله: {e}")
+                merged = False
+            elapsed = time.perf_counter() - start
+            
+            errors = [stream.error for stream in self.streams if stream.error]
+            if errors or not merged:
+                if os.path.exists(output):
+                    os.remove(output)
+                if errors:
+                    raise errors[0]
+                return {'mode': 'fallback'}
+            
+            os.replace(output, self.filename)
+            for stream in self.streams:
+                if os.path.exists(stream.filename):
+                    os.remove(stream.filename)
+            self._report({'status': 'finished', 'filename': self.filename, 'total_bytes': self._total()})
+            return self._stats(elapsed)
+        finally:
+            self.ydl._progress_hooks = self.hooks
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    @staticmethod
+    def _thread(target, stream, name, *args):
+        thread = threading.Thread(target=target, args=(stream, *args), name=f"{name}-{stream.index}", daemon=True)
+        thread.start()
+        return thread
+    
+    def _ffmpeg_args(self, output):
+        """نسخ التدفقات دون إعادة ترميز، مع طوابير محدودة وكتابة الحزم فور وصولها"""
+        # -xerror: حاوية لا تُقرأ تسلسلياً (moov في نهاية MP4) تُفشل الدمج بدلاً من ملف ناقص
+        args = ["-xerror"]
+        for stream in self.streams:
+            args += ["-thread_queue_size", str(MERGE_THREAD_QUEUE), "-i", stream.fifo]
+        for stream in self.streams:
+            if stream.info.get('vcodec') != 'none':
+                args += ["-map", f"{stream.index}:v:0?"]
+            if stream.info.get('acodec') != 'none':
+                args += ["-map", f"{stream.index}:a:0?"]
+        # max_interleave_delta يحد ما يحتفظ به المُجمِّع في انتظار التدفق المتأخر بمدة زمنية
+        # (بالميكروثانية)؛ القيمة 0 تعني الانتظار دون حد حتى تصل حزمة من كل تدفق
+        args += [
+            "-c", "copy", "-max_muxing_queue_size", str(MERGE_MUXING_QUEUE),
+            "-max_interleave_delta", str(int(MERGE_INTERLEAVE_DELTA * 1_000_000)), output
+        ]
+        return args
+    
+    def _download(self, stream):
+        try:
+            success, _ = self.ydl.dl(stream.filename, stream.info)
+            if not success:
+                raise RuntimeError(f"فشل تنزيل الصيغة {stream.info.get('format_id')}")
+        except Exception as e:
+            stream.error = e
+        finally:
+            stream.finished_at = time.perf_counter()
+            stream.done.set()
+    
+    def _open_pipe(self, stream, merge):
+        """فتح الأنبوب للكتابة عندما يفتحه ffmpeg؛ None إن انتهى ffmpeg دون قراءته"""
+        while True:
+            try:
+                fd = os.open(stream.fifo, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+                if merge.done():
+                    return None
+                time.sleep(MERGE_POLL_INTERVAL)
+                continue
+            os.set_blocking(fd, True)
+            return open(fd, "wb", buffering=0)
+    
+    @staticmethod
+    def _open_source(stream):
+        """الملف الجزئي أثناء التنزيل، أو الملف المكتمل إن سبق تنزيله"""
+        for path in (f"{stream.filename}.part", stream.filename):
+            try:
+                return open(path, "rb", buffering=0)
+            except FileNotFoundError:
+                continue
+        return None
+    
+    def _feed(self, stream, merge):
+        """نقل ما يُكتب في ملف التدفق إلى أنبوب ffmpeg بقطع ثابتة الحجم"""
+        buffer = bytearray(MERGE_CHUNK_SIZE)
+        view = memoryview(buffer)
+        source = None
+        try:
+            pipe = self._open_pipe(stream, merge)
+            if pipe is None:
+                self.aborted = True
+                return
+            with pipe:
+                while not self.aborted:
+                    # حالة التنزيل قبل القراءة: لا تضيع البيانات المكتوبة بين القراءة والفحص
+                    finished = stream.done.is_set()
+                    if source is None:
+                        source = self._open_source(stream)
+                    count = source.readinto(buffer) if source else 0
+                    if count:
+                        pipe.write(view[:count])
+                        stream.fed += count
+                    elif finished:
+                        break
+                    else:
+                        time.sleep(MERGE_POLL_INTERVAL)
+        except OSError as e:
+            # BrokenPipeError: توقف ffmpeg
+            logger.warning(f"توقفت تغذية الدمج: {e}")
+            self.aborted = True
+        finally:
+            if source:
+                source.close()
+            if stream.error:
+                self.aborted = True
+    
+    def _total(self):
+        return sum(stream.total for stream in self.streams)
+    
+    def _progress(self, d):
+        """تقدم التدفقات كتنزيل واحد باسم الملف المدمج"""
+        stream = next((s for s in self.streams if s.filename == d.get('filename')), None)
+        if stream is None:
+            return
+        stream.downloaded = d.get('downloaded_bytes') or stream.downloaded
+        stream.total = d.get('total_bytes') or d.get('total_bytes_estimate') or stream.total
+        if d.get('status') != 'downloading':
+            return
+        
+        downloaded = sum(s.downloaded for s in self.streams)
+        self._report({
+            **d,
+            'filename': self.filename,
+            'tmpfilename': self.filename,
+            'downloaded_bytes': downloaded,
+            'total_bytes': max(self._total(), downloaded),
+            'total_bytes_estimate': None,
+        })
+    
+    def _report(self, d):
+        for hook in self.hooks:
+            hook({'info_dict': self.info, **d})
+    
+    def _stats(self, elapsed):
+        """إحصاءات الدمج: الزمن الكلي، وزمن ما بعد اكتمال التنزيل، ومعدل النقل"""
+        size = sum(stream.fed for stream in self.streams)
+        tail = time.perf_counter() - max(stream.finished_at for stream in self.streams)
+        metrics.observe("merge.streaming", elapsed)
+        metrics.observe("merge.after_download", tail)
+        return {
+            'mode': 'streaming',
+            'bytes': size,
+            'seconds': round(elapsed, 3),
+            'after_download_seconds': round(tail, 3),
+            'mb_per_second': round(size / elapsed / (1024 * 1024), 2) if elapsed else 0,
+        }
+
+@lru_cache(maxsize=None)
+def with_streaming_merge(base):
+    """صنف مشتق من base يدمج الفيديو والصوت المنفصلين أثناء تنزيلهما"""
+    class StreamingMergeYoutubeDL(base):
+        def process_info(self, info_dict):
+            merge = StreamingMerge.for_info(self, info_dict)
+            if merge is not None:
+                # الملف المدمج موجود الآن، فيتخطى yt-dlp التنزيل والدمج ويكمل المعالجة اللاحقة
+                info_dict['merge_stats'] = merge.run()
+            return super().process_info(info_dict)
+    
+    return StreamingMergeYoutubeDL
\ No newline at end of file
@@ -0,0 +1,286 @@
+"""
+الاشتراكات: استطلاع القنوات وقوائم التشغيل دورياً وتنزيل العناصر الجديدة فقط
+"""
+import os
+import time
+import random
+import hashlib
+import itertools
+import threading
+import yt_dlp
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import HTTPError
+from yt_dlp.utils import PagedList
+from utils import logger, notification_manager
+from history_store import history_store
+from host_scheduler import host_scheduler
+from download_scheduler import download_scheduler
+from retry_policy import retry_policy, http_status, retry_after
+from url_canonical import canonicalize
+from config import (
+    SUBSCRIPTION_POLL_INTERVAL, SUBSCRIPTION_CHECK_INTERVAL, SUBSCRIPTION_MAX_BACKOFF,
+    SUBSCRIPTION_KNOWN_STREAK, SUBSCRIPTION_BASELINE_SIZE, SUBSCRIPTION_MAX_NEW
+)
+
+def feed_id(url):
+    """معرف ثابت للاشتراك من الرابط الموحد"""
+    return hashlib.sha1(canonicalize(url).url.encode("utf-8")).hexdigest()[:16]
+
+def iter_entries(entries):
+    """عناصر القائمة بالترتيب؛ الصفحات تُجلب عند الحاجة فقط فيتوقف الجلب مع توقف القراءة"""
+    if isinstance(entries, PagedList):
+        for page in itertools.count():
+            items = entries.getpage(page)
+            if not items:
+                return
+            yield from items
+    else:
+        yield from entries or ()
+
+def entry_url(entry):
+    return entry.get('url') or entry.get('webpage_url')
+
+def entry_id(entry):
+    return str(entry.get('id') or entry_url(entry) or "") or None
+
+class FeedUnchanged(Exception):
+    """رد 304: الصفحة لم تتغير منذ الاستطلاع السابق"""
+
+class SubscriptionManager:
+    """استطلاع الاشتراكات في thread واحد
+    
+    القنوات تعرض الأحدث أولاً، فيتوقف الاستطلاع عند آخر عنصر معروف (high_water)
+    أو بعد عدة عناصر معروفة متتالية إن حُذف ذلك العنصر؛ ومع القوائم الكسولة لا تُجلب
+    إلا الصفحات التي تحتوي عناصر جديدة. العناصر الجديدة وحدها تُضاف إلى جدول التنزيلات،
+    وبياناتها الكاملة تُستخرج عند بدء تنزيلها.
+    """
+    
+    def __init__(self, store=history_store):
+        self.store = store
+        self.feeds = {}  # المعرف -> الاشتراك، بترتيب الإضافة
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.stopped = False
+    
+    def start(self):
+        """تحميل الاشتراكات المحفوظة وتشغيل thread الاستطلاع"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            for feed in self.store.feeds():
+                feed['windowed'] = bool(feed['windowed'])
+                self.feeds[feed['id']] = feed
+            self.thread = threading.Thread(target=self._loop, name="subscriptions", daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+    
+    def find(self, url):
+        with self.lock:
+            return self.feeds.get(feed_id(url))
+    
+    def subscribe(self, url, kind="video", quality="720p", windowed=False):
+        """إضافة اشتراك؛ أول استطلاع يسجل العناصر الحالية كمعروفة دون تنزيلها"""
+        feed = {
+            'id': feed_id(url),
+            'url': url,
+            'title': None,
+            'kind': kind,
+            'quality': str(quality),
+            'windowed': bool(windowed),
+            'high_water': None,
+            'etag': None,
+            'last_modified': None,
+            'conditional': 1,
+            'last_polled': None,
+            'next_poll': 0,
+            'failures': 0,
+            'created_at': time.time(),
+        }
+        with self.lock:
+            if feed['id'] in self.feeds:
+                return self.feeds[feed['id']]
+            self.feeds[feed['id']] = feed
+        self.store.save_feed(feed)
+        self.wakeup.set()
+        return feed
+    
+    def unsubscribe(self, url):
+        with self.lock:
+            feed = self.feeds.pop(feed_id(url), None)
+        if feed is None:
+            return False
+        self.store.delete_feed(feed['id'])
+        return True
+    
+    def _loop(self):
+        while not self.stopped:
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"خطأ في استطلاع الاشتراكات: {e}")
+            self.wakeup.wait(SUBSCRIPTION_CHECK_INTERVAL)
+            self.wakeup.clear()
+    
+    def tick(self, now=None):
+        """استطلاع الاشتراكات المستحقة واحداً تلو الآخر"""
+        now = now or time.time()
+        with self.lock:
+            due = [feed for feed in self.feeds.values() if feed['next_poll'] <= now]
+        for feed in due:
+            if self.stopped:
+                return
+            self.check(feed)
+    
+    def check(self, feed):
+        """استطلاع اشتراك واحد وجدولة عناصره الجديدة وتحديد موعد الاستطلاع التالي"""
+        now = time.time()
+        try:
+            new = self.poll(feed, now)
+        except Exception as e:
+            status = http_status(e)
+            feed['failures'] += 1
+            delay = SUBSCRIPTION_POLL_INTERVAL * 2 ** min(feed['failures'], 6)
+            if status in (403, 429):
+                host_scheduler.report_throttled(feed['url'])
+                delay = max(delay, retry_after(e) or 0)
+            feed['next_poll'] = now + min(delay, SUBSCRIPTION_MAX_BACKOFF)
+            logger.warning(f"فشل استطلاع الاشتراك {feed['url']}: {e}")
+        else:
+            feed['failures'] = 0
+            # تفاوت بسيط حتى لا تُستطلع كل الاشتراكات في نفس اللحظة
+            feed['next_poll'] = now + SUBSCRIPTION_POLL_INTERVAL * random.uniform(0.9, 1.1)
+            self._enqueue(feed, new)
+        
+        with self.lock:
+            subscribed = feed['id'] in self.feeds
+        if subscribed:
+            self.store.save_feed(feed)
+    
+    def poll(self, feed, now=None):
+        """العناصر الجديدة منذ الاستطلاع السابق (الأحدث أولاً)؛ تُسجل كمعروفة"""
+        now = now or time.time()
+        feed['last_polled'] = now
+        # عناصر الاستطلاع السابق قد تكون في طابور الكتابة
+        self.store.flush()
+        
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': True,
+            'lazy_playlist': True,
+            **retry_policy.ydl_options(),
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            try:
+                validators = self._probe(ydl, feed)
+            except FeedUnchanged:
+                return []
+            
+            host_scheduler.pace(feed['url'])
+            result = ydl.extract_info(feed['url'], download=False, process=False)
+            # روابط القنوات قد تحيل إلى تبويب الفيديوهات
+            for _ in range(3):
+                if result.get('_type') not in ('url', 'url_transparent'):
+                    break
+                host_scheduler.pace(result['url'])
+                result = ydl.extract_info(result['url'], download=False, process=False, ie_key=result.get('ie_key'))
+            if result.get('_type') not in ('playlist', 'multi_video'):
+                raise ValueError("الرابط ليس قناة أو قائمة تشغيل")
+            
+            baseline = feed['high_water'] is None
+            limit = SUBSCRIPTION_BASELINE_SIZE if baseline else SUBSCRIPTION_MAX_NEW
+            new, newest = self._new_entries(feed, iter_entries(result.get('entries')), limit)
+        
+        if newest:
+            self.store.add_feed_items(feed['id'], [entry_id(entry) for entry in new], now)
+            feed['high_water'] = newest
+        feed['title'] = result.get('title') or feed['title']
+        if validators is not None:
+            feed['etag'], feed['last_modified'] = validators
+        
+        if baseline:
+            logger.info(f"اشتراك جديد {feed['url']}: {len(new)} عنصر حالي سُجل كمعروف")
+            return []
+        if len(new) >= limit:
+            logger.warning(f"أكثر من {limit} عنصر جديد في {feed['url']}؛ لن تُنزَّل العناصر الأقدم")
+        return new
+    
+    def _new_entries(self, feed, entries, limit):
+        """قراءة العناصر حتى آخر عنصر معروف؛ يعيد (العناصر الجديدة، معرف أحدث عنصر)"""
+        new = []
+        newest = None
+        ids = set()
+        streak = 0
+        for entry in entries:
+            video_id = entry_id(entry)
+            if not video_id or video_id in ids:
+                continue
+            if newest is None:
+                newest = video_id
+            if video_id == feed['high_water']:
+                break
+            if self.store.known_item(feed['id'], video_id):
+                streak += 1
+                if streak >= SUBSCRIPTION_KNOWN_STREAK:
+                    break
+                continue
+            streak = 0
+            ids.add(video_id)
+            new.append(entry)
+            if len(new) >= limit:
+                break
+        return new, newest
+    
+    def _probe(self, ydl, feed):
+        """طلب مشروط للصفحة: يرفع FeedUnchanged عند 304، ويعيد (ETag، Last-Modified) أو None
+        
+        المواقع التي لا ترسل أياً منهما لا تُطلب مشروطاً مرة أخرى.
+        """
+        if not feed['conditional']:
+            return None
+        headers = {}
+        if feed['etag']:
+            headers['If-None-Match'] = feed['etag']
+        if feed['last_modified']:
+            headers['If-Modified-Since'] = feed['last_modified']
+        
+        host_scheduler.pace(feed['url'])
+        try:
+            with ydl.urlopen(Request(feed['url'], headers=headers, method="HEAD")) as response:
+                validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        except HTTPError as e:
+            if e.status == 304 and headers:
+                raise FeedUnchanged() from e
+            if e.status in (403, 429):
+                raise
+            validators = (None, None)
+        except Exception as e:
+            logger.debug(f"تعذر الطلب المشروط لـ {feed['url']}: {e}")
+            validators = (None, None)
+        
+        if validators == (None, None):
+            feed['conditional'] = 0
+            return None
+        return validators
+    
+    def _enqueue(self, feed, entries):
+        """إضافة العناصر الجديدة إلى جدول التنزيلات، الأقدم أولاً"""
+        added = 0
+        for entry in reversed(entries):
+            url = entry_url(entry)
+            if not url:
+                continue
+            previous = history_store.find(url=canonicalize(url).url, kind=feed['kind'])
+            if previous and previous.get('filename') and os.path.exists(previous['filename']):
+                continue
+            download_scheduler.submit(feed['kind'], url, feed['quality'], windowed=feed['windowed'])
+            added += 1
+        if added:
+            notification_manager.notify(f"{added} عنصر جديد في {feed['title'] or feed['url']}", "info")
+
+# إنشاء كائنات عامة
+subscription_manager = SubscriptionManager()
\ No newline at end of file
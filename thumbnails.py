@@ -0,0 +1,269 @@
+"""
+الصور المصغرة: الجلب وفك الترميز والتخزين المؤقت
+"""
+import os
+import json
+import hashlib
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image, ImageTk
+from utils import logger, ui_dispatcher
+from config import (
+    THUMBNAILS_DIR, THUMBNAIL_SIZES, THUMBNAIL_DISK_CACHE_MAX_BYTES,
+    THUMBNAIL_MEMORY_MAX_PIXELS, THUMBNAIL_WORKERS
+)
+
+class ThumbnailDiskCache:
+    """تخزين الصور المصغرة على القرص حسب بصمة المحتوى مع إخلاء الأقدم استخداماً"""
+    
+    def __init__(self, directory=THUMBNAILS_DIR, max_bytes=THUMBNAIL_DISK_CACHE_MAX_BYTES, save_delay=2.0):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.directory / "index.json"
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # اسم الملف -> الحجم، مرتبة حسب آخر استخدام
+        self.total_bytes = 0
+        self.url_index = {}  # الرابط -> بصمة المحتوى
+        self.save_delay = save_delay
+        self.save_timer = None
+        self.dirty = False
+        self._load()
+    
+    def _load(self):
+        """تحميل فهرس الروابط وترتيب الملفات حسب آخر استخدام"""
+        try:
+            if self.index_file.exists():
+                with open(self.index_file, "r", encoding="utf-8") as f:
+                    self.url_index = json.load(f)
+        except Exception as e:
+            logger.warning(f"تعذر قراءة فهرس الصور المصغرة: {e}")
+            self.url_index = {}
+        
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".jpg"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+    
+    def save(self):
+        """حفظ فهرس الروابط إن تغير (كتابة ذرية)"""
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            if not self.dirty:
+                return
+            data = json.dumps(self.url_index)
+            self.dirty = False
+        try:
+            tmp_file = self.index_file.with_suffix(".tmp")
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_file, self.index_file)
+        except Exception as e:
+            logger.warning(f"تعذر حفظ فهرس الصور المصغرة: {e}")
+    
+    @staticmethod
+    def _name(digest, size):
+        return f"{digest}_{size[0]}x{size[1]}.jpg"
+    
+    def get(self, url, size):
+        """قراءة صورة مصغرة من القرص إن وجدت"""
+        with self.lock:
+            digest = self.url_index.get(url)
+            if not digest:
+                return None
+            name = self._name(digest, size)
+            if name not in self.entries:
+                return None
+            self.entries.move_to_end(name)
+        
+        path = self.directory / name
+        try:
+            # تحديث وقت التعديل ليبقى ترتيب الاستخدام بعد إعادة التشغيل
+            os.utime(path)
+            with Image.open(path) as image:
+                image.load()
+                return image
+        except Exception:
+            with self.lock:
+                self.total_bytes -= self.entries.pop(name, 0)
+            return None
+    
+    def put(self, url, digest, size, image):
+        """حفظ صورة مصغرة وإخلاء الأقدم عند تجاوز الحد"""
+        name = self._name(digest, size)
+        path = self.directory / name
+        
+        with self.lock:
+            self.url_index[url] = digest
+            exists = name in self.entries
+        
+        if not exists:
+            try:
+                tmp_path = path.with_suffix(".part")
+                image.save(tmp_path, "JPEG", quality=85)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                logger.warning(f"تعذر حفظ الصورة المصغرة: {e}")
+                return
+        
+        with self.lock:
+            if name not in self.entries:
+                self.entries[name] = path.stat().st_size
+                self.total_bytes += self.entries[name]
+            self.entries.move_to_end(name)
+            self._evict()
+            self._mark_dirty()
+    
+    def _mark_dirty(self):
+        """تأجيل حفظ الفهرس لتجميع عدة صور في كتابة واحدة (يُستدعى مع القفل)"""
+        self.dirty = True
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(self.save_delay, self.save)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+    
+    def _evict(self):
+        """حذف الأقدم استخداماً حتى العودة تحت الحد"""
+        removed = set()
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            removed.add(name.split("_")[0])
+            try:
+                (self.directory / name).unlink()
+            except OSError:
+                pass
+        
+        if removed:
+            remaining = {name.split("_")[0] for name in self.entries}
+            orphaned = removed - remaining
+            if orphaned:
+                self.url_index = {url: digest for url, digest in self.url_index.items() if digest not in orphaned}
+
+class PhotoImageCache:
+    """ذاكرة مؤقتة لصور ImageTk محدودة بإجمالي عدد البكسلات"""
+    
+    def __init__(self, max_pixels=THUMBNAIL_MEMORY_MAX_PIXELS):
+        self.max_pixels = max_pixels
+        self.total_pixels = 0
+        self.images = OrderedDict()  # المفتاح -> (الصورة، عدد البكسلات)
+    
+    def get(self, key):
+        item = self.images.get(key)
+        if item is None:
+            return None
+        self.images.move_to_end(key)
+        return item[0]
+    
+    def put(self, key, photo, pixels):
+        if key in self.images:
+            self.total_pixels -= self.images.pop(key)[1]
+        self.images[key] = (photo, pixels)
+        self.total_pixels += pixels
+        
+        while self.total_pixels > self.max_pixels and len(self.images) > 1:
+            _, (_, old_pixels) = self.images.popitem(last=False)
+            self.total_pixels -= old_pixels
+
+class ThumbnailService:
+    """خدمة الصور المصغرة: جلب غير متزامن، فك ترميز خارج حلقة Tk، وتخزين مؤقت"""
+    
+    def __init__(self, max_workers=THUMBNAIL_WORKERS):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = "Mozilla/5.0"
+        
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbnail")
+        self.disk_cache = ThumbnailDiskCache()
+        self.memory_cache = PhotoImageCache()
+        self.pending = {}
+        self.lock = threading.Lock()
+    
+    def request(self, url, size_name, callback):
+        """طلب صورة مصغرة؛ يُستدعى callback(photo) على حلقة Tk عند الجاهزية"""
+        if not url:
+            return
+        
+        size = THUMBNAIL_SIZES.get(size_name, THUMBNAIL_SIZES["info"])
+        key = (url, size)
+        
+        photo = self.memory_cache.get(key)
+        if photo is not None:
+            callback(photo)
+            return
+        
+        # دمج الطلبات المتزامنة لنفس الصورة
+        with self.lock:
+            if key in self.pending:
+                self.pending[key].append(callback)
+                return
+            self.pending[key] = [callback]
+        
+        future = self.executor.submit(self._load, url, size)
+        future.add_done_callback(lambda f: ui_dispatcher.call(self._deliver, key, f))
+    
+    def _load(self, url, size):
+        """تحميل الصورة من القرص أو الشبكة وتصغيرها (خارج حلقة Tk)"""
+        image = self.disk_cache.get(url, size)
+        if image is not None:
+            return image
+        
+        response = self.session.get(url, timeout=10)
+        response.raise_for_status()
+        data = response.content
+        
+        image = self._decode(data, size)
+        self.disk_cache.put(url, hashlib.sha1(data).hexdigest(), size, image)
+        return image
+    
+    @staticmethod
+    def _decode(data, size):
+        """فك ترميز الصورة وتصغيرها للحجم المطلوب"""
+        image = Image.open(BytesIO(data))
+        # draft يتيح لـ JPEG فك الترميز بدقة أقل مباشرة
+        image.draft("RGB", size)
+        image = image.convert("RGB")
+        image.thumbnail(size, Image.LANCZOS)
+        return image
+    
+    def _deliver(self, key, future):
+        """إنشاء PhotoImage وتسليمه للمستدعين (على حلقة Tk)"""
+        with self.lock:
+            callbacks = self.pending.pop(key, [])
+        
+        try:
+            image = future.result()
+        except Exception as e:
+            logger.warning(f"تعذر تحميل الصورة المصغرة: {e}")
+            return
+        
+        photo = ImageTk.PhotoImage(image)
+        self.memory_cache.put(key, photo, image.width * image.height)
+        
+        for callback in callbacks:
+            try:
+                callback(photo)
+            except Exception as e:
+                logger.error(f"خطأ في عرض الصورة المصغرة: {e}")
+    
+    def shutdown(self):
+        """إيقاف خدمة الصور المصغرة"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+        self.disk_cache.save()
+
+# إنشاء كائنات عامة
+thumbnail_service = ThumbnailService()
\ No newline at end of file
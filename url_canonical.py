@@ -0,0 +1,148 @@
+"""
+توحيد الروابط: تحديد المنصة من النطاق المسجل، حذف معاملات التتبع، واستخراج معرف الفيديو
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlencode
+from config import PLATFORM_DOMAINS, TRACKING_PARAMS, TRACKING_PARAM_PREFIXES
+
+UNKNOWN_PLATFORM = "غير معروف"
+
+CanonicalURL = namedtuple("CanonicalURL", ["platform", "video_id", "url", "key"])
+
+# النطاق المسجل -> المنصة؛ البحث باللواحق (youtube.com ثم com) بعدد أجزاء النطاق
+DOMAIN_TABLE = {
+    domain: platform
+    for platform, domains in PLATFORM_DOMAINS.items()
+    for domain in domains
+}
+
+TRACKING = frozenset(TRACKING_PARAMS)
+TRACKING_PREFIXES = tuple(TRACKING_PARAM_PREFIXES)
+
+# تقسيم الرابط (RFC 3986، الملحق B) والنطاق بنمطين مترجمين مسبقاً بدلاً من urlsplit
+URL_PATTERN = re.compile(r"^([a-zA-Z][a-zA-Z0-9+.-]*)://([^/?#]*)([^?#]*)(?:\?([^#]*))?")
+NETLOC_PATTERN = re.compile(r"^(?:[^@]*@)?(\[[^\]]*\]|[^:]*)(?::(\d*))?$")
+
+_SUB = r"^(?:[\w-]+\.)*"
+_YOUTUBE_QUERY = re.compile(r"(?:^|&)v=([\w-]{11})(?:&|$)")
+_FACEBOOK_QUERY = re.compile(r"(?:^|&)v=(\d+)(?:&|$)")
+
+# لكل منصة: (نمط على "النطاق/المسار"، نمط المعرف في الاستعلام إن وجد، قالب الرابط الموحد)
+ID_PATTERNS = {
+    "YouTube": [
+        (re.compile(_SUB + r"youtube\.com/watch/?$"), _YOUTUBE_QUERY, "https://www.youtube.com/watch?v={}"),
+        (re.compile(_SUB + r"youtu\.be/([\w-]{11})(?:/|$)"), None, "https://www.youtube.com/watch?v={}"),
+        (re.compile(_SUB + r"youtube(?:-nocookie)?\.com/(?:shorts|embed|live|v|e)/([\w-]{11})(?:/|$)"), None, "https://www.youtube.com/watch?v={}"),
+    ],
+    "Facebook": [
+        (re.compile(_SUB + r"facebook\.com/(?:watch/?|video\.php)$"), _FACEBOOK_QUERY, "https://www.facebook.com/watch/?v={}"),
+        (re.compile(_SUB + r"facebook\.com/(?:[^/]+/videos/(?:[^/]+/)?|reel/)(\d+)"), None, "https://www.facebook.com/watch/?v={}"),
+    ],
+    "Instagram": [
+        (re.compile(_SUB + r"(?:instagram\.com|instagr\.am)/(?:[\w.]+/)?(?:p|reels?|tv)/([\w-]+)"), None, "https://www.instagram.com/p/{}/"),
+    ],
+    "TikTok": [
+        (re.compile(_SUB + r"tiktok\.com/@[\w.-]+/video/(\d+)"), None, None),
+        (re.compile(_SUB + r"tiktok\.com/(?:embed(?:/v2)?|v)/(\d+)"), None, None),
+    ],
+    "Twitter": [
+        (re.compile(_SUB + r"(?:twitter|x)\.com/(?:\w+|i(?:/web)?)/status(?:es)?/(\d+)"), None, "https://twitter.com/i/status/{}"),
+    ],
+    "Dailymotion": [
+        (re.compile(_SUB + r"dailymotion\.com/(?:embed/)?video/([a-z0-9]+)", re.IGNORECASE), None, "https://www.dailymotion.com/video/{}"),
+        (re.compile(_SUB + r"dai\.ly/([a-z0-9]+)", re.IGNORECASE), None, "https://www.dailymotion.com/video/{}"),
+    ],
+    "Vimeo": [
+        (re.compile(_SUB + r"vimeo\.com/(?:video/|channels/[\w-]+/|groups/[\w-]+/videos/)?(\d+)(?:/|$)"), None, "https://vimeo.com/{}"),
+    ],
+    "SoundCloud": [
+        (re.compile(_SUB + r"soundcloud\.com/([\w-]+/(?!sets/)[\w-]+)/?$"), None, "https://soundcloud.com/{}"),
+    ],
+    "Twitch": [
+        (re.compile(_SUB + r"twitch\.tv/videos/(\d+)"), None, "https://www.twitch.tv/videos/{}"),
+        (re.compile(r"^clips\.twitch\.tv/([\w-]+)/?$"), None, "https://clips.twitch.tv/{}"),
+        (re.compile(_SUB + r"twitch\.tv/\w+/clip/([\w-]+)"), None, "https://clips.twitch.tv/{}"),
+    ],
+    "Reddit": [
+        (re.compile(_SUB + r"reddit\.com/(?:r/\w+/)?comments/(\w+)"), None, "https://www.reddit.com/comments/{}"),
+        (re.compile(_SUB + r"redd\.it/(\w+)/?$"), None, "https://www.reddit.com/comments/{}"),
+    ],
+    "Tumblr": [
+        (re.compile(r"^([\w-]+)\.tumblr\.com/post/(\d+)"), None, None),
+        (re.compile(_SUB + r"tumblr\.com/([\w-]+)/(\d+)"), None, None),
+    ],
+    "Pinterest": [
+        (re.compile(_SUB + r"pinterest\.com/pin/(\d+)"), None, "https://www.pinterest.com/pin/{}/"),
+    ],
+}
+
+def platform_for_host(host):
+    """المنصة من النطاق: youtube.com و m.youtube.com تطابقان، و notyoutube.com و x.com.evil لا"""
+    index = 0
+    while True:
+        platform = DOMAIN_TABLE.get(host[index:] if index else host)
+        if platform:
+            return platform
+        index = host.find(".", index) + 1
+        if not index:
+            return UNKNOWN_PLATFORM
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def _netloc(host, scheme, port):
+    """النطاق مع المنفذ إن لم يكن المنفذ الافتراضي (دون بيانات الدخول)"""
+    if port and int(port) != DEFAULT_PORTS.get(scheme):
+        return f"{host}:{int(port)}"
+    return host
+
+def strip_tracking(query):
+    """حذف معاملات التتبع مع الإبقاء على ترتيب بقية المعاملات"""
+    if not query:
+        return ""
+    params = [
+        (name, value) for name, value in parse_qsl(query, keep_blank_values=True)
+        if name not in TRACKING and not name.startswith(TRACKING_PREFIXES)
+    ]
+    return urlencode(params)
+
+def extract_video_id(platform, host, path, query):
+    """معرف الفيديو والرابط الموحد حسب أنماط المنصة، أو (None, None)"""
+    target = f"{host}{path}"
+    for pattern, query_pattern, template in ID_PATTERNS.get(platform, ()):
+        match = pattern.match(target)
+        if match and query_pattern:
+            match = query_pattern.search(query)
+        if match:
+            video_id = "/".join(match.groups())
+            return video_id, template.format(video_id) if template else None
+    return None, None
+
+@lru_cache(maxsize=4096)
+def canonicalize(url):
+    """الشكل الموحد للرابط ومفتاح ثابت للتكرار والتخزين المؤقت
+    
+    المفتاح "المنصة:المعرف" عند معرفة معرف الفيديو، وإلا فالرابط بعد توحيده.
+    """
+    url = url.strip()
+    match = URL_PATTERN.match(url)
+    netloc = match and NETLOC_PATTERN.match(match.group(2))
+    if not netloc or not netloc.group(1):
+        return CanonicalURL(UNKNOWN_PLATFORM, None, url, url)
+    
+    scheme, _, path, query = match.groups()
+    scheme = scheme.lower()
+    host = netloc.group(1).lower().rstrip(".")
+    platform = platform_for_host(host)
+    netloc = _netloc(host, scheme, netloc.group(2))
+    query = query or ""
+    
+    if platform != UNKNOWN_PLATFORM:
+        video_id, canonical = extract_video_id(platform, host, path, query)
+        if video_id:
+            return CanonicalURL(platform, video_id, canonical or f"{scheme}://{netloc}{path}", f"{platform}:{video_id}")
+    
+    query = strip_tracking(query)
+    canonical = f"{scheme}://{netloc}{path or '/'}{'?' if query else ''}{query}"
+    return CanonicalURL(platform, None, canonical, canonical)
\ No newline at end of file
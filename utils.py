@@ -5,12 +5,14 @@ import os
 import re
 import json
 import hashlib
+import queue
 import threading
 from pathlib import Path
 from datetime import datetime
 from urllib.parse import urlparse
 import requests
 from config import CONFIG_DIR, MESSAGES
+from url_canonical import canonicalize
 
 class Logger:
     """نظام تسجيل الأحداث"""
@@ -49,7 +51,13 @@ class SettingsManager:
             "default_quality": "720p",
             "auto_convert_audio": False,
             "concurrent_downloads": 3,
-            "notification_sound": True
+            "notification_sound": True,
+            "normalize_audio": False,
+            "host_max_connections": 2,
+            "fragment_workers": 4,
+            "output_template": "{platform}/{uploader}/{title}",
+            "clipboard_monitor": False,
+            "download_windows": []
         }
         self.load_settings()
     
@@ -82,6 +90,79 @@ class SettingsManager:
         """تعديل قيمة إعداد"""
         self.settings[key] = value
         self.save_settings()
+    
+    def update(self, values):
+        """تعديل عدة إعدادات معاً بكتابة واحدة للملف"""
+        self.settings.update(values)
+        self.save_settings()
+
+class FileResultCache:
+    """ذاكرة دائمة لنتائج مرتبطة بملفات، صالحة ما دام الحجم ووقت التعديل دون تغيير"""
+    
+    def __init__(self, cache_file, save_delay=2.0):
+        self.cache_file = cache_file
+        self.save_delay = save_delay
+        self.lock = threading.RLock()
+        self.entries = {}
+        self.save_timer = None
+        self.load()
+    
+    def load(self):
+        """تحميل النتائج المحفوظة"""
+        try:
+            if self.cache_file.exists():
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+        except Exception as e:
+            logger.warning(f"تعذر قراءة الذاكرة المؤقتة {self.cache_file.name}: {e}")
+            self.entries = {}
+    
+    def save(self):
+        """حفظ النتائج (كتابة ذرية)"""
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            data = json.dumps(self.entries, ensure_ascii=False)
+        try:
+            tmp_file = self.cache_file.with_suffix(".tmp")
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            logger.warning(f"تعذر حفظ الذاكرة المؤقتة {self.cache_file.name}: {e}")
+    
+    @staticmethod
+    def file_key(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    
+    def get(self, path):
+        """النتيجة المخزنة إن كانت صالحة للملف الحالي"""
+        path = str(path)
+        try:
+            size, mtime = self.file_key(path)
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry and entry.get('size') == size and entry.get('mtime') == mtime:
+            return entry.get('result')
+        return None
+    
+    def put(self, path, result):
+        """تخزين نتيجة لملف مع تأجيل الحفظ لتجميع عدة نتائج في كتابة واحدة"""
+        path = str(path)
+        try:
+            size, mtime = self.file_key(path)
+        except OSError:
+            return
+        with self.lock:
+            self.entries[path] = {'size': size, 'mtime': mtime, 'result': result}
+            if self.save_timer is None:
+                self.save_timer = threading.Timer(self.save_delay, self.save)
+                self.save_timer.daemon = True
+                self.save_timer.start()
 
 def validate_url(url):
     """التحقق من صحة الرابط"""
@@ -93,14 +174,15 @@ def validate_url(url):
 
 def sanitize_filename(filename):
     """تنظيف اسم الملف من الأحرف غير المسموحة"""
-    # إزالة الأحرف غير المسموحة
-    filename = re.sub(r'[<>:"/\\|?*]', '', filename)
+    # إزالة الأحرف غير المسموحة وأحرف التحكم
+    filename = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '', filename)
     # تقليل الأحرف المتتالية
     filename = re.sub(r'\s+', ' ', filename).strip()
     # تحديد الطول الأقصى
     if len(filename) > 200:
         filename = filename[:200]
-    return filename
+    # Windows لا يقبل النقطة أو المسافة في نهاية الاسم
+    return filename.rstrip('. ')
 
 def format_file_size(size_bytes):
     """تنسيق حجم الملف"""
@@ -157,23 +239,11 @@ def get_video_info_from_url(url):
     if not info["valid"]:
         return info
     
-    domain = urlparse(url).netloc.lower()
-    
-    # تحديد المنصة بناء على النطاق
-    if "youtube.com" in domain or "youtu.be" in domain:
-        info["platform"] = "YouTube"
-    elif "facebook.com" in domain or "fb.watch" in domain:
-        info["platform"] = "Facebook"
-    elif "instagram.com" in domain:
-        info["platform"] = "Instagram"
-    elif "tiktok.com" in domain:
-        info["platform"] = "TikTok"
-    elif "twitter.com" in domain or "x.com" in domain:
-        info["platform"] = "Twitter"
-    elif "vimeo.com" in domain:
-        info["platform"] = "Vimeo"
-    elif "dailymotion.com" in domain:
-        info["platform"] = "Dailymotion"
+    # تحديد المنصة ومعرف الفيديو من جدول النطاقات المسجلة
+    canonical = canonicalize(url)
+    info["platform"] = canonical.platform
+    info["video_id"] = canonical.video_id
+    info["canonical_url"] = canonical.url
     
     return info
 
@@ -195,7 +265,42 @@ class NotificationManager:
             except:
                 pass
 
+class UIDispatcher:
+    """تمرير الاستدعاءات من threads العمل إلى حلقة Tk"""
+    
+    def __init__(self, interval=50):
+        self.interval = interval
+        self.calls = queue.Queue()
+        self.root = None
+    
+    def install(self, root):
+        """ربط الموزع بالنافذة الرئيسية وبدء التفريغ الدوري"""
+        self.root = root
+        self._drain()
+    
+    def call(self, func, *args):
+        """جدولة دالة للتنفيذ على حلقة Tk (آمنة من أي thread)"""
+        self.calls.put((func, args))
+    
+    def _drain(self):
+        """تنفيذ الاستدعاءات المعلقة"""
+        while True:
+            try:
+                func, args = self.calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"خطأ في استدعاء الواجهة: {e}")
+        
+        try:
+            self.root.after(self.interval, self._drain)
+        except Exception:
+            pass
+
 # إنشاء كائنات عامة
 logger = Logger()
 settings_manager = SettingsManager()
-notification_manager = NotificationManager()
\ No newline at end of file
+notification_manager = NotificationManager()
+ui_dispatcher = UIDispatcher()
\ No newline at end of file
@@ -0,0 +1,217 @@
+"""
+حساب الموجة الصوتية ومستويات الذروة مسبقاً للمشغل
+"""
+import os
+import struct
+import hashlib
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from utils import logger
+from config import WAVEFORMS_DIR, WAVEFORM_SAMPLE_RATE, WAVEFORM_BASE_BLOCK, WAVEFORM_MIN_BLOCKS
+
+# رأس الملف: المعرف، الإصدار، معدل العينات، حجم الكتلة الأساسية، عدد المستويات
+HEADER = struct.Struct("<4sHIIH")
+LEVEL_ENTRY = struct.Struct("<QQ")  # الإزاحة، عدد الكتل
+MAGIC = b"SNPK"
+VERSION = 1
+
+def _reduce_pairs(level):
+    """دمج كل كتلتين متجاورتين: أدنى الأدنى، أعلى الأعلى، وجذر متوسط المربعات"""
+    if len(level) % 2:
+        level = np.concatenate([level, level[-1:]])
+    pairs = level.reshape(-1, 2, 3).astype(np.float32)
+    reduced = np.empty((len(pairs), 3), dtype=np.int16)
+    reduced[:, 0] = pairs[:, :, 0].min(axis=1)
+    reduced[:, 1] = pairs[:, :, 1].max(axis=1)
+    reduced[:, 2] = np.sqrt((pairs[:, :, 2] ** 2).mean(axis=1))
+    return reduced
+
+class WaveformIndex:
+    """فهرس ذروات متعدد الدقة مقروء من ملف جانبي عبر memmap"""
+    
+    def __init__(self, path, sample_rate, base_block, levels):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.base_block = base_block
+        self.levels = levels  # قائمة مصفوفات (عدد الكتل، 3) من int16
+    
+    @property
+    def duration(self):
+        return len(self.levels[0]) * self.base_block / self.sample_rate if self.levels else 0
+    
+    @classmethod
+    def open(cls, sidecar_path):
+        """فتح ملف جانبي دون قراءته بالكامل"""
+        with open(sidecar_path, "rb") as f:
+            magic, version, sample_rate, base_block, level_count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("ملف موجة غير صالح")
+            entries = [LEVEL_ENTRY.unpack(f.read(LEVEL_ENTRY.size)) for _ in range(level_count)]
+        
+        levels = [
+            np.memmap(sidecar_path, dtype=np.int16, mode="r", offset=offset, shape=(count, 3))
+            for offset, count in entries if count
+        ]
+        return cls(sidecar_path, sample_rate, base_block, levels)
+    
+    @staticmethod
+    def write(sidecar_path, sample_rate, base_block, levels):
+        """كتابة المستويات في ملف جانبي ثنائي (كتابة ذرية)"""
+        offset = HEADER.size + LEVEL_ENTRY.size * len(levels)
+        entries = []
+        for level in levels:
+            entries.append((offset, len(level)))
+            offset += level.nbytes
+        
+        tmp_path = f"{sidecar_path}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, sample_rate, base_block, len(levels)))
+            for entry in entries:
+                f.write(LEVEL_ENTRY.pack(*entry))
+            for level in levels:
+                f.write(np.ascontiguousarray(level, dtype=np.int16).tobytes())
+        os.replace(tmp_path, sidecar_path)
+    
+    def render(self, start, end, width):
+        """قيم (أدنى، أعلى، RMS) لكل بكسل بين زمنين، من أنسب مستوى دقة"""
+        if not self.levels or width <= 0 or end <= start:
+            return None
+        
+        samples_per_pixel = (end - start) * self.sample_rate / width
+        level_index = 0
+        while (level_index + 1 < len(self.levels)
+               and self.base_block * 2 ** (level_index + 1) <= samples_per_pixel):
+            level_index += 1
+        
+        level = self.levels[level_index]
+        block_seconds = self.base_block * 2 ** level_index / self.sample_rate
+        first = max(0, int(start / block_seconds))
+        last = min(len(level), int(np.ceil(end / block_seconds)))
+        if last <= first:
+            return None
+        
+        blocks = np.asarray(level[first:last], dtype=np.float32)
+        edges = np.linspace(0, len(blocks), width + 1).astype(np.int64)[:-1]
+        edges = np.unique(np.minimum(edges, len(blocks) - 1))
+        counts = np.diff(np.append(edges, len(blocks)))
+        
+        mins = np.minimum.reduceat(blocks[:, 0], edges)
+        maxs = np.maximum.reduceat(blocks[:, 1], edges)
+        rms = np.sqrt(np.add.reduceat(blocks[:, 2] ** 2, edges) / counts)
+        return mins / 32768.0, maxs / 32768.0, rms / 32768.0
+
+class WaveformService:
+    """بناء فهارس الموجة في الخلفية مرة واحدة لكل ملف"""
+    
+    def __init__(self):
+        WAVEFORMS_DIR.mkdir(parents=True, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="waveform")
+        self.lock = threading.Lock()
+        self.inflight = {}
+    
+    @staticmethod
+    def sidecar_path(path):
+        """مسار الملف الجانبي حسب المسار والحجم ووقت التعديل"""
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        return WAVEFORMS_DIR / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.peaks"
+    
+    def load(self, path):
+        """فتح الفهرس إن كان محسوباً مسبقاً"""
+        try:
+            sidecar = self.sidecar_path(path)
+            if sidecar.exists():
+                return WaveformIndex.open(sidecar)
+        except Exception as e:
+            logger.warning(f"تعذر فتح ملف الموجة: {e}")
+        return None
+    
+    def request(self, path, callback):
+        """الحصول على الفهرس؛ يُحسب في الخلفية إن لم يكن موجوداً"""
+        path = str(path)
+        index = self.load(path)
+        if index is not None:
+            callback(path, index)
+            return
+        
+        with self.lock:
+            future = self.inflight.get(path)
+            if future is None:
+                future = self.executor.submit(self.build, path)
+                self.inflight[path] = future
+        
+        def deliver(f):
+            with self.lock:
+                self.inflight.pop(path, None)
+            try:
+                result = f.result()
+            except Exception as e:
+                logger.error(f"خطأ في حساب الموجة: {e}")
+                return
+            if result is not None:
+                callback(path, result)
+        
+        future.add_done_callback(deliver)
+    
+    def build(self, path):
+        """فك ترميز الملف مرة واحدة وحساب الذروات على دفعات متجهة"""
+        sidecar = self.sidecar_path(path)
+        block = WAVEFORM_BASE_BLOCK
+        chunk_samples = block * 4096
+        
+        process = subprocess.Popen(
+            ["ffmpeg", "-nostdin", "-v", "error", "-i", str(path), "-vn",
+             "-ac", "1", "-ar", str(WAVEFORM_SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        
+        parts = []
+        remainder = np.empty(0, dtype=np.int16)
+        try:
+            while True:
+                data = process.stdout.read(chunk_samples * 2)
+                if not data:
+                    break
+                samples = np.frombuffer(data[:len(data) - len(data) % 2], dtype=np.int16)
+                if len(remainder):
+                    samples = np.concatenate([remainder, samples])
+                usable = len(samples) - len(samples) % block
+                remainder = samples[usable:].copy()
+                if usable:
+                    parts.append(self._summarize(samples[:usable].reshape(-1, block)))
+        finally:
+            process.stdout.close()
+            process.wait()
+        
+        if len(remainder):
+            padded = np.zeros(block, dtype=np.int16)
+            padded[:len(remainder)] = remainder
+            parts.append(self._summarize(padded.reshape(1, block)))
+        
+        if not parts:
+            return None
+        
+        levels = [np.concatenate(parts)]
+        while len(levels[-1]) > WAVEFORM_MIN_BLOCKS:
+            levels.append(_reduce_pairs(levels[-1]))
+        
+        WaveformIndex.write(sidecar, WAVEFORM_SAMPLE_RATE, block, levels)
+        return WaveformIndex.open(sidecar)
+    
+    @staticmethod
+    def _summarize(blocks):
+        """أدنى وأعلى و RMS لكل كتلة"""
+        summary = np.empty((len(blocks), 3), dtype=np.int16)
+        summary[:, 0] = blocks.min(axis=1)
+        summary[:, 1] = blocks.max(axis=1)
+        squares = blocks.astype(np.float32) ** 2
+        summary[:, 2] = np.minimum(np.sqrt(squares.mean(axis=1)), 32767)
+        return summary
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+# إنشاء كائنات عامة
+waveform_service = WaveformService()
\ No newline at end of file
@@ -0,0 +1,249 @@
+"""
+عمليات عمال منفصلة للمعالجة اللاحقة الثقيلة (ffmpeg، moviepy، قياس الجهارة)
+"""
+import time
+import queue
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import Future
+from utils import logger
+from config import POSTPROCESS_WORKERS, POSTPROCESS_MEMORY_LIMIT, POSTPROCESS_PROGRESS_INTERVAL
+
+class WorkerCrashed(RuntimeError):
+    """توقف عملية العامل أثناء تنفيذ مهمة"""
+
+# ---- داخل عملية العامل ----
+
+def _limit_memory(limit):
+    """حد أقصى لذاكرة العامل (وعمليات ffmpeg التابعة له) على الأنظمة التي تدعمه"""
+    if not limit:
+        return
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def _task_ffmpeg(report, args, duration=0):
+    """تشغيل ffmpeg مع قراءة التقدم من -progress"""
+    command = ["ffmpeg", "-nostdin", "-v", "error", "-progress", "pipe:1", "-nostats", "-y", *args]
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors)
+        for line in process.stdout:
+            key, _, value = line.decode("utf-8", "ignore").strip().partition("=")
+            if key == "out_time_us" and duration and value.isdigit():
+                report(min(int(value) / 1e6 / duration, 1.0))
+        process.wait()
+        if process.returncode != 0:
+            errors.seek(0)
+            message = errors.read().decode("utf-8", "ignore").strip()
+            raise RuntimeError(message or f"ffmpeg exited with code {process.returncode}")
+    return True
+
+def _task_loudness(report, path, channels):
+    """قياس الجهارة المتكاملة"""
+    from loudness import measure_loudness
+    return measure_loudness(path, channels)
+
+def _task_moviepy_audio(report, video_path, output_path, bitrate):
+    """تحويل فيديو إلى صوت باستخدام moviepy"""
+    from moviepy.video.io.VideoFileClip import VideoFileClip
+    from proglog import ProgressBarLogger
+    
+    class ProgressLogger(ProgressBarLogger):
+        def bars_callback(self, bar, attr, value, old_value=None):
+            total = self.bars[bar].get('total')
+            if attr == 'index' and total:
+                report(value / total)
+    
+    video = VideoFileClip(video_path)
+    try:
+        video.audio.write_audiofile(output_path, bitrate=bitrate, verbose=False, logger=ProgressLogger())
+    finally:
+        video.close()
+    return True
+
+TASKS = {
+    'ffmpeg': _task_ffmpeg,
+    'loudness': _task_loudness,
+    'moviepy_audio': _task_moviepy_audio,
+}
+
+def _worker_main(worker_id, jobs, results, memory_limit):
+    """حلقة العامل: (معرف المهمة، النوع، المعاملات) ← progress/done/error"""
+    _limit_memory(memory_limit)
+    
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, kind, args = job
+        last_report = [0.0]
+        
+        def report(fraction):
+            now = time.monotonic()
+            if now - last_report[0] >= POSTPROCESS_PROGRESS_INTERVAL:
+                last_report[0] = now
+                results.put((worker_id, job_id, 'progress', fraction))
+        
+        try:
+            results.put((worker_id, job_id, 'done', TASKS[kind](report, *args)))
+        except MemoryError:
+            results.put((worker_id, job_id, 'error', "نفدت الذاكرة المخصصة لعامل المعالجة"))
+        except Exception as e:
+            results.put((worker_id, job_id, 'error', str(e)))
+
+# ---- داخل عملية التطبيق ----
+
+class WorkerHandle:
+    """عملية عامل وطابور مهامها"""
+    
+    def __init__(self, context, worker_id, results, memory_limit):
+        self.worker_id = worker_id
+        self.jobs = context.Queue()
+        self.job_id = None
+        self.process = context.Process(
+            target=_worker_main,
+            args=(worker_id, self.jobs, results, memory_limit),
+            name=f"postprocess-{worker_id}",
+            daemon=True
+        )
+        self.process.start()
+
+class PostProcessPool:
+    """مجموعة عمليات للمعالجة الثقيلة؛ عدد المهام النشطة لا يتجاوز عدد العمال"""
+    
+    def __init__(self, max_workers=POSTPROCESS_WORKERS, memory_limit=POSTPROCESS_MEMORY_LIMIT):
+        self.max_workers = max_workers
+        self.memory_limit = memory_limit
+        self.slots = threading.BoundedSemaphore(max_workers)
+        self.lock = threading.Lock()
+        self.workers = {}
+        self.jobs = {}  # معرف المهمة -> (Future، دالة التقدم، العامل)
+        self.next_job_id = 0
+        self.next_worker_id = 0
+        self.context = None
+        self.results = None
+        self.monitor = None
+        self.closed = False
+    
+    def _start(self):
+        """تشغيل طابور النتائج والمراقب عند أول مهمة"""
+        if self.context is not None:
+            return
+        self.context = multiprocessing.get_context("spawn")
+        self.results = self.context.Queue()
+        self.monitor = threading.Thread(target=self._monitor, name="postprocess-monitor", daemon=True)
+        self.monitor.start()
+    
+    def _idle_worker(self):
+        for handle in self.workers.values():
+            if handle.job_id is None:
+                return handle
+        # لا يوجد عامل متاح: تشغيل عامل جديد (أو بديل لعامل توقف)
+        handle = WorkerHandle(self.context, self.next_worker_id, self.results, self.memory_limit)
+        self.workers[handle.worker_id] = handle
+        self.next_worker_id += 1
+        return handle
+    
+    def submit(self, kind, *args, progress_callback=None):
+        """إرسال مهمة؛ ينتظر إن كانت كل العمال مشغولة (ضغط عكسي)"""
+        self.slots.acquire()
+        with self.lock:
+            if self.closed:
+                self.slots.release()
+                raise RuntimeError("تم إيقاف عمال المعالجة")
+            self._start()
+            handle = self._idle_worker()
+            job_id = self.next_job_id
+            self.next_job_id += 1
+            future = Future()
+            handle.job_id = job_id
+            self.jobs[job_id] = (future, progress_callback, handle)
+            handle.jobs.put((job_id, kind, args))
+        return future
+    
+    def run(self, kind, *args, progress_callback=None):
+        """تنفيذ مهمة وانتظار نتيجتها"""
+        return self.submit(kind, *args, progress_callback=progress_callback).result()
+    
+    def _monitor(self):
+        """توزيع رسائل العمال واكتشاف العمال المتوقفين"""
+        last_check = time.monotonic()
+        while not self.closed:
+            if time.monotonic() - last_check >= 0.5:
+                self._check_workers()
+                last_check = time.monotonic()
+            
+            try:
+                worker_id, job_id, status, value = self.results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            
+            if status == 'progress':
+                entry = self.jobs.get(job_id)
+                if entry and entry[1]:
+                    try:
+                        entry[1](value)
+                    except Exception as e:
+                        logger.error(f"خطأ في تحديث التقدم: {e}")
+                continue
+            
+            with self.lock:
+                entry = self.jobs.pop(job_id, None)
+                if entry:
+                    entry[2].job_id = None
+            if entry is None:
+                continue
+            
+            self.slots.release()
+            if status == 'done':
+                entry[0].set_result(value)
+            else:
+                entry[0].set_exception(RuntimeError(value))
+    
+    def _check_workers(self):
+        """إزالة العمال المتوقفين وإفشال مهامهم؛ يحل محلهم عامل جديد عند الحاجة"""
+        crashed = []
+        with self.lock:
+            for worker_id, handle in list(self.workers.items()):
+                if handle.process.is_alive():
+                    continue
+                del self.workers[worker_id]
+                logger.error(f"توقف عامل المعالجة {worker_id} (رمز الخروج {handle.process.exitcode})")
+                if handle.job_id is not None:
+                    entry = self.jobs.pop(handle.job_id, None)
+                    if entry:
+                        crashed.append((entry[0], handle.process.exitcode))
+        
+        for future, exitcode in crashed:
+            self.slots.release()
+            future.set_exception(WorkerCrashed(f"توقف عامل المعالجة أثناء المهمة (رمز الخروج {exitcode})"))
+    
+    def shutdown(self):
+        """إيقاف العمال وإفشال المهام المعلقة"""
+        with self.lock:
+            self.closed = True
+            workers = list(self.workers.values())
+            pending = [entry[0] for entry in self.jobs.values()]
+            self.workers.clear()
+            self.jobs.clear()
+        
+        for handle in workers:
+            try:
+                handle.jobs.put(None)
+            except (OSError, ValueError):
+                pass
+        for handle in workers:
+            handle.process.join(timeout=1)
+            if handle.process.is_alive():
+                handle.process.terminate()
+        for future in pending:
+            future.set_exception(RuntimeError("تم إيقاف عمال المعالجة"))
+
+# إنشاء كائنات عامة
+postprocess_pool = PostProcessPool()
\ No newline at end of file